@@ -0,0 +1,295 @@
+import threading
+import time
+import numpy as np
+import pyaudio
+from resample import Resampler, downmix
+
+# ค่าเริ่มต้นของการจับเสียง
+CHUNK = 1024
+FORMAT = pyaudio.paInt16
+CHANNELS = 1
+BUFFER_SECONDS = 30  # ความยาวของ ring buffer (วินาที)
+PREROLL_SECONDS = 0.5  # เสียงก่อนเริ่มประโยคที่เก็บไว้ไม่ให้พยางค์แรกหาย
+
+
+class RingBuffer:
+    """บัฟเฟอร์วงแหวนแบบจองหน่วยความจำล่วงหน้า สำหรับผู้เขียน 1 ราย และผู้อ่าน 1 ราย (ไม่ใช้ lock)"""
+    def __init__(self, capacity, dtype=np.int16):
+        self.capacity = int(capacity)
+        self.buffer = np.zeros(self.capacity, dtype=dtype)
+        # ตำแหน่งสะสมแบบไม่วนกลับ ผู้เขียนแก้ได้เฉพาะ write_pos ผู้อ่านแก้ได้เฉพาะ read_pos
+        self.write_pos = 0
+        self.read_pos = 0
+        self.overruns = 0
+        self.dropped_samples = 0
+
+    def write(self, samples):
+        """เขียนข้อมูลลงบัฟเฟอร์ (เรียกจาก callback ของ PortAudio เท่านั้น)"""
+        n = len(samples)
+        if n == 0:
+            return
+        if n > self.capacity:
+            samples = samples[-self.capacity:]
+            self.write_pos += n - self.capacity
+            n = self.capacity
+
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        if first < n:
+            self.buffer[:n - first] = samples[first:]
+
+        # ประกาศข้อมูลใหม่หลังคัดลอกเสร็จแล้วเท่านั้น
+        self.write_pos += n
+
+    def available(self):
+        """จำนวน sample ที่ยังไม่ได้อ่าน"""
+        return self.write_pos - self.read_pos
+
+    def read(self, n, out=None):
+        """อ่านข้อมูลสูงสุด n sample ออกมาเป็นสำเนา (หรือลงใน out) ถ้าผู้อ่านช้าจนข้อมูลถูกเขียนทับจะนับเป็น overrun"""
+        write_pos = self.write_pos
+        self._skip_overwritten(write_pos)
+
+        start_pos = self.read_pos
+        n = min(n, write_pos - start_pos)
+        if out is None:
+            out = np.empty(n, dtype=self.buffer.dtype)
+        out = out[:n]
+        if n == 0:
+            return out
+
+        start = start_pos % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        if first < n:
+            out[first:] = self.buffer[:n - first]
+
+        # ตรวจสอบอีกครั้งว่าระหว่างคัดลอก ผู้เขียนไม่ได้เขียนทับส่วนต้นของข้อมูลที่อ่าน
+        overwritten = (self.write_pos - self.capacity) - start_pos
+        if overwritten > 0:
+            overwritten = min(overwritten, n)
+            self.overruns += 1
+            self.dropped_samples += overwritten
+            # เลื่อนข้อมูลที่ยังใช้ได้ไปไว้ต้นบัฟเฟอร์ เพื่อให้ out ที่ผู้เรียกส่งมายังต่อเนื่อง
+            out[:n - overwritten] = out[overwritten:].copy()
+            out = out[:n - overwritten]
+
+        self.read_pos = start_pos + n
+        return out
+
+    def rewind(self, n):
+        """ถอยตำแหน่งอ่านกลับไปให้ครอบคลุม n sample ล่าสุด (ไม่ย้อนไปยังข้อมูลที่อ่านแล้ว)"""
+        write_pos = self.write_pos
+        self.read_pos = max(self.read_pos, write_pos - n, write_pos - self.capacity)
+
+    def _skip_overwritten(self, write_pos):
+        """ข้ามข้อมูลที่ถูกเขียนทับไปแล้ว"""
+        lag = write_pos - self.read_pos
+        if lag > self.capacity:
+            self.overruns += 1
+            self.dropped_samples += lag - self.capacity
+            self.read_pos = write_pos - self.capacity
+
+
+class CaptureEngine:
+    """จับเสียงด้วย callback mode ของ PyAudio เขียนลง RingBuffer ให้ผู้ใช้ข้อมูลอ่านตามจังหวะของตัวเอง
+
+    ถ้าระบุ target_rate เสียงจะถูกรวมเป็น mono และแปลงเป็น target_rate ก่อนเขียนลงบัฟเฟอร์
+    (rate/channels คือรูปแบบที่ผู้อ่านได้รับ ส่วน device_rate/device_channels คือรูปแบบที่อุปกรณ์จับเสียงจริง)
+    """
+    def __init__(self, p, rate, device_index=None, channels=CHANNELS, chunk=CHUNK,
+                 buffer_seconds=BUFFER_SECONDS, target_rate=None):
+        self.p = p
+        self.device_rate = int(rate)
+        self.device_channels = channels
+        self.device_index = device_index
+        self.chunk = chunk
+        self.target_rate = target_rate
+        self.resampler = None
+        if target_rate and (int(target_rate) != self.device_rate or channels != 1):
+            self.resampler = Resampler(self.device_rate, target_rate)
+            self.rate, self.channels = int(target_rate), 1
+        else:
+            self.rate, self.channels = self.device_rate, channels
+        self.ring = RingBuffer(int(self.rate * buffer_seconds) * self.channels)
+        self.stream = None
+        self.input_overflows = 0  # จำนวนครั้งที่ PortAudio แจ้งว่าข้อมูลล้นก่อนถึง callback
+        self._data_ready = threading.Event()
+
+    def start(self):
+        """เปิดสตรีมและเริ่มจับเสียง"""
+        if self.stream is None:
+            self.stream = self.p.open(format=FORMAT,
+                                      channels=self.device_channels,
+                                      rate=self.device_rate,
+                                      input=True,
+                                      input_device_index=self.device_index,
+                                      frames_per_buffer=self.chunk,
+                                      stream_callback=self._callback)
+        if not self.stream.is_active():
+            self.stream.start_stream()
+        return self
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        """callback ของ PortAudio ต้องทำงานให้เร็วที่สุด ห้ามเรียก I/O ที่นี่"""
+        if status & pyaudio.paInputOverflow:
+            self.input_overflows += 1
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        if self.resampler is not None:
+            samples = self.resampler.process(downmix(samples, self.device_channels))
+        self.ring.write(samples)
+        self._data_ready.set()
+        return (None, pyaudio.paContinue)
+
+    def read(self, frames=None, timeout=1.0, out=None):
+        """อ่านเสียง frames เฟรม คืนค่า numpy int16 หรือ None ถ้าไม่มีข้อมูลพอภายในเวลาที่กำหนด
+
+        ถ้าระบุ out ข้อมูลจะถูกคัดลอกลงใน out โดยตรง (ไม่จองหน่วยความจำใหม่)
+        """
+        frames = frames or self.chunk
+        needed = frames * self.channels
+        deadline = time.monotonic() + timeout if timeout else None
+
+        while self.ring.available() < needed:
+            if deadline is None:
+                return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self._data_ready.clear()
+            # ตรวจซ้ำหลัง clear เพื่อไม่พลาดสัญญาณจาก callback
+            if self.ring.available() >= needed:
+                break
+            self._data_ready.wait(remaining)
+
+        return self.ring.read(needed, out=out)
+
+    def drain(self):
+        """ทิ้งข้อมูลที่ค้างอยู่ทั้งหมด"""
+        self.ring.read_pos = self.ring.write_pos
+
+    def stats(self):
+        """สถิติของการจับเสียง"""
+        return {
+            'overruns': self.ring.overruns,
+            'dropped_samples': self.ring.dropped_samples,
+            'dropped_seconds': self.ring.dropped_samples / self.channels / self.rate,
+            'input_overflows': self.input_overflows,
+            'buffered_samples': self.ring.available(),
+        }
+
+    def reset_stats(self):
+        """เริ่มนับสถิติใหม่ (เช่น เมื่อเริ่มประโยคใหม่)"""
+        self.ring.overruns = 0
+        self.ring.dropped_samples = 0
+        self.input_overflows = 0
+
+    def stop(self):
+        """หยุดสตรีมชั่วคราว (ยังไม่ปิด)"""
+        if self.stream is not None and self.stream.is_active():
+            self.stream.stop_stream()
+
+    def close(self):
+        """หยุดและปิดสตรีม"""
+        if self.stream is not None:
+            try:
+                self.stream.stop_stream()
+                self.stream.close()
+            except Exception:
+                pass
+            self.stream = None
+
+
+class AudioSession:
+    """เซสชันเสียงระยะยาว เปิด PyAudio ครั้งเดียวและเก็บสตรีมอินพุตไว้ใช้ซ้ำระหว่างประโยค"""
+    def __init__(self, preroll_seconds=PREROLL_SECONDS):
+        self.p = pyaudio.PyAudio()
+        self.engine = None
+        self.preroll_seconds = preroll_seconds
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def input_devices(self):
+        """รายการอุปกรณ์อินพุตทั้งหมดเป็น (index, device_info)"""
+        devices = []
+        for i in range(self.p.get_device_count()):
+            dev_info = self.p.get_device_info_by_index(i)
+            if dev_info['maxInputChannels'] > 0:
+                devices.append((i, dev_info))
+        return devices
+
+    def native_rate(self, device_index=None):
+        """อัตราสุ่มตัวอย่างที่อุปกรณ์ทำงานได้ดีที่สุด (ค่าเริ่มต้นของอุปกรณ์ ไม่ต้องให้ระบบแปลงอัตราให้)"""
+        if device_index is None:
+            dev_info = self.p.get_default_input_device_info()
+        else:
+            dev_info = self.p.get_device_info_by_index(device_index)
+        return int(dev_info['defaultSampleRate'])
+
+    def open(self, rate, device_index=None, channels=CHANNELS, chunk=CHUNK, target_rate=None):
+        """เปิดสตรีมอินพุตที่อัตรา rate ของอุปกรณ์ (แปลงเป็น target_rate ถ้าระบุ) ถ้าสตรีมเดิมตั้งค่าตรงกันอยู่แล้วจะใช้สตรีมเดิมต่อ"""
+        engine = self.engine
+        if (engine is not None and engine.stream is not None and engine.device_rate == int(rate)
+                and engine.device_index == device_index and engine.device_channels == channels
+                and engine.chunk == chunk and engine.target_rate == target_rate):
+            return engine.start()
+
+        self.close_stream()
+        self.engine = CaptureEngine(self.p, rate, device_index, channels=channels, chunk=chunk,
+                                    target_rate=target_rate)
+        try:
+            return self.engine.start()
+        except Exception:
+            self.engine = None
+            raise
+
+    def test_stream(self, rate, device_index=None, timeout=1.0, target_rate=None):
+        """เปิดสตรีมและรอจนได้รับเสียงชุดแรก สตรีมจะเปิดค้างไว้ให้ใช้ต่อทันที"""
+        engine = self.open(rate, device_index, target_rate=target_rate)
+        deadline = time.monotonic() + timeout
+        while engine.ring.write_pos == 0:
+            if time.monotonic() > deadline:
+                raise IOError("No audio received from input device")
+            time.sleep(0.01)
+        return engine
+
+    def begin_utterance(self):
+        """เริ่มประโยคใหม่ อ่านย้อนไปรวมเสียง pre-roll และเริ่มนับสถิติใหม่"""
+        engine = self.engine
+        engine.ring.rewind(int(self.preroll_seconds * engine.rate) * engine.channels)
+        engine.reset_stats()
+        return engine
+
+    def read(self, frames=None, timeout=1.0, out=None):
+        """อ่านเสียงจากสตรีมที่เปิดอยู่"""
+        return self.engine.read(frames, timeout=timeout, out=out)
+
+    def close_stream(self):
+        """ปิดเฉพาะสตรีม (ยังคง PyAudio ไว้)"""
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+
+    def close(self):
+        """ปิดสตรีมและคืนทรัพยากรของ PortAudio"""
+        self.close_stream()
+        if self.p is not None:
+            try:
+                self.p.terminate()
+            except Exception:
+                pass
+            self.p = None
+
+
+def format_overrun_report(stats):
+    """ข้อความสรุปเมื่อมีเสียงหายระหว่างจับเสียง คืนค่า None ถ้าไม่มีปัญหา"""
+    if not stats['overruns'] and not stats['input_overflows']:
+        return None
+    return (f"Audio overrun: {stats['overruns']} buffer overruns, "
+            f"{stats['input_overflows']} device overflows, "
+            f"{stats['dropped_seconds']:.2f} s of audio dropped")
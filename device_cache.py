@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import tempfile
+
+# ไฟล์เก็บความสามารถของอุปกรณ์ที่ตรวจแล้ว (ใช้ซ้ำข้ามการเปิดโปรแกรม)
+CACHE_PATH = os.environ.get('AUDIO_DEVICE_CACHE',
+                            os.path.join(os.path.expanduser('~'), '.cache', 'audio2textpy', 'devices.json'))
+PROBE_RATES = [8000, 11025, 16000, 22050, 32000, 44100, 48000]
+
+
+def host_api_name(p, dev_info):
+    """ชื่อ host API ของอุปกรณ์ (เช่น ALSA, WASAPI, Core Audio)"""
+    try:
+        return p.get_host_api_info_by_index(dev_info['hostApi'])['name']
+    except Exception:
+        return str(dev_info.get('hostApi', ''))
+
+
+def device_key(p, dev_info):
+    """คีย์ของอุปกรณ์ในแคช (host API + ชื่อ) ไม่ใช้ index เพราะเปลี่ยนได้เมื่อเสียบ/ถอดอุปกรณ์"""
+    return f"{host_api_name(p, dev_info)}:{dev_info['name']}"
+
+
+def device_fingerprint(p):
+    """ลายนิ้วมือของชุดอุปกรณ์อินพุตทั้งหมด ถ้าเปลี่ยนไปแคชจะถูกล้าง"""
+    entries = []
+    for i in range(p.get_device_count()):
+        try:
+            dev_info = p.get_device_info_by_index(i)
+        except Exception:
+            continue
+        if dev_info['maxInputChannels'] > 0:
+            entries.append(f"{device_key(p, dev_info)}|{dev_info['maxInputChannels']}|{int(dev_info['defaultSampleRate'])}")
+    return hashlib.sha1("\n".join(sorted(entries)).encode('utf-8')).hexdigest()
+
+
+def probe_rates(p, device_index, rates=PROBE_RATES, channels=1, sample_format=None):
+    """ตรวจอัตราที่อุปกรณ์รองรับด้วย is_format_supported (ไม่ต้องเปิดสตรีมจริง)"""
+    supported = []
+    for rate in rates:
+        try:
+            kwargs = {'input_device': device_index, 'input_channels': channels}
+            if sample_format is not None:
+                kwargs['input_format'] = sample_format
+            if p.is_format_supported(rate, **kwargs):
+                supported.append(rate)
+        except ValueError:
+            pass
+    return supported
+
+
+class DeviceCache:
+    """แคชความสามารถของอุปกรณ์ (อัตราที่รองรับ และค่าที่เปิดสตรีมได้สำเร็จล่าสุด) บันทึกเป็นไฟล์ JSON"""
+    def __init__(self, p, path=CACHE_PATH):
+        self.p = p
+        self.path = path
+        self.fingerprint = device_fingerprint(p)
+        self.devices = {}
+        self.load()
+
+    def load(self):
+        """โหลดแคชจากไฟล์ ถ้าชุดอุปกรณ์เปลี่ยนไปหรือไฟล์เสียจะเริ่มใหม่"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('fingerprint') == self.fingerprint:
+            self.devices = data.get('devices', {})
+
+    def save(self):
+        """บันทึกแคชลงไฟล์ (เขียนไฟล์ชั่วคราวแล้วแทนที่ เพื่อไม่ให้ไฟล์เสียถ้าโปรแกรมถูกปิดกลางคัน)"""
+        try:
+            directory = os.path.dirname(self.path) or '.'
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False, encoding='utf-8') as f:
+                json.dump({'fingerprint': self.fingerprint, 'devices': self.devices}, f, indent=2)
+            os.replace(f.name, self.path)
+        except OSError:
+            pass
+
+    def key(self, device_index=None):
+        """คีย์ของอุปกรณ์ตาม index (None = อุปกรณ์เริ่มต้น)"""
+        if device_index is None:
+            dev_info = self.p.get_default_input_device_info()
+        else:
+            dev_info = self.p.get_device_info_by_index(device_index)
+        return device_key(self.p, dev_info)
+
+    def supported_rates(self, device_index=None, refresh=False, **probe_kwargs):
+        """อัตราที่อุปกรณ์รองรับ คืนค่า (rates, from_cache) ตรวจใหม่เฉพาะเมื่อไม่มีในแคชหรือ refresh"""
+        key = self.key(device_index)
+        entry = self.devices.get(key, {})
+        if not refresh and entry.get('supported_rates'):
+            return entry['supported_rates'], True
+
+        rates = probe_rates(self.p, device_index, **probe_kwargs)
+        entry['supported_rates'] = rates
+        self.devices[key] = entry
+        self.save()
+        return rates, False
+
+    def known_good(self, device_index=None):
+        """ค่าที่เปิดสตรีมได้สำเร็จล่าสุด (dict ที่มี rate, channels, chunk) หรือ None"""
+        return self.devices.get(self.key(device_index), {}).get('known_good')
+
+    def remember(self, device_index=None, **config):
+        """บันทึกค่าที่เปิดสตรีมได้สำเร็จ"""
+        key = self.key(device_index)
+        entry = self.devices.setdefault(key, {})
+        if entry.get('known_good') != config:
+            entry['known_good'] = config
+            self.save()
+
+    def invalidate(self, device_index=None):
+        """ลบข้อมูลของอุปกรณ์เมื่อเปิดสตรีมไม่สำเร็จ ให้ตรวจใหม่ครั้งถัดไป"""
+        if self.devices.pop(self.key(device_index), None) is not None:
+            self.save()
@@ -0,0 +1,95 @@
+import time
+from collections import deque
+import numpy as np
+
+# ค่าตั้งต้นของแต่ละโหมด (หน่วยวินาที)
+#   default_pause: ช่วงเงียบที่ใช้ตัดสินจบประโยคเมื่อยังไม่มีประวัติการหยุดของผู้พูด
+#   min_pause/max_pause: ขอบเขตของเกณฑ์ที่ปรับตามผู้พูด
+#   percentile/factor: เกณฑ์ = เปอร์เซ็นไทล์ของช่วงหยุดระหว่างคำ x factor
+ENDPOINT_PRESETS = {
+    'interactive': {'default_pause': 0.6, 'min_pause': 0.3, 'max_pause': 0.9, 'percentile': 75, 'factor': 1.3},
+    'balanced': {'default_pause': 0.9, 'min_pause': 0.5, 'max_pause': 1.4, 'percentile': 85, 'factor': 1.5},
+    'dictation': {'default_pause': 1.5, 'min_pause': 0.9, 'max_pause': 2.5, 'percentile': 95, 'factor': 1.8},
+}
+DEFAULT_PRESET = 'balanced'
+PAUSE_HISTORY = 50  # จำนวนช่วงหยุดล่าสุดของผู้พูดที่ใช้คำนวณ
+MIN_HISTORY = 5  # ต้องมีประวัติอย่างน้อยเท่านี้จึงเริ่มปรับเกณฑ์ตามผู้พูด
+MIN_INTERNAL_PAUSE = 0.08  # ช่วงหยุดที่สั้นกว่านี้ไม่นับเป็นการหยุดระหว่างคำ
+
+
+class Endpointer:
+    """ตัดสินจุดจบประโยคจากผล VAD โดยเทียบความยาวช่วงเงียบกับการกระจายของช่วงหยุดล่าสุดของผู้พูด"""
+    def __init__(self, frame_seconds, preset=DEFAULT_PRESET, hangover_seconds=0.0,
+                 history=PAUSE_HISTORY, **overrides):
+        if preset not in ENDPOINT_PRESETS:
+            raise ValueError(f"Unknown endpoint preset: {preset} (choose from {', '.join(ENDPOINT_PRESETS)})")
+        self.preset = preset
+        self.config = dict(ENDPOINT_PRESETS[preset], **overrides)
+        self.frame_seconds = frame_seconds
+        self.hangover_seconds = hangover_seconds  # ช่วงที่ VAD คงสถานะพูดไว้ ซึ่งรวมอยู่ในเวลาตัดสินด้วย
+        self.pauses = deque(maxlen=history)  # ประวัติช่วงหยุดระหว่างคำ (คงไว้ข้ามประโยค)
+        self.reset()
+
+    def reset(self):
+        """เริ่มประโยคใหม่ (ประวัติช่วงหยุดของผู้พูดยังคงอยู่)"""
+        self.heard_speech = False
+        self.ended = False
+        self.silence_frames = 0
+        self.decision_latency = None  # ความยาวเสียงเงียบ (วินาที) ก่อนตัดสินว่าจบประโยค
+        self.decision_wall_time = None  # เวลาจริง (วินาที) ตั้งแต่พบเฟรมพูดสุดท้ายจนตัดสิน
+        self.frames_seen = 0
+        self.speech_start_frame = None  # เฟรมพูดแรกของประโยค
+        self.speech_end_frame = None  # เฟรมถัดจากเฟรมพูดสุดท้าย
+        self._last_speech_time = None
+
+    def threshold(self):
+        """เกณฑ์ช่วงเงียบ (วินาที) สำหรับตัดสินจบประโยคในตอนนี้"""
+        config = self.config
+        if len(self.pauses) < MIN_HISTORY:
+            return config['default_pause']
+        typical = float(np.percentile(np.fromiter(self.pauses, dtype=np.float64), config['percentile']))
+        return min(max(typical * config['factor'], config['min_pause']), config['max_pause'])
+
+    def update(self, decisions):
+        """รับผล VAD ของเฟรมใหม่ คืนค่า True เมื่อตัดสินว่าจบประโยคแล้ว"""
+        if self.ended:
+            return True
+
+        for is_speech in decisions:
+            self.frames_seen += 1
+            if is_speech:
+                # ช่วงเงียบที่จบลงด้วยเสียงพูดอีกครั้ง คือช่วงหยุดระหว่างคำของผู้พูด
+                if self.heard_speech and self.silence_frames:
+                    pause = self.silence_frames * self.frame_seconds + self.hangover_seconds
+                    if pause >= MIN_INTERNAL_PAUSE:
+                        self.pauses.append(pause)
+                if not self.heard_speech:
+                    self.speech_start_frame = self.frames_seen - 1
+                self.heard_speech = True
+                self.speech_end_frame = self.frames_seen
+                self.silence_frames = 0
+                self._last_speech_time = time.monotonic()
+                continue
+
+            self.silence_frames += 1
+            if not self.heard_speech:
+                continue
+
+            pause = self.silence_frames * self.frame_seconds + self.hangover_seconds
+            if pause >= self.threshold():
+                self.ended = True
+                self.decision_latency = pause
+                self.decision_wall_time = time.monotonic() - self._last_speech_time
+                return True
+
+        return False
+
+    def speech_span(self, frame_length):
+        """ช่วงเสียงพูดของประโยคเป็นตำแหน่ง sample (start, end) หรือ None ถ้ายังไม่มีเสียงพูด"""
+        if not self.heard_speech:
+            return None
+        return self.speech_start_frame * frame_length, self.speech_end_frame * frame_length
+
+    def trailing_silence(self):
+        """ความยาวช่วงเงียบท้ายประโยคในตอนนี้ (วินาที)"""
+        return self.silence_frames * self.frame_seconds
@@ -0,0 +1,145 @@
+import os
+import time
+
+# การรับงานเข้า server (ค่าของแต่ละ worker process)
+MAX_SESSIONS = int(os.environ.get('MAX_SESSIONS', 100))  # จำนวนการเชื่อมต่อพร้อมกันสูงสุด
+AUDIO_SECONDS_PER_MINUTE = float(os.environ.get('AUDIO_SECONDS_PER_MINUTE', 90))  # โควตาเสียงต่อ client ต่อนาที
+AUDIO_BURST_SECONDS = float(os.environ.get('AUDIO_BURST_SECONDS', 30))  # ส่งเกินอัตราเฉลี่ยได้ชั่วคราวไม่เกินนี้
+MAX_PENDING_RECOGNITIONS = int(os.environ.get('MAX_PENDING_RECOGNITIONS', 32))  # งานถอดเสียงที่รอหรือกำลังทำทั้ง server
+RATE_LIMIT_BY = os.environ.get('RATE_LIMIT_BY', 'address')  # address (IP ของ client, ต่อใหม่ไม่ล้างโควตา) / connection
+DEFAULT_RECOGNITION_SECONDS = 1.0  # เวลาถอดเสียงโดยประมาณก่อนมีข้อมูลจริง
+
+
+class TokenBucket:
+    """token bucket: เติม rate หน่วยต่อวินาที เก็บได้สูงสุด capacity หน่วย"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount, now=None):
+        """ใช้ amount หน่วย คืนค่า 0 ถ้าได้ หรือจำนวนวินาทีที่ต้องรอถ้าไม่พอ (ไม่หักโควตา)
+
+        ข้อความที่ใหญ่กว่า capacity ผ่านได้เมื่อ bucket เต็ม (ติดลบแล้วค่อยเติมคืน)
+        """
+        self._refill(time.monotonic() if now is None else now)
+        needed = min(amount, self.capacity)
+        if needed <= self.tokens:
+            self.tokens -= amount
+            return 0.0
+        if self.rate <= 0:
+            return float('inf')
+        return (needed - self.tokens) / self.rate
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:
+    """ตัดสินว่าจะรับการเชื่อมต่อ/ข้อความเสียงหรือไม่ เพื่อให้ client ปกติยังได้ latency ตามเป้าเมื่อ server รับงานเกิน
+
+    ค่าที่คืนเป็น None = รับ หรือจำนวนวินาทีที่ client ควรรอก่อนลองใหม่ (retry_after)
+    ใช้ภายใน event loop เดียว (ไม่ต้องมี lock)
+    """
+    def __init__(self, max_sessions=MAX_SESSIONS, audio_per_minute=AUDIO_SECONDS_PER_MINUTE,
+                 burst_seconds=AUDIO_BURST_SECONDS, max_pending=MAX_PENDING_RECOGNITIONS, concurrency=1,
+                 limit_by=RATE_LIMIT_BY):
+        self.limit_by = limit_by
+        self.max_sessions = max_sessions
+        self.audio_rate = audio_per_minute / 60
+        self.burst_seconds = burst_seconds
+        self.max_pending = max_pending
+        self.concurrency = max(concurrency, 1)
+        self.sessions = {}  # client -> จำนวนการเชื่อมต่อที่เปิดอยู่
+        self.buckets = {}  # client -> TokenBucket ของเสียง (เก็บไว้หลังปิดการเชื่อมต่อ กันการต่อใหม่เพื่อล้างโควตา)
+        self.pending = 0  # งานถอดเสียงที่รอหรือกำลังทำ
+        self.recognition_seconds = DEFAULT_RECOGNITION_SECONDS  # ค่าเฉลี่ยถ่วงน้ำหนักของเวลาถอดเสียง
+        self.sessions_rejected = 0
+        self.audio_throttled = 0
+        self.throttled_seconds = 0.0
+        self.overload_rejected = 0
+
+    def client_key(self, remote_address):
+        """ตัวระบุ client สำหรับโควตา จากที่อยู่ของการเชื่อมต่อ (host, port)"""
+        if not remote_address:
+            return "unknown"
+        if self.limit_by == 'connection':
+            return "%s:%s" % tuple(remote_address[:2])
+        return remote_address[0]
+
+    def open_session(self, client):
+        """ขอเปิดการเชื่อมต่อใหม่"""
+        if sum(self.sessions.values()) >= self.max_sessions:
+            self.sessions_rejected += 1
+            return max(self.recognition_seconds, 1.0)
+        self.sessions[client] = self.sessions.get(client, 0) + 1
+        self._prune()
+        return None
+
+    def close_session(self, client):
+        remaining = self.sessions.get(client, 0) - 1
+        if remaining > 0:
+            self.sessions[client] = remaining
+        else:
+            self.sessions.pop(client, None)
+
+    def take_audio(self, client, seconds):
+        """หักโควตาเสียงของ client (วินาทีของเสียง)"""
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            bucket = self.buckets[client] = TokenBucket(self.audio_rate, self.burst_seconds)
+        retry_after = bucket.take(seconds)
+        if retry_after:
+            self.audio_throttled += 1
+            self.throttled_seconds += seconds
+            return retry_after
+        return None
+
+    def check_capacity(self):
+        """มีที่ว่างสำหรับงานถอดเสียงใหม่หรือไม่ (ตรวจก่อนหักโควตา งานที่ถูกปฏิเสธเพราะ server เต็มไม่นับเป็นของ client)"""
+        if self.pending < self.max_pending:
+            return None
+        self.overload_rejected += 1
+        # ประมาณเวลาที่งานที่ค้างอยู่จะลดลงต่ำกว่าเพดาน
+        return max((self.pending - self.max_pending + 1) * self.recognition_seconds / self.concurrency, 0.5)
+
+    def recognition_started(self):
+        self.pending += 1
+
+    def recognition_finished(self, seconds=None):
+        """งานถอดเสียงเสร็จ (seconds = เวลาที่ใช้ถอดจริง ไม่รวมเวลารอคิว)"""
+        self.pending -= 1
+        if seconds is not None:
+            self.recognition_seconds += 0.2 * (seconds - self.recognition_seconds)
+
+    def _prune(self):
+        """ทิ้ง bucket ของ client ที่ไม่ได้เชื่อมต่อแล้วและโควตาเต็มแล้ว (ไม่มีผลต่อการจำกัด)"""
+        now = time.monotonic()
+        for client in [client for client, bucket in self.buckets.items()
+                       if client not in self.sessions and bucket.full(now)]:
+            del self.buckets[client]
+
+    def stats(self):
+        return {
+            'sessions': sum(self.sessions.values()),
+            'sessions_rejected': self.sessions_rejected,
+            'audio_throttled': self.audio_throttled,
+            'throttled_seconds': self.throttled_seconds,
+            'overload_rejected': self.overload_rejected,
+            'pending': self.pending,
+            'recognition_seconds': self.recognition_seconds,
+        }
+
+
+def format_admission_stats(stats):
+    """ข้อความสรุปการรับงานหนึ่งบรรทัด"""
+    return (f"Admission: {stats['sessions']} sessions ({stats['sessions_rejected']} rejected), "
+            f"{stats['audio_throttled']} audio messages throttled ({stats['throttled_seconds']:.1f} s), "
+            f"{stats['overload_rejected']} rejected while overloaded, {stats['pending']} recognitions pending "
+            f"(avg {stats['recognition_seconds']:.2f} s)")
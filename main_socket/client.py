@@ -2,26 +2,38 @@ import asyncio
 import websockets
 import json
 import pyaudio
-import wave
-import numpy as np
-import base64
-import tempfile
+import itertools
 import os
 from rich.console import Console
 from rich.panel import Panel
 from rich.layout import Layout
 from rich.prompt import Prompt
 from rich.live import Live
-import threading
 import time
+import sys
 from pynput import keyboard  # เพิ่มไลบรารีนี้
 
+# ให้ import โมดูลที่ใช้ร่วมกันจากโฟลเดอร์หลักของโปรเจกต์ได้
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audio_capture import AudioSession, format_overrun_report
+from vad import VoiceActivityDetector, trim_silence
+from segmenter import SpeechSegmenter, ResultStitcher
+from endpointing import Endpointer
+from pcm_buffer import PCMAccumulator
+from resample import TARGET_RATE
+from protocol import encode_audio_frame
+
 # Settings
 CHUNK = 1024
 FORMAT = pyaudio.paInt16
 CHANNELS = 1
-RATE = 16000
-SILENCE_THRESHOLD = 300
+RATE = int(os.environ.get('TARGET_SAMPLE_RATE', TARGET_RATE))  # อัตราที่ส่งให้ server (เสียงถูกแปลงตั้งแต่ขั้นจับเสียง)
+ENDPOINT_PRESET = os.environ.get('ENDPOINT_PRESET', 'interactive')  # interactive / balanced / dictation
+TRIM_PAD_MS = 150  # ช่วงเผื่อหัวท้ายเมื่อตัดเสียงเงียบก่อนส่ง
+AUDIO_FRAME_COMPRESSION = os.environ.get('AUDIO_FRAME_COMPRESSION', '') == 'zlib'  # บีบอัดเฟรมเสียงด้วย zlib
+UPLOAD_MODE = os.environ.get('AUDIO_UPLOAD_MODE', 'segments')  # segments (แบ่งประโยคที่ client) / stream (แบ่งที่ server)
+STREAM_CHUNK_MS = 100  # ขนาดเฟรมเสียงที่ส่งต่อเนื่องในโหมดสตรีม
+DISPLAY_UTTERANCES = 3  # จำนวนประโยคล่าสุดที่แสดง (ผลของประโยคก่อนหน้าที่มาช้ายังต่อเข้าที่เดิมได้)
 
 # รายการภาษาที่รองรับ
 LANGUAGES = {
@@ -40,24 +52,19 @@ is_connected = False
 is_recording = False
 server_message = "Connecting to server..."
 should_exit = False  # เพิ่มตัวแปรสำหรับการออกจากโปรแกรม
+frame_seq = itertools.count()  # หมายเลขลำดับของเฟรมเสียงที่ส่ง (server ส่งกลับมากับผลเพื่อจับคู่)
+pending_frames = {}  # seq -> เวลาที่ส่ง ของช่วงเสียงที่ยังไม่ได้รับผล
 
 # ซ่อน ALSA warnings
-import sys
 stderr_backup = sys.stderr
 sys.stderr = open(os.devnull, 'w')
 
-def is_silent(data_chunk, threshold=SILENCE_THRESHOLD):
-    """ตรวจสอบว่าชัพข้อมูลเสียงเงียบหรือไม่"""
-    audio_data = np.frombuffer(data_chunk, dtype=np.int16)
-    volume_norm = np.mean(np.abs(audio_data))
-    return volume_norm < threshold
-
-def select_audio_device():
+def select_audio_device(session):
     """ให้ผู้ใช้เลือกอุปกรณ์อินพุต"""
     # คืนค่า stderr ชั่วคราวเพื่อแสดงข้อมูลอุปกรณ์
     sys.stderr = stderr_backup
     
-    p = pyaudio.PyAudio()
+    p = session.p
     
     try:
         # แสดงรายการอุปกรณ์อินพุตทั้งหมด
@@ -100,7 +107,6 @@ def select_audio_device():
             console.print("[yellow]Invalid selection, using default device[/yellow]")
             return None
     finally:
-        p.terminate()
         # ซ่อน stderr อีกครั้ง
         sys.stderr = open(os.devnull, 'w')
 
@@ -118,14 +124,15 @@ def select_languages():
         default="ja"
     )
     
-    # เลือกภาษาเป้าหมาย
-    target_lang = Prompt.ask(
-        "Select target language",
-        choices=list(LANGUAGES.keys()),
-        default="en"
-    )
+    # เลือกภาษาเป้าหมาย (เลือกได้หลายภาษา คั่นด้วยจุลภาค เช่น th,es,ja)
+    while True:
+        answer = Prompt.ask("Select target language(s), comma-separated", default="en")
+        target_langs = list(dict.fromkeys(lang.strip() for lang in answer.split(',') if lang.strip()))
+        if target_langs and all(lang in LANGUAGES for lang in target_langs):
+            break
+        console.print(f"[red]Please choose from: {', '.join(LANGUAGES)}[/red]")
     
-    return source_lang, target_lang
+    return source_lang, target_langs
 
 def update_display():
     """สร้าง layout สำหรับการแสดงผล"""
@@ -147,6 +154,8 @@ def update_display():
     
     # สถานะการเชื่อมต่อและการบันทึก
     status_text = server_message
+    if pending_frames:
+        status_text += f" [dim]({len(pending_frames)} pending)[/dim]"
     if is_recording:
         status_text += " [bold green](Recording...)[/bold green]"
     else:
@@ -183,20 +192,32 @@ def on_key_press(key):
         # กรณีกดปุ่มที่ไม่ใช่ตัวอักษร (เช่น Shift, Ctrl)
         pass
 
-async def record_and_send(websocket, device_index):
+async def send_segment(websocket, pcm, segment, span, utterance, final=False):
+    """ส่งช่วงเสียงที่ปิดแล้วเป็นเฟรม binary (PCM ดิบ ไม่ต้องห่อ WAV/base64) พร้อมหมายเลขประโยคและหมายเลขช่วง"""
+    seq, start, end, overlap = segment
+    # ช่วงแรกตัดเสียงเงียบหน้าประโยคออก เหลือไว้เฉพาะช่วงเผื่อ
+    if span:
+        trimmed = max(start, span[0] - int(RATE * TRIM_PAD_MS / 1000))
+        overlap, start = max(overlap - (trimmed - start), 0), trimmed
+    frame_id = next(frame_seq)
+    pending_frames[frame_id] = time.monotonic()
+    await websocket.send(encode_audio_frame(pcm.samples()[start:end], RATE, frame_id, utterance, seq,
+                                            final=final, overlap=overlap, compress=AUDIO_FRAME_COMPRESSION))
+
+async def record_and_send(websocket, session, device_index):
     """บันทึกเสียงและส่งไปยัง server แบบ real-time"""
     global is_recording, source_text, translated_text, should_exit
     
-    p = pyaudio.PyAudio()
-    
     try:
-        # เปิดสตรีมเสียง
-        stream = p.open(format=FORMAT,
-                       channels=CHANNELS,
-                       rate=RATE,
-                       input=True,
-                       input_device_index=device_index,
-                       frames_per_buffer=CHUNK)
+        # ใช้สตรีมที่เปิดค้างไว้ใน session (PortAudio เขียนลง ring buffer เอง)
+        session.open(session.native_rate(device_index), device_index, channels=CHANNELS, chunk=CHUNK, target_rate=RATE)
+        # VAD ใช้ร่วมกันทุกประโยค เพื่อเก็บประวัติ noise floor ไว้
+        vad = VoiceActivityDetector(RATE)
+        turn = Endpointer(vad.frame_seconds, ENDPOINT_PRESET,
+                          hangover_seconds=vad.hangover_frames * vad.frame_seconds)
+        # แบ่งเสียงพูดยาวเป็นช่วงย่อย ส่งให้ server ถอดเสียงระหว่างที่ยังพูดอยู่
+        segmenter = SpeechSegmenter(RATE, vad.frame_length)
+        utterance = 0
         
         while not should_exit:
             # รอจังหวะที่จะเริ่มบันทึก
@@ -204,87 +225,189 @@ async def record_and_send(websocket, device_index):
                 await asyncio.sleep(0.1)
                 continue
             
-            frames = []
-            silence_counter = 0
+            # เริ่มประโยคใหม่ รวมเสียง pre-roll ก่อนหน้าเล็กน้อย
+            engine = session.begin_utterance()
+            # จองบัฟเฟอร์สำหรับทั้งประโยคไว้ล่วงหน้า (สูงสุด 10 วินาที)
+            pcm = PCMAccumulator(RATE, CHANNELS, initial_seconds=10)
+            vad.reset(keep_noise_floor=True)
+            turn.reset()
+            segmenter.reset()
+            utterance += 1
             has_sound = False
             
             # บันทึกเสียง
             console.print("[yellow]Listening...[/yellow]", end="\r")
             
-            for i in range(0, int(RATE / CHUNK * 10)):  # บันทึกสูงสุด 10 วินาที
+            max_samples = RATE * CHANNELS * 10  # บันทึกสูงสุด 10 วินาที
+            while len(pcm) < max_samples:
                 if not is_recording or should_exit:
                     break
                     
-                data = stream.read(CHUNK, exception_on_overflow=False)
-                frames.append(data)
+                # อ่านแบบไม่บล็อก event loop ถ้ายังไม่มีข้อมูลให้รอรอบถัดไป
+                data = engine.read(CHUNK, timeout=0, out=pcm.reserve(CHUNK))
+                if data is None:
+                    await asyncio.sleep(CHUNK / RATE / 2)
+                    continue
+                data = pcm.commit(len(data))
                 
-                # ตรวจสอบว่าเสียงเงียบหรือไม่
-                if not is_silent(data):
-                    has_sound = True
-                    silence_counter = 0
-                else:
-                    silence_counter += 1
-                    
-                    # หยุดหลังจาก 1.5 วินาทีที่เงียบ ถ้าเคยได้ยินเสียงมาก่อน
-                    if has_sound and silence_counter > int(RATE / CHUNK * 1.5):
-                        break
+                # ตรวจสอบเสียงพูดด้วย VAD และตัดสินจบประโยคตามจังหวะการหยุดของผู้พูด
+                decisions = vad.process(data)
+                ended = turn.update(decisions)
+                has_sound = turn.heard_speech
+                
+                # ส่งช่วงที่ปิดแล้วทันที ไม่ต้องรอจนพูดจบ
+                for segment in segmenter.update(decisions):
+                    await send_segment(websocket, pcm, segment, turn.speech_span(vad.frame_length), utterance)
+                
+                if ended:
+                    console.print(f"[green]End of speech after {turn.decision_latency:.2f} s of silence[/green]", end="\r")
+                    break
+            
+            # แจ้งเตือนถ้ามีเสียงหายระหว่างบันทึก
+            overrun_report = format_overrun_report(engine.stats())
+            if overrun_report:
+                console.print(f"[yellow]{overrun_report}[/yellow]", end="\r")
             
-            # ถ้ามีเสียง ส่งไปยัง server
+            # ถ้ามีเสียง ส่งช่วงสุดท้ายที่ยังค้างอยู่ไปยัง server
             if has_sound:
                 console.print("[green]Sending audio to server...[/green]", end="\r")
                 
-                # แปลงเสียงเป็น WAV
-                with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                    temp_filename = temp_file.name
+                # ตัดเสียงเงียบท้ายประโยคออกก่อนเข้ารหัสและส่ง
+                span = turn.speech_span(vad.frame_length)
+                speech, trim = trim_silence(pcm.samples(), RATE, span, pad_ms=TRIM_PAD_MS)
+                if trim['seconds_saved'] > 0:
+                    console.print(f"[green]Trimmed {trim['seconds_saved']:.2f} s of silence ({trim['bytes_saved']} bytes saved)[/green]", end="\r")
                 
-                try:
-                    with wave.open(temp_filename, 'wb') as wf:
-                        wf.setnchannels(CHANNELS)
-                        wf.setsampwidth(p.get_sample_size(FORMAT))
-                        wf.setframerate(RATE)
-                        wf.writeframes(b''.join(frames))
-                    
-                    # อ่านไฟล์เสียงและแปลงเป็น base64
-                    with open(temp_filename, 'rb') as f:
-                        audio_data = base64.b64encode(f.read()).decode('utf-8')
-                    
-                    # ส่งไปยัง server
-                    await websocket.send(json.dumps({
-                        "type": "audio",
-                        "audio_data": audio_data
-                    }))
-                    
-                finally:
-                    # ลบไฟล์ชั่วคราว
-                    if os.path.exists(temp_filename):
-                        os.unlink(temp_filename)
+                final_segment = segmenter.finish(min(span[1] + int(RATE * TRIM_PAD_MS / 1000), len(pcm)))
+                if final_segment:
+                    await send_segment(websocket, pcm, final_segment, span, utterance, final=True)
             
             # หยุดพักสักครู่
             await asyncio.sleep(0.1)
     
     except Exception as e:
         console.print(f"[red]Error recording/sending audio: {e}[/red]")
-    finally:
-        stream.stop_stream()
-        stream.close()
-        p.terminate()
 
-async def receive_results(websocket):
-    """รับผลลัพธ์จาก server"""
+async def stream_audio(websocket, session, device_index):
+    """โหมดสตรีม: ส่งเสียงเป็นเฟรมเล็กต่อเนื่องระหว่างบันทึก ให้ server ตรวจจับและแบ่งประโยคเอง"""
+    global is_recording, should_exit
+    
+    try:
+        session.open(session.native_rate(device_index), device_index, channels=CHANNELS, chunk=CHUNK, target_rate=RATE)
+        frames = int(RATE * STREAM_CHUNK_MS / 1000)
+        
+        while not should_exit:
+            if not is_recording:
+                await asyncio.sleep(0.1)
+                continue
+            
+            # เริ่มส่งพร้อมเสียง pre-roll ก่อนหน้าเล็กน้อย
+            engine = session.begin_utterance()
+            console.print("[yellow]Streaming...[/yellow]", end="\r")
+            while is_recording and not should_exit:
+                data = engine.read(frames, timeout=0)
+                if data is None:
+                    await asyncio.sleep(STREAM_CHUNK_MS / 1000 / 2)
+                    continue
+                await websocket.send(encode_audio_frame(data, RATE, next(frame_seq), stream=True,
+                                                        compress=AUDIO_FRAME_COMPRESSION))
+            
+            # หยุดบันทึก ให้ server ปิดประโยคที่ค้างอยู่
+            await websocket.send(json.dumps({"type": "stream_end"}))
+            overrun_report = format_overrun_report(engine.stats())
+            if overrun_report:
+                console.print(f"[yellow]{overrun_report}[/yellow]", end="\r")
+    
+    except Exception as e:
+        console.print(f"[red]Error streaming audio: {e}[/red]")
+
+def format_translations(translations, target_langs):
+    """ข้อความแปลสำหรับแสดงผล (หลายภาษาแสดงเป็นบรรทัดละภาษา)"""
+    if len(target_langs) == 1:
+        return translations.get(target_langs[0], "")
+    return "\n\n".join(f"[bold]{LANGUAGES[lang]}:[/bold] {translations[lang]}"
+                        for lang in target_langs if translations.get(lang))
+
+class UtteranceResults:
+    """ผลของประโยคเดียว: ต่อข้อความต้นทางหนึ่งชุดและคำแปลแยกตามภาษาตามลำดับช่วงย่อย ไม่ว่าผลจะมาในลำดับใด"""
+    def __init__(self, target_langs):
+        self.source = ResultStitcher()
+        self.translations = {lang: ResultStitcher() for lang in target_langs}
+        self.seen_segments = set()
+    
+    def add(self, segment, source_text, lang=None, translated_text=""):
+        # ข้อความต้นทางของช่วงเดียวกันมากับทุกภาษา ต่อเพียงครั้งเดียว
+        if segment not in self.seen_segments:
+            self.seen_segments.add(segment)
+            self.source.add(segment, source_text)
+        if lang is None:
+            for stitcher in self.translations.values():
+                stitcher.add(segment, translated_text)
+        elif lang in self.translations:
+            self.translations[lang].add(segment, translated_text)
+    
+    def texts(self):
+        return self.source.text, {lang: stitcher.text for lang, stitcher in self.translations.items()}
+
+def merge_utterances(utterances, target_langs):
+    """รวมผลของประโยคล่าสุดเรียงตามหมายเลขประโยคสำหรับแสดงผล"""
+    sources, translations = [], {lang: [] for lang in target_langs}
+    for utterance in sorted(utterances):
+        source, translated = utterances[utterance].texts()
+        if source:
+            sources.append(source)
+        for lang, text in translated.items():
+            if text:
+                translations[lang].append(text)
+    return "\n".join(sources), {lang: "\n".join(texts) for lang, texts in translations.items()}
+
+async def receive_results(websocket, target_langs):
+    """รับผลลัพธ์จาก server ซึ่งส่งกลับตามลำดับที่ประมวลผลเสร็จ (แต่ละภาษาเป้าหมายมาแยกกัน)"""
     global source_text, translated_text, server_message, should_exit
     
+    # ผลแยกตามหมายเลขประโยค เก็บไว้เฉพาะประโยคล่าสุด ผลของประโยคที่เก่ากว่านั้นทิ้งไป
+    utterances = {}
+    translations = {}
+    
     try:
         while not should_exit:
             # รับข้อมูลจาก server
             message = await websocket.recv()
             data = json.loads(message)
+            if "seq" in data:
+                pending_frames.pop(data["seq"], None)
+            elif data.get("code") == "bad_frame" and pending_frames:
+                # server อ่าน header ของเฟรมไม่ได้ ถือว่าเป็นเฟรมที่ค้างนานที่สุด
+                del pending_frames[min(pending_frames, key=pending_frames.get)]
+            
+            results = None
+            if "segment" in data:
+                utterance = data.get("utterance", 0)
+                results = utterances.get(utterance)
+                if results is None and (len(utterances) < DISPLAY_UTTERANCES or utterance > min(utterances)):
+                    results = utterances[utterance] = UtteranceResults(target_langs)
+                    while len(utterances) > DISPLAY_UTTERANCES:
+                        del utterances[min(utterances)]
             
             # ตรวจสอบประเภทข้อความ
             if data["type"] == "result":
-                source_text = data["source_text"]
-                translated_text = data["translated_text"]
-            elif data["type"] == "error":
-                server_message = f"Error: {data['message']}"
+                lang = data.get("target_lang", target_langs[0])
+                if "segment" in data:
+                    if results is not None:
+                        results.add(data["segment"], data["source_text"], lang, data["translated_text"])
+                        source_text, translations = merge_utterances(utterances, target_langs)
+                else:
+                    source_text = data["source_text"]
+                    translations[lang] = data["translated_text"]
+                translated_text = format_translations(translations, target_langs)
+            elif data["type"] in ("error", "busy"):
+                if results is not None:
+                    # ช่วงที่ถอดเสียงไม่ได้ (หรือ server ไม่รับ) ถือเป็นข้อความว่าง เพื่อไม่ให้ช่วงถัดไปค้างรอ
+                    results.add(data["segment"], "")
+                if data["type"] == "busy":
+                    server_message = f"Server busy: {data['message']}, retry in {data['retry_after']:.0f} s"
+                else:
+                    server_message = f"Error: {data['message']}"
             elif data["type"] == "config_confirm":
                 server_message = data["message"]
     
@@ -303,9 +426,16 @@ async def main():
     console.print("[bold green]Real-time Speech Translation Client[/bold green]")
     console.print("[italic]Translates your speech in real-time[/italic]")
     
+    # เปิด PortAudio ครั้งเดียวใช้ตลอดทั้งโปรแกรม
+    session = AudioSession()
+    
     # เลือกอุปกรณ์อินพุตและภาษา
-    device_index = select_audio_device()
-    source_lang, target_lang = select_languages()
+    device_index = select_audio_device(session)
+    source_lang, target_langs = select_languages()
+    
+    # เปิดสตรีมค้างไว้ล่วงหน้า เพื่อให้มีเสียง pre-roll ตอนกดเริ่มบันทึก
+    # จับเสียงที่อัตราของอุปกรณ์ แล้วแปลงเป็น RATE ก่อนเข้า ring buffer (ลดขนาดข้อมูลที่ส่ง)
+    session.open(session.native_rate(device_index), device_index, channels=CHANNELS, chunk=CHUNK, target_rate=RATE)
     
     # เริ่ม keyboard listener
     listener = keyboard.Listener(on_press=on_key_press)
@@ -327,12 +457,13 @@ async def main():
             await websocket.send(json.dumps({
                 "type": "config",
                 "source_lang": source_lang,
-                "target_lang": target_lang
+                "target_langs": target_langs
             }))
             
             # เริ่ม tasks สำหรับการบันทึกเสียงและรับผลลัพธ์
-            record_task = asyncio.create_task(record_and_send(websocket, device_index))
-            receive_task = asyncio.create_task(receive_results(websocket))
+            send_audio = stream_audio if UPLOAD_MODE == 'stream' else record_and_send
+            record_task = asyncio.create_task(send_audio(websocket, session, device_index))
+            receive_task = asyncio.create_task(receive_results(websocket, target_langs))
             
             # แสดงผลแบบ real-time
             with Live(update_display(), refresh_per_second=4) as live:
@@ -361,6 +492,8 @@ async def main():
         sys.stderr = stderr_backup
         # หยุด keyboard listener
         listener.stop()
+        # ปิดสตรีมเสียงและ PortAudio
+        session.close()
 
 if __name__ == "__main__":
     try:
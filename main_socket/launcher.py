@@ -0,0 +1,183 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import sys
+import time
+from rich.console import Console
+
+import server
+
+# จำนวน worker และการเริ่ม worker ใหม่เมื่อ process ตาย
+WORKER_RESTART_DELAY = 1.0  # รอก่อนเริ่ม worker ใหม่ (วินาที)
+MAX_RESTARTS_PER_MINUTE = int(os.environ.get('MAX_RESTARTS_PER_MINUTE', 10))  # เกินนี้หยุดเริ่มใหม่ (worker พังวนซ้ำ)
+STATS_PRINT_INTERVAL = float(os.environ.get('SERVER_STATS_PRINT_INTERVAL', 60))  # แสดงสถิติรวมทุกกี่วินาที
+
+console = Console()
+
+
+def run_worker(index, host, port, sock, stats_queue):
+    """จุดเริ่มของ worker process: รัน server.main และส่งสถิติกลับทาง stats_queue"""
+    # Ctrl+C ส่งถึงทุก process ในกลุ่ม ให้ launcher เป็นผู้สั่งหยุด worker ด้วย SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    server.console.print(f"[dim]Worker {index} started (pid {os.getpid()})[/dim]")
+    report = lambda stats: stats_queue.put((index, os.getpid(), stats))
+    try:
+        asyncio.run(server.main(host, port, sock=sock, reuse_port=sock is None, report=report))
+    except Exception as e:
+        server.console.print(f"[bold red]Worker {index} error: {e}[/bold red]")
+        sys.exit(1)
+
+
+def listening_socket(host, port):
+    """socket ที่เปิดรอไว้ให้ทุก worker ใช้ร่วมกัน (pre-fork) สำหรับระบบที่ไม่มี SO_REUSEPORT"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(socket.SOMAXCONN)
+    sock.setblocking(False)
+    return sock
+
+
+def sum_stats(stats_list):
+    """รวมสถิติของหลาย worker ด้วยการบวกทีละค่า"""
+    total = {}
+    for stats in stats_list:
+        for key, value in stats.items():
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+class Supervisor:
+    """เริ่ม worker N process ที่รับการเชื่อมต่อบนพอร์ตเดียวกัน เริ่มใหม่เมื่อ worker ตาย และรวมสถิติจากทุก worker
+
+    SIGHUP: เริ่ม worker ใหม่ทีละตัวโดยไม่ปิดพอร์ต (worker เก่าหยุดรับการเชื่อมต่อใหม่และรอ client เดิมให้เสร็จก่อน)
+    SIGTERM / Ctrl+C: หยุดทุก worker อย่างนุ่มนวลแล้วแสดงสถิติรวม
+    """
+    def __init__(self, host, port, workers):
+        self.host = host
+        self.port = port
+        self.count = max(int(workers), 1)
+        # ใช้ SO_REUSEPORT ถ้าระบบรองรับ (kernel กระจายการเชื่อมต่อให้แต่ละ worker) ไม่เช่นนั้นแชร์ socket เดียว
+        self.sock = None if hasattr(socket, 'SO_REUSEPORT') else listening_socket(host, port)
+        self.stats_queue = multiprocessing.Queue()
+        self.workers = {}  # index -> Process
+        self.retiring = []  # worker เก่าที่กำลังรอ client เดิมก่อนปิด
+        self.restarts = []  # เวลาที่เริ่ม worker ใหม่เพราะตาย
+        self.latest = {}  # pid -> สถิติล่าสุดของแต่ละ worker (รวมตัวที่ปิดไปแล้ว ตัวนับของ worker ใหม่เริ่มจากศูนย์)
+        self.stopping = False
+        self.reload_requested = False
+
+    def start_worker(self, index):
+        process = multiprocessing.Process(target=run_worker, name=f"server-worker-{index}",
+                                          args=(index, self.host, self.port, self.sock, self.stats_queue),
+                                          daemon=False)
+        process.start()
+        self.workers[index] = process
+        return process
+
+    def run(self):
+        """รันจนได้รับสัญญาณให้หยุด"""
+        mode = "SO_REUSEPORT" if self.sock is None else "shared socket"
+        console.print(f"[bold green]Starting {self.count} server workers on ws://{self.host}:{self.port} ({mode})[/bold green]")
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'stopping', True))
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, lambda *_: setattr(self, 'reload_requested', True))
+
+        for index in range(self.count):
+            self.start_worker(index)
+        next_print = time.monotonic() + STATS_PRINT_INTERVAL
+        try:
+            while not self.stopping:
+                self.collect_stats(timeout=0.5)
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.rolling_restart()
+                self.check_workers()
+                if time.monotonic() >= next_print:
+                    next_print = time.monotonic() + STATS_PRINT_INTERVAL
+                    console.print(f"[dim]{self.format_stats()}[/dim]")
+        except KeyboardInterrupt:
+            pass
+        self.shutdown()
+
+    def collect_stats(self, timeout=0):
+        """รับสถิติที่ worker ส่งมา (รอไม่เกิน timeout วินาที)"""
+        try:
+            while True:
+                _, pid, stats = self.stats_queue.get(timeout=timeout)
+                self.latest[pid] = stats
+                timeout = 0
+        except queue.Empty:
+            pass
+
+    def check_workers(self):
+        """เริ่ม worker ใหม่แทนตัวที่ตาย (จำกัดจำนวนครั้งต่อนาที)"""
+        self.retiring = [process for process in self.retiring if process.is_alive()]
+
+        now = time.monotonic()
+        self.restarts = [started for started in self.restarts if now - started < 60]
+        for index, process in list(self.workers.items()):
+            if process.is_alive():
+                continue
+            if len(self.restarts) >= MAX_RESTARTS_PER_MINUTE:
+                console.print(f"[bold red]Worker {index} exited with code {process.exitcode}; "
+                              f"too many restarts, not restarting[/bold red]")
+                del self.workers[index]
+                continue
+            console.print(f"[red]Worker {index} exited with code {process.exitcode}, restarting[/red]")
+            time.sleep(WORKER_RESTART_DELAY)
+            self.restarts.append(time.monotonic())
+            self.start_worker(index)
+        if not self.workers:
+            console.print("[bold red]No workers left, stopping[/bold red]")
+            self.stopping = True
+
+    def rolling_restart(self):
+        """เริ่ม worker ใหม่ทีละตัว แล้วจึงสั่ง worker เก่าหยุด ให้มี worker รับการเชื่อมต่ออยู่เสมอ"""
+        console.print("[yellow]Restarting workers[/yellow]")
+        for index, old in list(self.workers.items()):
+            self.start_worker(index)
+            time.sleep(WORKER_RESTART_DELAY)  # ให้ worker ใหม่ผูกพอร์ตก่อน
+            if old.is_alive():
+                os.kill(old.pid, signal.SIGTERM)
+                self.retiring.append(old)
+
+    def shutdown(self):
+        """สั่งทุก worker หยุด (SIGTERM) รอให้ปิดเอง แล้วแสดงสถิติรวม"""
+        console.print("[yellow]Stopping workers[/yellow]")
+        processes = list(self.workers.values()) + self.retiring
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+        # อ่านคิวสถิติระหว่างรอ worker ปิด (worker ปิดไม่ได้ถ้าข้อมูลในคิวยังส่งไม่หมด)
+        deadline = time.monotonic() + server.SHUTDOWN_DRAIN_SECONDS + 5
+        while any(process.is_alive() for process in processes) and time.monotonic() < deadline:
+            self.collect_stats(timeout=0.2)
+        for process in processes:
+            if process.is_alive():
+                process.kill()
+            process.join()
+        self.collect_stats(timeout=0.2)
+        console.print(f"[dim]{self.format_stats()}[/dim]")
+        if self.sock is not None:
+            self.sock.close()
+
+    def format_stats(self):
+        """สถิติรวมของทุก worker (รวมตัวที่ปิดไปแล้ว)"""
+        alive = {process.pid for process in list(self.workers.values()) + self.retiring if process.is_alive()}
+        # worker ที่ปิดแล้วไม่มีการเชื่อมต่อค้าง
+        total = sum_stats(stats if pid in alive else dict(stats, connections=0) for pid, stats in self.latest.items())
+        alive = sum(process.is_alive() for process in self.workers.values())
+        if not total:
+            return f"All workers ({alive} running): no stats yet"
+        return f"All workers ({alive} running): {server.format_server_stats(total)}"
+
+
+if __name__ == "__main__":
+    args = server.parse_args(workers=True)
+    Supervisor(args.host, args.port, args.workers).run()
+    console.print("[bold red]Server stopped[/bold red]")
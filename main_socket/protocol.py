@@ -0,0 +1,118 @@
+import io
+import os
+import struct
+import wave
+import zlib
+
+# รูปแบบเฟรมเสียงแบบ binary (ข้อความควบคุมยังเป็น JSON)
+#   magic 'AU' | version | format | flags | channels | seq | utterance | segment | sample_rate | [overlap] | payload
+MAGIC = b'AU'
+VERSION = 1
+HEADER = struct.Struct('!2sBBBBIIII')
+OVERLAP_FIELD = struct.Struct('!I')  # ต่อท้าย header เฉพาะเมื่อมี FLAG_OVERLAP
+
+# รูปแบบของ payload
+FORMAT_PCM16 = 1  # PCM int16 little-endian
+FORMAT_WAV = 2  # ไฟล์ WAV ทั้งไฟล์
+FORMATS = (FORMAT_PCM16, FORMAT_WAV)
+
+# flags
+FLAG_SEGMENT = 0x01  # มีหมายเลขประโยค/ช่วง (utterance, segment)
+FLAG_ZLIB = 0x02  # payload ถูกบีบอัดด้วย zlib
+FLAG_FINAL = 0x04  # ช่วงสุดท้ายของประโยค
+FLAG_STREAM = 0x08  # เสียงต่อเนื่องโหมดสตรีม (server เป็นผู้แบ่งประโยค)
+FLAG_OVERLAP = 0x10  # มีจำนวน sample ต้นช่วงที่ซ้ำกับท้ายช่วงก่อนหน้า (ช่วงที่ต่อจากการบังคับตัด)
+
+# ขนาดสูงสุดของ payload หลังคลายการบีบอัด (กันเฟรมเล็กที่ขยายจนหน่วยความจำหมด)
+MAX_PCM_BYTES = int(os.environ.get('AUDIO_FRAME_MAX_PCM_BYTES', 8 * 1024 * 1024))
+
+
+class ProtocolError(ValueError):
+    """เฟรมเสียงไม่ถูกต้อง (magic/version/ขนาดไม่ตรง)"""
+
+
+def encode_audio_frame(payload, sample_rate, seq=0, utterance=None, segment=None, fmt=FORMAT_PCM16,
+                       channels=1, final=False, stream=False, overlap=0, compress=False):
+    """สร้างเฟรมเสียงแบบ binary จาก PCM (bytes, memoryview หรือ numpy array)
+
+    overlap คือจำนวน sample ต้นช่วงที่ซ้ำกับท้ายช่วงก่อนหน้า (0 = ไม่มี)
+    """
+    payload = memoryview(payload).cast('B')
+    flags = (FLAG_FINAL if final else 0) | (FLAG_STREAM if stream else 0) | (FLAG_OVERLAP if overlap else 0)
+    if utterance is not None and segment is not None:
+        flags |= FLAG_SEGMENT
+    if compress:
+        payload = zlib.compress(payload, 1)
+        flags |= FLAG_ZLIB
+    header = HEADER.pack(MAGIC, VERSION, fmt, flags, channels, seq, utterance or 0, segment or 0, int(sample_rate))
+    if overlap:
+        header += OVERLAP_FIELD.pack(int(overlap))
+    return header + payload
+
+
+def frame_ids(frame):
+    """อ่านเฉพาะหมายเลขอ้างอิง (seq และ utterance/segment ถ้ามี) จาก header คืนค่า None ถ้า header อ่านไม่ได้"""
+    if len(frame) < HEADER.size:
+        return None
+    magic, version, _, flags, _, seq, utterance, segment, _ = HEADER.unpack_from(frame)
+    if magic != MAGIC or version != VERSION:
+        return None
+    ids = {'seq': seq}
+    if flags & FLAG_SEGMENT:
+        ids.update(utterance=utterance, segment=segment)
+    return ids
+
+
+def decode_audio_frame(frame):
+    """แยกเฟรมเสียงแบบ binary คืนค่า dict (type, seq, sample_rate, sample_width, pcm และ utterance/segment ถ้ามี)"""
+    if len(frame) < HEADER.size:
+        raise ProtocolError(f"Audio frame too short ({len(frame)} bytes)")
+    magic, version, fmt, flags, channels, seq, utterance, segment, sample_rate = HEADER.unpack_from(frame)
+    if magic != MAGIC:
+        raise ProtocolError("Not an audio frame")
+    if version != VERSION:
+        raise ProtocolError(f"Unsupported audio frame version {version}")
+    if fmt not in FORMATS:
+        raise ProtocolError(f"Unsupported audio format {fmt}")
+
+    offset = HEADER.size
+    overlap = 0
+    if flags & FLAG_OVERLAP:
+        if len(frame) < offset + OVERLAP_FIELD.size:
+            raise ProtocolError("Audio frame too short for overlap field")
+        overlap, = OVERLAP_FIELD.unpack_from(frame, offset)
+        offset += OVERLAP_FIELD.size
+    payload = memoryview(frame)[offset:]
+    if flags & FLAG_ZLIB:
+        decompressor = zlib.decompressobj()
+        try:
+            payload = decompressor.decompress(payload, MAX_PCM_BYTES)
+        except zlib.error as e:
+            raise ProtocolError(f"Bad compressed payload: {e}") from e
+        if decompressor.unconsumed_tail:
+            raise ProtocolError(f"Compressed payload exceeds {MAX_PCM_BYTES} bytes")
+    sample_width = 2
+    if fmt == FORMAT_WAV:
+        try:
+            with wave.open(io.BytesIO(payload), 'rb') as wf:
+                sample_rate, channels, sample_width = wf.getframerate(), wf.getnchannels(), wf.getsampwidth()
+                payload = wf.readframes(wf.getnframes())
+        except (wave.Error, EOFError) as e:
+            raise ProtocolError(f"Bad WAV payload: {e}") from e
+    if channels != 1:
+        raise ProtocolError("Only mono audio is supported")
+
+    data = {
+        'type': 'audio',
+        'seq': seq,
+        'sample_rate': sample_rate,
+        'sample_width': sample_width,
+        'final': bool(flags & FLAG_FINAL),
+        'stream': bool(flags & FLAG_STREAM),
+        'overlap': overlap,
+        'pcm': bytes(payload),
+    }
+    if flags & FLAG_SEGMENT:
+        data['utterance'] = utterance
+        data['segment'] = segment
+    return data
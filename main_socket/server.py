@@ -2,13 +2,47 @@ import asyncio
 import websockets
 import json
 import speech_recognition as sr
-import requests
-import wave
 import tempfile
 import os
 import base64
+import hashlib
+import signal
+import sys
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from rich.console import Console
 
+# ให้ import โมดูลที่ใช้ร่วมกันจากโฟลเดอร์หลักของโปรเจกต์ได้
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pcm_buffer import wav_bytes, wav_bytes_to_audio_data, DEBUG_DUMP_DIR
+from protocol import decode_audio_frame, frame_ids, ProtocolError
+from streaming import StreamSegmenter
+from admission import AdmissionController, format_admission_stats
+from stage_queue import AsyncStageQueue, format_queue_stats
+from mymemory_client import MyMemoryClient, TranslationError
+from translation_cache import TranslationCache, cache_key, format_cache_stats
+from translation_memory import TranslationMemory, format_memory_stats
+from singleflight import SingleFlight, format_flight_stats
+from translation_batcher import TranslationBatcher, format_batch_stats
+
+# ที่อยู่ที่รอรับการเชื่อมต่อ (กำหนดผ่าน --host/--port ได้)
+SERVER_HOST = os.environ.get('SERVER_HOST', 'localhost')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', 8765))
+SHUTDOWN_DRAIN_SECONDS = float(os.environ.get('SHUTDOWN_DRAIN_SECONDS', 10))  # เวลารอ client ที่ยังเชื่อมต่ออยู่เมื่อถูกสั่งหยุด
+SERVER_STATS_INTERVAL = float(os.environ.get('SERVER_STATS_INTERVAL', 30))  # รายงานสถิติให้ launcher ทุกกี่วินาที
+
+# คิวเสียงของแต่ละการเชื่อมต่อ (รับข้อความต่อได้ระหว่างที่ถอดเสียงช่วงก่อนหน้า)
+AUDIO_QUEUE_SIZE = 8
+AUDIO_QUEUE_POLICY = os.environ.get('AUDIO_QUEUE_POLICY', 'coalesce')  # block / drop_oldest / drop_newest / coalesce
+AUDIO_QUEUE_MAX_MB = float(os.environ.get('AUDIO_QUEUE_MAX_MB', 8))
+
+# งานถอดเสียง (blocking) รันใน pool แยกจาก event loop
+RECOGNITION_EXECUTOR = os.environ.get('RECOGNITION_EXECUTOR', 'thread')  # thread / process
+RECOGNITION_WORKERS = int(os.environ.get('RECOGNITION_WORKERS', 8))
+MAX_INFLIGHT = int(os.environ.get('MAX_INFLIGHT', RECOGNITION_WORKERS))  # งานถอดเสียงพร้อมกันทั้งเซิร์ฟเวอร์
+MAX_INFLIGHT_PER_CONNECTION = int(os.environ.get('MAX_INFLIGHT_PER_CONNECTION', 4))  # งานพร้อมกันต่อ client (ผลส่งกลับตามลำดับที่เสร็จ)
+
 # รายการภาษาที่รองรับ
 LANGUAGES = {
     'th': 'Thai',
@@ -27,124 +61,386 @@ SPEECH_LANG_CODES = {
 
 console = Console()
 recognizer = sr.Recognizer()
+# สร้างใน main() เมื่อ event loop เริ่มทำงาน
+executor = None
+inflight = None
+translation_client = None
+translation_cache = None
+translation_memory = None
+translation_batcher = None
+# ตัวนับของ process นี้
+connections_active = 0
+connections_total = 0
+audio_messages = 0
+audio_dropped = 0
+# รวมคำขอแปล/ถอดเสียงที่เหมือนกันซึ่งเกิดพร้อมกัน (เช่น หลาย client ในห้องเดียวกัน) ให้เรียกจริงครั้งเดียว
+translation_flight = SingleFlight('translation')
+recognition_flight = SingleFlight('recognition')
+# การรับงาน: จำนวนการเชื่อมต่อ, โควตาเสียงต่อ client และเพดานงานถอดเสียงที่ค้าง
+admission = AdmissionController(concurrency=MAX_INFLIGHT)
+
+async def translate_upstream(text, source_lang, target_lang):
+    """แปลด้วย MyMemory API (รวมกับข้อความอื่นที่ขอมาพร้อมกันเป็นคำขอเดียว) แล้วเก็บผลลงแคชและ translation memory"""
+    translated = await translation_batcher.translate(text, source_lang, target_lang)
+    translation_cache.put(text, source_lang, target_lang, 'mymemory', translated)
+    translation_memory.add(text, translated, source_lang, target_lang)
+    return translated
 
 async def translate_text(text, source_lang, target_lang):
     """แปลข้อความด้วย MyMemory API (ฟรี)"""
     if source_lang == target_lang:
         return text
     
+    # คำแปลที่เคยแปลแล้ว (ค้นในหน่วยความจำ/SQLite ใช้เวลาไม่ถึงมิลลิวินาที จึงเรียกใน event loop ได้)
+    cached = translation_cache.get(text, source_lang, target_lang, 'mymemory')
+    if cached is not None:
+        return cached
+    
+    # ประโยคที่คล้ายกับที่เคยแปลแล้ว (ต่างกันแค่วรรคตอน ตัวพิมพ์ หรือคำเล็กน้อย)
+    match = translation_memory.lookup(text, source_lang, target_lang)
+    if match is not None:
+        console.print(f"[dim]Translation memory match ({match[1]:.0%}): {match[2]}[/dim]")
+        return match[0]
+    
     try:
-        # ใช้ MyMemory API
-        url = f"https://api.mymemory.translated.net/get?q={text}&langpair={source_lang}|{target_lang}"
-        response = requests.get(url)
-        data = response.json()
-        
-        if "responseStatus" in data and data["responseStatus"] == 200:
-            return data["responseData"]["translatedText"]
-        else:
-            return f"Translation error. Original text: {text}"
+        # ใช้ MyMemory API ผ่าน connection pool ที่ใช้ร่วมกันทุกการเชื่อมต่อ คำขอเดียวกันที่ค้างอยู่จะรอผลร่วมกัน
+        key = cache_key(text, source_lang, target_lang, 'mymemory')
+        return await translation_flight.do(key, translate_upstream, text, source_lang, target_lang)
+    except TranslationError as e:
+        console.print(f"[red]Translation error: {e}[/red]")
+        return f"Translation error. Original text: {text}"
     except Exception as e:
         console.print(f"[red]Translation error: {e}[/red]")
         return f"Translation error. Original text: {text}"
 
-async def transcribe_audio(audio_data, language):
-    """ถอดเสียงเป็นข้อความ"""
-    # สร้างไฟล์ WAV ชั่วคราว
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-        temp_filename = temp_file.name
-    
+def dump_debug_wav(pcm, sample_rate, sample_width):
+    """บันทึกเสียงที่ได้รับเป็นไฟล์ WAV ไว้ดีบัก เฉพาะเมื่อตั้งค่า AUDIO_DEBUG_DUMP_DIR"""
+    os.makedirs(DEBUG_DUMP_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(suffix=".wav", dir=DEBUG_DUMP_DIR, delete=False) as f:
+        f.write(wav_bytes(pcm, sample_rate, 1, sample_width))
+
+def recognize_pcm(pcm, sample_rate, sample_width, language):
+    """ถอดเสียงจาก PCM ในหน่วยความจำ (blocking รันใน executor ต้องเป็นฟังก์ชันระดับโมดูลเพื่อใช้กับ process pool ได้)"""
+    # สร้าง AudioData จาก PCM โดยตรง แล้วถอดเสียงด้วย SpeechRecognition
+    recorded_audio = sr.AudioData(pcm, sample_rate, sample_width)
     try:
-        # แปลงข้อมูล base64 เป็น bytes
-        audio_bytes = base64.b64decode(audio_data)
-        
-        # เขียนลงไฟล์ WAV
-        with open(temp_filename, 'wb') as f:
-            f.write(audio_bytes)
+        speech_lang_code = SPEECH_LANG_CODES[language]
+        text = recognizer.recognize_google(recorded_audio, language=speech_lang_code)
+        return text
+    except sr.UnknownValueError:
+        return ""
+    except sr.RequestError as e:
+        console.print(f"[red]Error with speech recognition service: {e}[/red]")
+        return ""
+
+def create_executor():
+    """สร้าง pool สำหรับงานถอดเสียงตาม RECOGNITION_EXECUTOR"""
+    if RECOGNITION_EXECUTOR == 'process':
+        return ProcessPoolExecutor(max_workers=RECOGNITION_WORKERS)
+    return ThreadPoolExecutor(max_workers=RECOGNITION_WORKERS, thread_name_prefix="recognition")
+
+async def transcribe_audio(data, language):
+    """ถอดเสียงเป็นข้อความจาก PCM ของข้อความเสียง โดยไม่บล็อก event loop"""
+    try:
+        pcm, sample_rate, sample_width = data['pcm'], data['sample_rate'], data['sample_width']
+        if DEBUG_DUMP_DIR:
+            dump_debug_wav(pcm, sample_rate, sample_width)
         
-        # ถอดเสียงด้วย SpeechRecognition
-        with sr.AudioFile(temp_filename) as source:
-            recorded_audio = recognizer.record(source)
-            try:
-                speech_lang_code = SPEECH_LANG_CODES[language]
-                text = recognizer.recognize_google(recorded_audio, language=speech_lang_code)
-                return text
-            except sr.UnknownValueError:
-                return ""
-            except sr.RequestError as e:
-                console.print(f"[red]Error with speech recognition service: {e}[/red]")
-                return ""
+        # เสียงที่เหมือนกันทุกไบต์ซึ่งกำลังถอดอยู่ รอผลร่วมกันแทนการถอดซ้ำ
+        key = (hashlib.sha1(pcm).digest(), sample_rate, sample_width, language)
+        return await recognition_flight.do(key, recognize_in_executor, pcm, sample_rate, sample_width, language)
     except Exception as e:
         console.print(f"[red]Error transcribing audio: {e}[/red]")
         return ""
+
+async def recognize_in_executor(pcm, sample_rate, sample_width, language):
+    """จำกัดงานถอดเสียงพร้อมกันทั้งเซิร์ฟเวอร์ แล้วรันใน executor"""
+    loop = asyncio.get_running_loop()
+    admission.recognition_started()
+    elapsed = None
+    try:
+        async with inflight:
+            started = time.monotonic()
+            text = await loop.run_in_executor(executor, recognize_pcm, pcm, sample_rate, sample_width, language)
+            elapsed = time.monotonic() - started
+            return text
+    finally:
+        # เวลาถอดเสียงใช้ประมาณ retry_after ตอน server รับงานเต็ม
+        admission.recognition_finished(elapsed)
+
+def audio_from_json(data):
+    """แปลงข้อความเสียงแบบเดิม (WAV base64 ใน JSON) เป็นรูปแบบเดียวกับเฟรม binary"""
+    audio_data = wav_bytes_to_audio_data(base64.b64decode(data.pop('audio_data')))
+    data.update(pcm=audio_data.frame_data, sample_rate=audio_data.sample_rate, sample_width=audio_data.sample_width)
+    return data
+
+def merge_audio_messages(last, new):
+    """รวมข้อความเสียงที่เป็นช่วงต่อกันของประโยคเดียวกัน (ใช้กับนโยบาย coalesce) คืนค่า None ถ้ารวมไม่ได้"""
+    last_data, source_lang, target_langs = last
+    data = new[0]
+    if (new[1:] != (source_lang, target_langs) or 'segment' not in data or 'segment' not in last_data
+            or data.get('utterance') != last_data.get('utterance')):
+        return None
+    segments = last_data.get('segments', [last_data['segment']])
+    if (data['segment'] != segments[-1] + 1 or data['sample_rate'] != last_data['sample_rate']
+            or data['sample_width'] != last_data['sample_width']):
+        return None
+    
+    seqs = last_data.get('seqs', [last_data.get('seq')])
+    # ช่วงที่ต่อจากการบังคับตัดขึ้นต้นด้วยเสียงซ้ำกับท้ายช่วงก่อนหน้า ตัดออกไม่ให้คำซ้ำในเสียงที่รวมแล้ว
+    skip = min(data.get('overlap', 0) * data['sample_width'], len(data['pcm']))
+    merged = dict(last_data, pcm=last_data['pcm'] + data['pcm'][skip:], segments=segments + [data['segment']],
+                  seqs=seqs + [data.get('seq')])
+    return merged, source_lang, target_langs
+
+def parse_target_langs(config, default):
+    """ภาษาเป้าหมายจากข้อความตั้งค่า: target_langs (รายการ) หรือ target_lang (ภาษาเดียว) คืนค่า tuple ที่ไม่ซ้ำกัน"""
+    langs = config.get('target_langs', config.get('target_lang'))
+    if langs is None:
+        return default
+    if isinstance(langs, str):
+        langs = langs.split(',')
+    langs = tuple(dict.fromkeys(lang.strip() for lang in langs if lang.strip()))
+    unknown = [lang for lang in langs if lang not in LANGUAGES]
+    if unknown or not langs:
+        raise ValueError(f"Unsupported target language: {', '.join(unknown) or '(none)'}")
+    return langs
+
+def language_names(langs):
+    return ", ".join(LANGUAGES[lang] for lang in langs)
+
+def segment_ids(data, index=0):
+    """หมายเลขอ้างอิงของ client (seq, ประโยค, ช่วงย่อย) สำหรับจับคู่ผลที่ส่งกลับไม่ตามลำดับ
+
+    index คือลำดับของช่วงที่ถูกรวมไว้ในข้อความเดียว (ใช้กับนโยบาย coalesce)
+    """
+    ids = {key: data[key] for key in ('seq', 'utterance', 'segment') if data.get(key) is not None}
+    if index:
+        ids['segment'] = data['segments'][index]
+        ids.pop('seq', None)
+        if data.get('seqs') and data['seqs'][index] is not None:
+            ids['seq'] = data['seqs'][index]
+    return ids
+
+async def handle_audio(websocket, data, source_lang, target_langs):
+    """ถอดเสียงหนึ่งครั้ง แล้วแปลเป็นทุกภาษาเป้าหมายพร้อมกัน ส่งผลของแต่ละภาษากลับทันทีที่แปลเสร็จ"""
+    # ถอดเสียงเป็นข้อความ
+    console.print("[yellow]Transcribing audio...[/yellow]")
+    text = await transcribe_audio(data, source_lang)
+    
+    if text:
+        console.print(f"[green]Transcribed: {text}[/green]")
+        
+        async def translate_and_send(target_lang):
+            translated_text = await translate_text(text, source_lang, target_lang)
+            console.print(f"[blue]Translated ({target_lang}): {translated_text}[/blue]")
+            
+            # ส่งผลลัพธ์กลับไปยัง client พร้อมระบุภาษา
+            await websocket.send(json.dumps({
+                "type": "result",
+                "source_text": text,
+                "translated_text": translated_text,
+                "target_lang": target_lang,
+                **segment_ids(data)
+            }))
+        
+        await asyncio.gather(*(translate_and_send(target_lang) for target_lang in target_langs))
+    else:
+        # ส่งข้อความว่าไม่สามารถถอดเสียงได้
+        await websocket.send(json.dumps({
+            "type": "error",
+            "message": "Could not transcribe audio",
+            **segment_ids(data)
+        }))
+    
+    # ช่วงที่ถูกรวมเข้ามาในคิว ส่งผลว่างกลับไปเพื่อให้ client ต่อข้อความได้ครบ
+    for index in range(1, len(data.get('segments', []))):
+        for target_lang in target_langs:
+            await websocket.send(json.dumps({
+                "type": "result",
+                "source_text": "",
+                "translated_text": "",
+                "target_lang": target_lang,
+                **segment_ids(data, index)
+            }))
+
+async def process_queue(websocket, audio_queue):
+    """ดึงข้อความเสียงจากคิวมาประมวลผล พร้อมกันได้ไม่เกิน MAX_INFLIGHT_PER_CONNECTION รายการต่อ client"""
+    limit = asyncio.Semaphore(MAX_INFLIGHT_PER_CONNECTION)
+    tasks = set()
+    try:
+        while True:
+            await limit.acquire()
+            item = await audio_queue.get()
+            if item is None:
+                limit.release()
+                break
+            task = asyncio.create_task(handle_audio(websocket, *item))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            task.add_done_callback(lambda _: limit.release())
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
     finally:
-        # ลบไฟล์ชั่วคราว
-        if os.path.exists(temp_filename):
-            os.unlink(temp_filename)
+        # ถูกยกเลิกเมื่อ client ปิดการเชื่อมต่อ ยกเลิกงานที่ยังค้างด้วย
+        for task in tasks:
+            task.cancel()
+
+def audio_seconds(data):
+    return len(data['pcm']) / (data['sample_rate'] * data['sample_width'])
+
+async def send_busy(websocket, message, retry_after, data=None):
+    """แจ้ง client ว่า server ไม่รับงานนี้ ให้ลองใหม่หลัง retry_after วินาที"""
+    await websocket.send(json.dumps({
+        "type": "busy",
+        "message": message,
+        "retry_after": round(retry_after, 1),
+        **(segment_ids(data) if data else {})
+    }))
+
+async def admit_audio(websocket, client, data):
+    """ตรวจว่ารับข้อความเสียงนี้ได้หรือไม่ (server ไม่เต็ม และ client ยังไม่เกินโควตา) ถ้าไม่รับจะแจ้ง busy"""
+    retry_after = admission.check_capacity()
+    if retry_after is not None:
+        await send_busy(websocket, "Server overloaded", retry_after, data)
+        return False
+    retry_after = admission.take_audio(client, audio_seconds(data))
+    if retry_after is not None:
+        await send_busy(websocket, "Audio rate limit exceeded", retry_after, data)
+        return False
+    return True
+
+async def enqueue_audio(websocket, audio_queue, item):
+    """เข้าคิวเสียงพร้อมภาษาในขณะนั้น งานที่ถูกทิ้งเพราะคิวเต็มต้องแจ้ง client"""
+    global audio_messages, audio_dropped
+    audio_messages += 1
+    dropped = await audio_queue.put(item)
+    audio_dropped += len(dropped)
+    for dropped_data, _, _ in dropped:
+        console.print(f"[yellow]{format_queue_stats(audio_queue.stats())}[/yellow]")
+        await websocket.send(json.dumps({
+            "type": "error",
+            "message": "Audio dropped: server overloaded",
+            **segment_ids(dropped_data)
+        }))
+        for index in range(1, len(dropped_data.get('segments', []))):
+            await websocket.send(json.dumps({
+                "type": "error",
+                "message": "Audio dropped: server overloaded",
+                **segment_ids(dropped_data, index)
+            }))
 
 async def process_audio(websocket):
     """ฟังก์ชันหลักสำหรับจัดการการเชื่อมต่อ WebSocket"""
+    global connections_active, connections_total
+    client = admission.client_key(websocket.remote_address)
+    retry_after = admission.open_session(client)
+    if retry_after is not None:
+        # การเชื่อมต่อเต็ม ปฏิเสธตั้งแต่ต้นแทนการทำให้ทุก client ช้าลง
+        console.print(f"[yellow]Rejected connection from {client}: too many sessions[/yellow]")
+        await send_busy(websocket, "Too many sessions", retry_after)
+        await websocket.close(1013, "Try again later")
+        return
+    
     console.print("[green]Client connected[/green]")
+    connections_active += 1
+    connections_total += 1
     
+    audio_queue = AsyncStageQueue('audio', AUDIO_QUEUE_SIZE, AUDIO_QUEUE_POLICY, int(AUDIO_QUEUE_MAX_MB * 1024 * 1024),
+                                  size_of=lambda item: len(item[0]['pcm']), merge=merge_audio_messages)
+    worker = None
+    stream = None  # ตัวแบ่งประโยคของโหมดสตรีม สร้างเมื่อได้รับเฟรมสตรีมแรก
+    throttled_until = 0.0  # โหมดสตรีมแจ้ง busy ครั้งเดียวต่อช่วงที่ถูกจำกัด ไม่ใช่ทุกเฟรม
     try:
         # รับข้อมูลการกำหนดค่า (เช่น ภาษาต้นทาง, ภาษาเป้าหมาย)
         config_message = await websocket.recv()
         config = json.loads(config_message)
         
         source_lang = config.get('source_lang', 'en')
-        target_lang = config.get('target_lang', 'th')
+        try:
+            target_langs = parse_target_langs(config, ('th',))
+        except ValueError as e:
+            await websocket.send(json.dumps({"type": "error", "message": str(e)}))
+            return
         
-        console.print(f"[blue]Translation settings: {LANGUAGES[source_lang]} -> {LANGUAGES[target_lang]}[/blue]")
+        console.print(f"[blue]Translation settings: {LANGUAGES[source_lang]} -> {language_names(target_langs)}[/blue]")
         
         # ส่งข้อความยืนยันกลับไปยัง client
         await websocket.send(json.dumps({
             "type": "config_confirm",
-            "message": f"Server ready, translating {LANGUAGES[source_lang]} to {LANGUAGES[target_lang]}"
+            "message": f"Server ready, translating {LANGUAGES[source_lang]} to {language_names(target_langs)}",
+            "target_langs": list(target_langs)
         }))
         
+        # ประมวลผลเสียงใน task แยก เพื่อให้รับข้อความถัดไปได้ระหว่างรอถอดเสียง
+        worker = asyncio.create_task(process_queue(websocket, audio_queue))
+        
         # ประมวลผลข้อมูลเสียงที่ส่งมา
         while True:
             try:
-                # รับข้อมูลเสียง
+                # รับข้อมูลเสียง (เฟรม binary) หรือข้อความควบคุม (JSON)
                 message = await websocket.recv()
-                data = json.loads(message)
+                if isinstance(message, bytes):
+                    try:
+                        data = decode_audio_frame(message)
+                    except ProtocolError as e:
+                        # แนบหมายเลขของเฟรมถ้า header อ่านได้ ไม่เช่นนั้น client จะล้างเฟรมที่ค้างนานที่สุดแทน
+                        await websocket.send(json.dumps({"type": "error", "code": "bad_frame",
+                                                         "message": f"Bad audio frame: {e}", **(frame_ids(message) or {})}))
+                        continue
+                else:
+                    data = json.loads(message)
+                    if data["type"] == "audio":
+                        # client รุ่นเดิมส่ง WAV แบบ base64 ใน JSON
+                        data = audio_from_json(data)
                 
                 # ตรวจสอบประเภทข้อความ
-                if data["type"] == "audio":
-                    audio_data = data["audio_data"]
-                    
-                    # ถอดเสียงเป็นข้อความ
-                    console.print("[yellow]Transcribing audio...[/yellow]")
-                    text = await transcribe_audio(audio_data, source_lang)
-                    
-                    if text:
-                        console.print(f"[green]Transcribed: {text}[/green]")
-                        
-                        # แปลข้อความ
-                        translated_text = await translate_text(text, source_lang, target_lang)
-                        console.print(f"[blue]Translated: {translated_text}[/blue]")
-                        
-                        # ส่งผลลัพธ์กลับไปยัง client
-                        await websocket.send(json.dumps({
-                            "type": "result",
-                            "source_text": text,
-                            "translated_text": translated_text
-                        }))
-                    else:
-                        # ส่งข้อความว่าไม่สามารถถอดเสียงได้
-                        await websocket.send(json.dumps({
-                            "type": "error",
-                            "message": "Could not transcribe audio"
-                        }))
+                if data["type"] == "audio" and data.get('stream'):
+                    # โหมดสตรีม: หักโควตาตามเฟรมที่ได้รับ เฟรมที่เกินโควตาถูกทิ้ง
+                    retry_after = admission.take_audio(client, audio_seconds(data))
+                    if retry_after is not None:
+                        if time.monotonic() >= throttled_until:
+                            throttled_until = time.monotonic() + retry_after
+                            await send_busy(websocket, "Audio rate limit exceeded", retry_after)
+                        continue
+                    # server แบ่งประโยคเอง ส่งถอดเสียงทันทีที่ช่วงเสียงปิด
+                    if stream is None or stream.rate != data['sample_rate']:
+                        stream = StreamSegmenter(data['sample_rate'])
+                    for segment_data in stream.feed(np.frombuffer(data['pcm'], dtype=np.int16)):
+                        retry_after = admission.check_capacity()
+                        if retry_after is not None:
+                            await send_busy(websocket, "Server overloaded", retry_after, segment_data)
+                            continue
+                        await enqueue_audio(websocket, audio_queue, (segment_data, source_lang, target_langs))
+                
+                elif data["type"] == "audio":
+                    if await admit_audio(websocket, client, data):
+                        await enqueue_audio(websocket, audio_queue, (data, source_lang, target_langs))
+                
+                elif data["type"] == "stream_end":
+                    # client หยุดบันทึก ปิดประโยคที่ค้างอยู่
+                    if stream is not None:
+                        for segment_data in stream.finish():
+                            retry_after = admission.check_capacity()
+                            if retry_after is not None:
+                                await send_busy(websocket, "Server overloaded", retry_after, segment_data)
+                                continue
+                            await enqueue_audio(websocket, audio_queue, (segment_data, source_lang, target_langs))
                 
                 elif data["type"] == "config_update":
                     # อัปเดตการตั้งค่า
+                    try:
+                        target_langs = parse_target_langs(data, target_langs)
+                    except ValueError as e:
+                        await websocket.send(json.dumps({"type": "error", "message": str(e)}))
+                        continue
                     source_lang = data.get('source_lang', source_lang)
-                    target_lang = data.get('target_lang', target_lang)
-                    console.print(f"[blue]Updated settings: {LANGUAGES[source_lang]} -> {LANGUAGES[target_lang]}[/blue]")
+                    console.print(f"[blue]Updated settings: {LANGUAGES[source_lang]} -> {language_names(target_langs)}[/blue]")
                     
                     await websocket.send(json.dumps({
                         "type": "config_confirm",
-                        "message": f"Settings updated: {LANGUAGES[source_lang]} -> {LANGUAGES[target_lang]}"
+                        "message": f"Settings updated: {LANGUAGES[source_lang]} -> {language_names(target_langs)}",
+                        "target_langs": list(target_langs)
                     }))
                 
             except websockets.exceptions.ConnectionClosed:
@@ -157,22 +453,134 @@ async def process_audio(websocket):
         console.print(f"[red]Error: {e}[/red]")
         import traceback
         traceback.print_exc()
+    finally:
+        # client ปิดการเชื่อมต่อแล้ว งานที่ค้างในคิวไม่มีที่ส่งผลกลับ
+        connections_active -= 1
+        admission.close_session(client)
+        if worker is not None:
+            worker.cancel()
+        console.print(f"[dim]{format_queue_stats(audio_queue.stats())}[/dim]")
+        for flight in (recognition_flight, translation_flight):
+            console.print(f"[dim]{format_flight_stats(flight.stats())}[/dim]")
 
-async def main():
-    # เริ่ม WebSocket server
-    server_host = "localhost"
-    server_port = 8765
+def server_stats():
+    """ตัวนับของ process นี้ (ทุกค่าเป็นผลรวมได้ launcher จึงรวมข้าม worker ด้วยการบวก)"""
+    stats = {
+        'connections': connections_active,
+        'connections_total': connections_total,
+        'audio_messages': audio_messages,
+        'audio_dropped': audio_dropped,
+        'recognition_calls': recognition_flight.calls,
+        'recognition_coalesced': recognition_flight.coalesced,
+        'translation_calls': translation_flight.calls,
+        'translation_coalesced': translation_flight.coalesced,
+        'upstream_calls': translation_batcher.upstream_calls if translation_batcher else 0,
+        'cache_hits': 0,
+        'cache_misses': 0,
+        'memory_hits': 0,
+        'sessions_rejected': admission.sessions_rejected,
+        'audio_throttled': admission.audio_throttled,
+        'overload_rejected': admission.overload_rejected,
+    }
+    if translation_cache is not None:
+        cache = translation_cache.stats()
+        stats.update(cache_hits=cache['hits'], cache_misses=cache['misses'])
+    if translation_memory is not None:
+        memory = translation_memory.stats()
+        stats['memory_hits'] = memory['exact_hits'] + memory['fuzzy_hits']
+    return stats
+
+def format_server_stats(stats):
+    """ข้อความสรุปสถิติของเซิร์ฟเวอร์หนึ่งบรรทัด"""
+    return (f"{stats['connections']} connections ({stats['connections_total']} total), "
+            f"{stats['audio_messages']} audio messages ({stats['audio_dropped']} dropped), "
+            f"{stats['recognition_calls']} recognitions ({stats['recognition_coalesced']} coalesced), "
+            f"{stats['translation_calls']} translations in {stats['upstream_calls']} upstream calls, "
+            f"cache {stats['cache_hits']} hits / {stats['cache_misses']} misses, {stats['memory_hits']} memory hits, "
+            f"busy replies: {stats['sessions_rejected']} sessions / {stats['audio_throttled']} throttled / "
+            f"{stats['overload_rejected']} overloaded")
+
+async def report_stats(report):
+    """ส่งสถิติให้ launcher เป็นระยะ"""
+    while True:
+        await asyncio.sleep(SERVER_STATS_INTERVAL)
+        report(server_stats())
+
+async def main(host=SERVER_HOST, port=SERVER_PORT, sock=None, reuse_port=False, report=None):
+    """รัน WebSocket server จนถูกยกเลิกหรือได้รับ SIGTERM
+
+    เมื่อรันหลาย worker (launcher.py) แต่ละ worker จะผูกพอร์ตเดียวกันด้วย SO_REUSEPORT (reuse_port)
+    หรือรับ socket ที่ launcher เปิดไว้ให้ (sock) และส่งสถิติกลับผ่าน report
+    """
+    global executor, inflight, translation_client, translation_cache, translation_memory, translation_batcher
     
+    # เริ่ม WebSocket server
+    server_address = f"ws://{host}:{port}" if sock is None else "ws://%s:%d" % sock.getsockname()[:2]
     console.print(f"[bold green]Starting Speech Translation Server[/bold green]")
-    console.print(f"[yellow]Listening on ws://{server_host}:{server_port}[/yellow]")
+    console.print(f"[yellow]Listening on {server_address}[/yellow]")
+    console.print(f"[blue]Recognition: {RECOGNITION_WORKERS} {RECOGNITION_EXECUTOR} workers, "
+                  f"{MAX_INFLIGHT} in flight ({MAX_INFLIGHT_PER_CONNECTION} per connection)[/blue]")
+    
+    # SIGTERM: หยุดรับการเชื่อมต่อใหม่ แล้วรอ client ที่ค้างอยู่ก่อนปิด
+    loop = asyncio.get_running_loop()
+    stop = loop.create_future()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, lambda: stop.done() or stop.set_result(None))
+    except (NotImplementedError, RuntimeError):
+        pass  # Windows หรือไม่ได้อยู่ใน main thread
     
-    async with websockets.serve(process_audio, server_host, server_port):
-        await asyncio.Future()  # รันตลอดไป
+    executor = create_executor()
+    inflight = asyncio.Semaphore(MAX_INFLIGHT)
+    translation_client = MyMemoryClient()
+    translation_batcher = TranslationBatcher(translation_client.translate)
+    translation_cache = TranslationCache()
+    translation_memory = TranslationMemory()
+    reporter = asyncio.create_task(report_stats(report)) if report else None
+    try:
+        if sock is not None:
+            serving = websockets.serve(process_audio, sock=sock)
+        else:
+            serving = websockets.serve(process_audio, host, port, reuse_port=reuse_port or None)
+        async with serving as server:
+            await stop
+            console.print(f"[yellow]Shutting down, waiting up to {SHUTDOWN_DRAIN_SECONDS:.0f} s for "
+                          f"{connections_active} connections[/yellow]")
+            server.close(close_connections=False)
+            try:
+                await asyncio.wait_for(server.wait_closed(), SHUTDOWN_DRAIN_SECONDS)
+            except asyncio.TimeoutError:
+                server.close()
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+        await translation_client.close()
+        console.print(f"[dim]{format_batch_stats(translation_batcher.stats())}[/dim]")
+        console.print(f"[dim]{format_cache_stats(translation_cache.stats())}[/dim]")
+        console.print(f"[dim]{format_memory_stats(translation_memory.stats())}[/dim]")
+        for flight in (recognition_flight, translation_flight):
+            console.print(f"[dim]{format_flight_stats(flight.stats())}[/dim]")
+        console.print(f"[dim]{format_admission_stats(admission.stats())}[/dim]")
+        if report:
+            report(server_stats())
+        translation_cache.close()
+
+def parse_args(argv=None, workers=False):
+    """อาร์กิวเมนต์ที่อยู่ของเซิร์ฟเวอร์ (launcher เพิ่ม --workers)"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Speech translation WebSocket server")
+    parser.add_argument('--host', default=SERVER_HOST, help="address to bind (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help="port to bind (default: %(default)s)")
+    if workers:
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="number of worker processes (default: CPU count, %(default)s)")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        asyncio.run(main())
+        asyncio.run(main(args.host, args.port))
     except KeyboardInterrupt:
         console.print("[bold red]Server stopped by user[/bold red]")
     except Exception as e:
-        console.print(f"[bold red]Server error: {e}[/bold red]")
\ No newline at end of file
+        console.print(f"[bold red]Server error: {e}[/bold red]")
@@ -0,0 +1,95 @@
+import os
+import sys
+import numpy as np
+
+# ให้ import โมดูลที่ใช้ร่วมกันจากโฟลเดอร์หลักของโปรเจกต์ได้
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vad import VoiceActivityDetector
+from endpointing import Endpointer
+from segmenter import SpeechSegmenter
+from pcm_buffer import PCMAccumulator, SAMPLE_WIDTH
+
+# ค่าเริ่มต้นของการแบ่งประโยคฝั่ง server (โหมดสตรีม) ปรับที่ server ที่เดียวมีผลกับทุก client
+STREAM_ENDPOINT_PRESET = os.environ.get('STREAM_ENDPOINT_PRESET', 'interactive')  # interactive / balanced / dictation
+MAX_UTTERANCE_SECONDS = 10  # ประโยคที่ยาวเกินนี้จะถูกปิดทันที
+IDLE_SECONDS = 2.0  # ถ้าเงียบนานเท่านี้โดยยังไม่มีเสียงพูด เริ่มบัฟเฟอร์ใหม่ (เก็บเฉพาะ pre-roll)
+PREROLL_SECONDS = 0.3  # เสียงก่อนหน้าที่ยกไปยังประโยคถัดไป ไม่ให้พยางค์แรกหาย
+TRIM_PAD_MS = 150  # ช่วงเผื่อหัวท้ายเมื่อตัดเสียงเงียบ
+
+
+class StreamSegmenter:
+    """แบ่งเสียงที่ client ส่งมาต่อเนื่องเป็นประโยคและช่วงย่อยด้วย VAD/endpointing เดียวกับฝั่ง client
+
+    feed() คืนค่าข้อความเสียง (dict รูปแบบเดียวกับเฟรมเสียงที่ถอดรหัสแล้ว) ของช่วงที่ปิดแล้ว พร้อมส่งถอดเสียงทันที
+    """
+    def __init__(self, rate, preset=STREAM_ENDPOINT_PRESET, max_seconds=MAX_UTTERANCE_SECONDS):
+        self.rate = int(rate)
+        self.max_samples = int(max_seconds * self.rate)
+        self.idle_samples = int(IDLE_SECONDS * self.rate)
+        self.preroll = int(PREROLL_SECONDS * self.rate)
+        self.pad = int(self.rate * TRIM_PAD_MS / 1000)
+        # VAD และประวัติการหยุดของผู้พูดใช้ร่วมกันทุกประโยคของ session
+        self.vad = VoiceActivityDetector(self.rate)
+        self.turn = Endpointer(self.vad.frame_seconds, preset,
+                               hangover_seconds=self.vad.hangover_frames * self.vad.frame_seconds)
+        self.segmenter = SpeechSegmenter(self.rate, self.vad.frame_length)
+        self.utterance = 1  # หมายเลขประโยคปัจจุบัน เพิ่มเฉพาะเมื่อประโยคปิดจริง
+        self.utterances_closed = 0
+        self.pcm = None
+        self._start()
+
+    def _start(self, carry=None):
+        """เริ่มประโยคใหม่ (carry = เสียงท้ายประโยคก่อนหน้าที่ใช้เป็น pre-roll)"""
+        self.pcm = PCMAccumulator(self.rate, 1, initial_seconds=MAX_UTTERANCE_SECONDS)
+        self.vad.reset(keep_noise_floor=True)
+        self.turn.reset()
+        self.segmenter.reset()
+        if carry is not None and len(carry):
+            self._process(carry)
+
+    def feed(self, samples):
+        """รับ PCM int16 ชุดใหม่ คืนค่ารายการช่วงเสียงที่ปิดแล้ว"""
+        closed = self._process(np.asarray(samples, dtype=np.int16))
+        if self.turn.ended or len(self.pcm) >= self.max_samples:
+            closed += self.finish()
+        elif not self.turn.heard_speech and len(self.pcm) > self.idle_samples:
+            # ยังไม่มีเสียงพูด ไม่ต้องเก็บเสียงเงียบไว้ทั้งหมด
+            self._start(self.pcm.samples()[-self.preroll:].copy())
+        return closed
+
+    def _process(self, samples):
+        self.pcm.append(samples)
+        decisions = self.vad.process(samples)
+        self.turn.update(decisions)
+        span = self.turn.speech_span(self.vad.frame_length)
+        return [self._message(segment, span) for segment in self.segmenter.update(decisions)]
+
+    def finish(self):
+        """ปิดประโยคปัจจุบัน (เมื่อจบประโยค หรือ client หยุดบันทึก) คืนค่าช่วงสุดท้ายถ้ามีเสียงพูดค้างอยู่"""
+        closed = []
+        span = self.turn.speech_span(self.vad.frame_length)
+        if span is not None:
+            final_segment = self.segmenter.finish(min(span[1] + self.pad, len(self.pcm)))
+            if final_segment:
+                closed.append(self._message(final_segment, span, final=True))
+            self.utterances_closed += 1
+            self.utterance += 1
+        self._start(self.pcm.samples()[-self.preroll:].copy())
+        return closed
+
+    def _message(self, segment, span, final=False):
+        seq, start, end, overlap = segment
+        # ช่วงแรกตัดเสียงเงียบหน้าประโยคออก เหลือไว้เฉพาะช่วงเผื่อ
+        if span:
+            trimmed = max(start, span[0] - self.pad)
+            overlap, start = max(overlap - (trimmed - start), 0), trimmed
+        return {
+            'type': 'audio',
+            'pcm': self.pcm.samples()[start:end].tobytes(),
+            'sample_rate': self.rate,
+            'sample_width': SAMPLE_WIDTH,
+            'utterance': self.utterance,
+            'segment': seq,
+            'final': final,
+            'overlap': overlap,
+        }
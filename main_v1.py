@@ -1,11 +1,7 @@
 import speech_recognition as sr
 import os
-import tempfile
 import time
 import pyaudio
-import wave
-import numpy as np
-from googletrans import Translator
 from rich.console import Console
 from rich.panel import Panel
 from rich.layout import Layout
@@ -13,14 +9,28 @@ from rich.prompt import Prompt
 from rich.table import Table
 import sys
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+from audio_capture import AudioSession, format_overrun_report
+from vad import VoiceActivityDetector, trim_silence
+from segmenter import SpeechSegmenter, ResultStitcher
+from endpointing import Endpointer
+from pcm_buffer import PCMAccumulator, pcm_volume, to_audio_data, dump_wav
+from resample import TARGET_RATE
+from translation_service import TranslationService
+from translation_batcher import format_batch_stats
+from translation_cache import TranslationCache, format_cache_stats
+from translation_memory import TranslationMemory, format_memory_stats
 
 # ปรับ Settings
 CHUNK = 1024
 FORMAT = pyaudio.paInt16
 CHANNELS = 1
-RATE = 44100
+DEVICE_RATE = 44100  # อัตราที่อุปกรณ์จับเสียง (ใช้ค่าเริ่มต้นของอุปกรณ์)
+RATE = int(os.environ.get('TARGET_SAMPLE_RATE', TARGET_RATE))  # อัตราหลังแปลง ใช้ในการประมวลผลและถอดเสียง
 RECORD_SECONDS = 5
-SILENCE_THRESHOLD = 300  # ลดค่าลงเพื่อรับเสียงได้ง่ายขึ้น
+ENDPOINT_PRESET = os.environ.get('ENDPOINT_PRESET', 'balanced')  # interactive / balanced / dictation
+TRIM_PAD_MS = 150  # ช่วงเผื่อหัวท้ายเมื่อตัดเสียงเงียบก่อนส่งถอดเสียง
+RECOGNITION_WORKERS = 3  # จำนวนช่วงเสียงที่ถอดเสียงพร้อมกันได้
 
 # ซ่อน ALSA warnings
 stderr_backup = sys.stderr
@@ -32,7 +42,17 @@ recognizer = sr.Recognizer()
 recognizer.energy_threshold = 300
 recognizer.dynamic_energy_threshold = True 
 recognizer.pause_threshold = 0.8  # ทนกับการหยุดชั่วคราวมากขึ้น
-translator = Translator()
+# บริการแปลภาษา (event loop และ HTTP session ของ translator ใช้ร่วมกันทุกประโยค)
+translation_service = TranslationService()
+# แคชคำแปล (ประโยคที่พูดซ้ำบ่อยไม่ต้องส่งไปแปลใหม่)
+translation_cache = TranslationCache()
+# translation memory สำหรับประโยคที่คล้ายกับที่เคยแปลแล้ว
+translation_memory = TranslationMemory()
+# VAD และตัวตัดสินจบประโยคที่ใช้ร่วมกันระหว่างประโยค (สร้างเมื่อเริ่มบันทึกครั้งแรก)
+vad_engine = None
+endpointer = None
+# thread pool สำหรับถอดเสียงช่วงย่อยพร้อมกันระหว่างที่ผู้ใช้ยังพูดอยู่
+recognition_pool = ThreadPoolExecutor(max_workers=RECOGNITION_WORKERS)
 
 # รายการภาษาที่รองรับ (เฉพาะ 4 ภาษา)
 LANGUAGES = {
@@ -64,15 +84,14 @@ def check_internet_connection():
         console.print("[yellow]Could not verify internet connection.[/yellow]")
         return True
 
-def select_audio_device():
+def select_audio_device(session):
     """ให้ผู้ใช้เลือกอุปกรณ์อินพุต"""
-    global RATE
+    global DEVICE_RATE
     
     console = Console()
-    p = None
+    p = session.p
     
     try:
-        p = pyaudio.PyAudio()
         
         # แสดงรายการอุปกรณ์อินพุตทั้งหมด
         input_devices = []
@@ -106,16 +125,16 @@ def select_audio_device():
                 console.print(f"Using default device: {default_dev['name']}")
                 
                 # อ่านค่า sample rate ที่รองรับ
-                RATE = int(default_dev['defaultSampleRate'])
-                console.print(f"Using device's default sample rate: {RATE}")
+                DEVICE_RATE = int(default_dev['defaultSampleRate'])
+                console.print(f"Using device's default sample rate: {DEVICE_RATE} Hz (resampled to {RATE} Hz)")
             else:
                 device_index = input_devices[int(choice)]
                 device_info = p.get_device_info_by_index(device_index)
                 console.print(f"Selected device: {device_info['name']}")
                 
                 # อ่านค่า sample rate ที่รองรับ
-                RATE = int(device_info['defaultSampleRate'])
-                console.print(f"Using device's default sample rate: {RATE}")
+                DEVICE_RATE = int(device_info['defaultSampleRate'])
+                console.print(f"Using device's default sample rate: {DEVICE_RATE} Hz (resampled to {RATE} Hz)")
             
             return device_index
         except (ValueError, IndexError):
@@ -124,9 +143,6 @@ def select_audio_device():
     except Exception as e:
         console.print(f"[red]Error initializing audio: {e}[/red]")
         return None
-    finally:
-        if p:
-            p.terminate()
 
 def select_languages():
     """ให้ผู้ใช้เลือกภาษาต้นทางและภาษาเป้าหมาย"""
@@ -160,35 +176,56 @@ def select_languages():
     
     return source_lang, target_lang
 
-def is_silent(data_chunk, threshold=SILENCE_THRESHOLD):
-    """ตรวจสอบว่าชัพข้อมูลเสียงเงียบหรือไม่"""
-    audio_data = np.frombuffer(data_chunk, dtype=np.int16)
-    volume_norm = np.mean(np.abs(audio_data))
-    return volume_norm < threshold
+def get_vad(rate):
+    """คืนค่า VAD ที่ใช้ร่วมกันระหว่างประโยค (สร้างใหม่เมื่อ sample rate เปลี่ยน)"""
+    global vad_engine
+    if vad_engine is None or vad_engine.rate != int(rate):
+        vad_engine = VoiceActivityDetector(rate)
+    else:
+        vad_engine.reset(keep_noise_floor=True)
+    return vad_engine
+
+def get_endpointer(vad):
+    """คืนค่าตัวตัดสินจบประโยคที่เก็บประวัติช่วงหยุดของผู้พูดไว้ระหว่างประโยค"""
+    global endpointer
+    if endpointer is None or endpointer.frame_seconds != vad.frame_seconds:
+        endpointer = Endpointer(vad.frame_seconds, ENDPOINT_PRESET,
+                                hangover_seconds=vad.hangover_frames * vad.frame_seconds)
+    else:
+        endpointer.reset()
+    return endpointer
+
+def dispatch_segment(on_segment, pcm, segment, span, sample_width):
+    """ส่งช่วงเสียงที่ปิดแล้วให้ on_segment โดยตัดเสียงเงียบหน้าช่วงแรกออกตามช่วงพูดของประโยค"""
+    seq, start, end, _ = segment
+    if span:
+        start = max(start, span[0] - int(RATE * TRIM_PAD_MS / 1000))
+    on_segment(seq, to_audio_data(pcm.samples()[start:end], RATE, sample_width))
+
+def record_audio(session, device_index, on_segment=None):
+    """บันทึกเสียงจากอุปกรณ์ที่เลือก (ใช้สตรีมที่เปิดค้างไว้ใน session)
 
-def record_audio(device_index):
-    """บันทึกเสียงจากอุปกรณ์ที่เลือก"""
+    ถ้าระบุ on_segment(seq, audio_data) จะส่งเสียงพูดยาวเป็นช่วงย่อยทันทีที่แต่ละช่วงปิด
+    """
     global RATE
     
     console = Console()
-    p = None
-    stream = None
     
     try:
-        p = pyaudio.PyAudio()
-        
-        # เปิดสตรีมเสียง
-        console.print(f"\n[bold]Opening audio stream with Sample Rate: {RATE} Hz[/bold]")
-        stream = p.open(format=FORMAT,
-                      channels=CHANNELS,
-                      rate=RATE,
-                      input=True,
-                      input_device_index=device_index,
-                      frames_per_buffer=CHUNK)
+        # ใช้สตรีมเดิมถ้าเปิดอยู่แล้ว และเริ่มอ่านรวมเสียง pre-roll
+        if session.engine is None:
+            console.print(f"\n[bold]Opening audio stream with Sample Rate: {DEVICE_RATE} Hz[/bold]")
+        session.open(DEVICE_RATE, device_index, channels=CHANNELS, chunk=CHUNK, target_rate=RATE)
+        engine = session.begin_utterance()
         
         console.print("\n[bold]Listening...[/bold] Speak now (press Ctrl+C to stop)")
-        frames = []
-        silence_counter = 0
+        # จองบัฟเฟอร์สำหรับทั้งประโยคไว้ล่วงหน้า (สูงสุด 15 วินาที)
+        pcm = PCMAccumulator(RATE, CHANNELS, initial_seconds=15)
+        # VAD ใช้ร่วมกันทุกประโยค เพื่อเก็บประวัติ noise floor ไว้
+        vad = get_vad(RATE)
+        turn = get_endpointer(vad)
+        segmenter = SpeechSegmenter(RATE, vad.frame_length) if on_segment else None
+        sample_width = session.p.get_sample_size(FORMAT)
         has_sound = False
         
         # แสดงระดับเสียง (volume meter)
@@ -207,12 +244,14 @@ def record_audio(device_index):
         try:
             # เพิ่มเวลาบันทึกเป็น 15 วินาที
             for i in range(0, int(RATE / CHUNK * 15)):  
-                data = stream.read(CHUNK, exception_on_overflow=False)
-                frames.append(data)
+                # อ่านเสียงลงบัฟเฟอร์ของประโยคโดยตรง
+                data = engine.read(CHUNK, out=pcm.reserve(CHUNK))
+                if data is None:
+                    continue
+                data = pcm.commit(len(data))
                 
-                # แสดงระดับเสียง
-                audio_data = np.frombuffer(data, dtype=np.int16)
-                volume = np.mean(np.abs(audio_data))
+                # แสดงระดับเสียง (คำนวณบน view ไม่คัดลอกข้อมูล)
+                volume = pcm_volume(data)
                 meter_index = min(int(volume / 500 * len(volume_meter)), len(volume_meter) - 1)
                 
                 # แสดงค่าระดับเสียง
@@ -220,98 +259,79 @@ def record_audio(device_index):
                     meter_display = "".join(volume_meter[:meter_index + 1])
                     console.print(f"Volume: {volume:.2f} {meter_display}", end="\r")
                 
-                # ตรวจสอบว่าเสียงเงียบหรือไม่
-                if volume > SILENCE_THRESHOLD:
-                    has_sound = True
-                    silence_counter = 0
-                else:
-                    silence_counter += 1
-                    
-                    # หยุดหลังจาก 2 วินาทีที่เงียบ ถ้าเคยได้ยินเสียงมาก่อน
-                    if has_sound and silence_counter > int(RATE / CHUNK * 2.0):
-                        console.print("\n[green]Silence detected, stopping recording...[/green]")
-                        break
+                # ตรวจสอบเสียงพูดด้วย VAD และตัดสินจบประโยคตามจังหวะการหยุดของผู้พูด
+                decisions = vad.process(data)
+                ended = turn.update(decisions)
+                has_sound = turn.heard_speech
+                
+                # ส่งช่วงที่ปิดแล้วไปถอดเสียงทันที ไม่ต้องรอจนพูดจบ
+                if segmenter:
+                    for segment in segmenter.update(decisions):
+                        dispatch_segment(on_segment, pcm, segment, turn.speech_span(vad.frame_length), sample_width)
+                
+                if ended:
+                    console.print(f"\n[green]End of speech detected after {turn.decision_latency:.2f} s of silence, stopping recording...[/green]")
+                    break
                         
         except KeyboardInterrupt:
             console.print("\n[yellow]Recording stopped manually[/yellow]")
         
+        # แจ้งเตือนถ้ามีเสียงหายระหว่างบันทึก
+        overrun_report = format_overrun_report(engine.stats())
+        if overrun_report:
+            console.print(f"\n[yellow]{overrun_report}[/yellow]")
+        
         if not has_sound:
             console.print("[yellow]No sound detected during recording.[/yellow]")
             return None
             
         console.print("[bold]Processing audio...[/bold]")
         
-        # บันทึกลงไฟล์ชั่วคราว
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as fp:
-            sound_file = fp.name
-            
-        # เปิดและบันทึกไฟล์
-        with wave.open(sound_file, 'wb') as wf:
-            wf.setnchannels(CHANNELS)
-            wf.setsampwidth(p.get_sample_size(FORMAT))
-            wf.setframerate(RATE)
-            wf.writeframes(b''.join(frames))
+        # ตัดเสียงเงียบหัวท้ายออก เหลือเฉพาะช่วงที่พูด
+        span = turn.speech_span(vad.frame_length)
+        speech, trim = trim_silence(pcm.samples(), RATE, span, pad_ms=TRIM_PAD_MS)
+        if trim['seconds_saved'] > 0:
+            console.print(f"[green]Trimmed {trim['seconds_saved']:.2f} s of silence ({trim['bytes_saved']} bytes saved)[/green]")
+        
+        # ส่งช่วงสุดท้ายที่ยังค้างอยู่
+        if segmenter:
+            final_segment = segmenter.finish(min(span[1] + int(RATE * TRIM_PAD_MS / 1000), len(pcm)))
+            if final_segment:
+                dispatch_segment(on_segment, pcm, final_segment, span, sample_width)
+        
+        # สร้าง AudioData จากบัฟเฟอร์ในหน่วยความจำโดยตรง ไม่ต้องเขียนไฟล์ชั่วคราว
+        audio_data = to_audio_data(speech, RATE, sample_width)
         
-        # ตรวจสอบว่าไฟล์มีขนาดที่เหมาะสม
-        file_size = os.path.getsize(sound_file)
-        file_duration = len(frames) * CHUNK / RATE
-        console.print(f"[green]Audio saved: {file_size} bytes, {file_duration:.2f} seconds[/green]")
+        # ตรวจสอบว่าเสียงมีขนาดที่เหมาะสม
+        audio_size = speech.nbytes
+        audio_duration = trim['trimmed_seconds']
+        console.print(f"[green]Audio captured: {audio_size} bytes, {audio_duration:.2f} seconds[/green]")
         
-        if file_size < 1000:  # ไฟล์เล็กเกินไป
-            console.print("[yellow]Warning: Audio file is very small, might not contain audible speech.[/yellow]")
+        if audio_size < 1000:  # เสียงสั้นเกินไป
+            console.print("[yellow]Warning: Audio is very short, might not contain audible speech.[/yellow]")
         
-        return sound_file
+        # บันทึก WAV ไว้ดีบักเฉพาะเมื่อตั้งค่า AUDIO_DEBUG_DUMP_DIR
+        dump_path = dump_wav(speech, RATE, CHANNELS)
+        if dump_path:
+            console.print(f"[dim]Debug WAV saved: {dump_path}[/dim]")
+        
+        return audio_data
     
     except Exception as e:
         console.print(f"[red]Error recording audio: {e}[/red]")
         import traceback
         traceback.print_exc()
         return None
-    finally:
-        # Cleanup
-        if stream:
-            try:
-                stream.stop_stream()
-                stream.close()
-            except:
-                pass
-        if p:
-            try:
-                p.terminate()
-            except:
-                pass
 
-def transcribe_audio(audio_file, language):
+def transcribe_audio(audio_data, language):
     """ถอดเสียงเป็นข้อความด้วย SpeechRecognition"""
     console = Console()
     console.print(f"[bold]Transcribing audio in {LANGUAGES[language]}...[/bold]")
     
     try:
-        with sr.AudioFile(audio_file) as source:
-            # ปรับความดังของไฟล์เสียง
-            audio_data = recognizer.record(source)
-            
-            # ใช้ Google Speech Recognition API
-            speech_lang_code = SPEECH_LANG_CODES[language]
-            
-            # ลองทั้งกับและไม่กับตัวช่วยวิธีต่างๆ
-            try:
-                # ลองด้วยวิธีปกติ
-                text = recognizer.recognize_google(audio_data, language=speech_lang_code)
-                return text
-            except sr.UnknownValueError:
-                # ถ้าไม่ได้ ลองอีกครั้งด้วยการปรับค่าพลังงานต่ำลง
-                recognizer.energy_threshold = 200
-                recognizer.dynamic_energy_threshold = False
-                
-                try:
-                    console.print("[yellow]Trying with lower energy threshold...[/yellow]")
-                    audio_data = recognizer.record(source)  # อ่านใหม่
-                    text = recognizer.recognize_google(audio_data, language=speech_lang_code)
-                    return text
-                except sr.UnknownValueError:
-                    console.print("[yellow]Could not understand audio[/yellow]")
-                    return "Could not understand audio"
+        # ใช้ Google Speech Recognition API
+        speech_lang_code = SPEECH_LANG_CODES[language]
+        return recognizer.recognize_google(audio_data, language=speech_lang_code)
     except sr.UnknownValueError:
         console.print("[yellow]Could not understand audio[/yellow]")
         return "Could not understand audio"
@@ -322,6 +342,39 @@ def transcribe_audio(audio_file, language):
         console.print(f"[red]Error: {e}[/red]")
         return f"Error: {e}"
 
+def transcribe_segments(source_lang):
+    """ถอดเสียงช่วงย่อยแบบขนานระหว่างที่ยังพูดอยู่ คืนค่า (on_segment สำหรับ record_audio, ฟังก์ชันรอผลรวม)"""
+    console = Console()
+    preview = ResultStitcher()
+    jobs = []
+
+    def clean(text):
+        if text == "Could not understand audio" or text.startswith("Error:"):
+            return ""
+        return text
+
+    def on_result(seq, job):
+        # แสดงข้อความทันทีที่ช่วงก่อนหน้าครบตามลำดับ
+        for ready in preview.add(seq, clean(job.result())):
+            console.print(f"[cyan]... {ready}[/cyan]")
+
+    def on_segment(seq, audio_data):
+        job = recognition_pool.submit(transcribe_audio, audio_data, source_lang)
+        job.add_done_callback(lambda job, seq=seq: on_result(seq, job))
+        jobs.append((seq, job))
+
+    def collect(audio_data):
+        if not jobs:
+            return transcribe_audio(audio_data, source_lang)
+        # รวมผลใน thread นี้หลัง wait เพราะ done-callback อาจยังไม่ทำงานตอนที่ wait คืนค่า
+        wait([job for _, job in jobs])
+        stitcher = ResultStitcher()
+        for seq, job in jobs:
+            stitcher.add(seq, clean(job.result()))
+        return stitcher.text or "Could not understand audio"
+
+    return on_segment, collect
+
 def translate_text(text, source_lang, target_lang):
     """แปลข้อความด้วย Google Translate"""
     console = Console()
@@ -331,19 +384,23 @@ def translate_text(text, source_lang, target_lang):
     if source_lang == target_lang:
         return text
     
+    cached = translation_cache.get(text, source_lang, target_lang, 'googletrans')
+    if cached is not None:
+        return cached
+    
+    # ประโยคที่คล้ายกับที่เคยแปลแล้ว (ต่างกันแค่วรรคตอน ตัวพิมพ์ หรือคำเล็กน้อย)
+    match = translation_memory.lookup(text, source_lang, target_lang)
+    if match is not None:
+        console.print(f"[dim]Translation memory match ({match[1]:.0%}): {match[2]}[/dim]")
+        return match[0]
+    
     try:
-        # ใช้ await กับ coroutine
-        translation = translator.translate(text, src=source_lang, dest=target_lang)
-        
-        # ตรวจสอบว่าเป็น coroutine หรือไม่
-        if hasattr(translation, '__await__'):
-            # นี่เป็นการแก้ไขชั่วคราวเท่านั้น เพราะไม่สามารถใช้ await นอก async function
-            console.print("[yellow]Translation API returned coroutine - using fallback method[/yellow]")
-            return f"Translation unavailable. Original text: {text}"
-        
-        return translation.text
+        translated = translation_service.translate(text, source_lang, target_lang)
+        translation_cache.put(text, source_lang, target_lang, 'googletrans', translated)
+        translation_memory.add(text, translated, source_lang, target_lang)
+        return translated
     except Exception as e:
-        console.print(f"[red]Translation error: {e}[/red]")
+        console.print(f"[red]Translation error: {e or e.__class__.__name__}[/red]")
         return f"Translation error. Original text: {text}"
 
 def display_results(source_text, target_text, source_lang, target_lang):
@@ -370,7 +427,7 @@ def display_results(source_text, target_text, source_lang, target_lang):
     console.print(layout)
 
 def main():
-    global RATE  # ประกาศก่อนการใช้งาน
+    global DEVICE_RATE  # ประกาศก่อนการใช้งาน
     
     # คืนค่า stderr (เพื่อให้เห็นข้อผิดพลาดที่แท้จริง)
     sys.stderr = stderr_backup
@@ -384,13 +441,22 @@ def main():
     if not has_internet:
         console.print("[red]Warning: No internet connection. Speech recognition and translation may not work.[/red]")
     
+    session = None
     try:
+        # เปิด PortAudio ครั้งเดียวใช้ตลอดทั้งโปรแกรม
+        session = AudioSession()
+        
         # เลือกอุปกรณ์อินพุต
-        device_index = select_audio_device()
+        device_index = select_audio_device(session)
         
         if device_index is None:
             console.print("[yellow]Using default audio device[/yellow]")
         
+        # เปิดสตรีมค้างไว้ล่วงหน้า เพื่อให้มีเสียง pre-roll ก่อนเริ่มพูด
+        # จับเสียงที่อัตราของอุปกรณ์ แล้วแปลงเป็น RATE ตั้งแต่ขั้นจับเสียง
+        console.print(f"\n[bold]Opening audio stream with Sample Rate: {DEVICE_RATE} Hz -> {RATE} Hz[/bold]")
+        session.open(DEVICE_RATE, device_index, channels=CHANNELS, chunk=CHUNK, target_rate=RATE)
+        
         # เลือกภาษา
         source_lang, target_lang = select_languages()
         console.print(f"\n[bold]Selected languages:[/bold] {LANGUAGES[source_lang]} -> {LANGUAGES[target_lang]}")
@@ -405,11 +471,13 @@ def main():
         
         while True:
             # บันทึกเสียง
-            audio_file = record_audio(device_index)
+            # ช่วงเสียงที่ปิดแล้วจะถูกส่งไปถอดเสียงทันทีระหว่างที่ยังบันทึกอยู่
+            on_segment, collect_transcript = transcribe_segments(source_lang)
+            audio_data = record_audio(session, device_index, on_segment)
             
-            if audio_file and os.path.exists(audio_file) and os.path.getsize(audio_file) > 0:
-                # ถอดเสียงเป็นข้อความ
-                source_text = transcribe_audio(audio_file, source_lang)
+            if audio_data is not None and len(audio_data.frame_data) > 0:
+                # รอผลถอดเสียงของช่วงที่เหลือแล้วต่อเป็นข้อความเดียว
+                source_text = collect_transcript(audio_data)
                 
                 if source_text and source_text != "Could not understand audio":
                     # แปลข้อความ
@@ -423,12 +491,6 @@ def main():
                     console.print("2. Speak louder and more clearly")
                     console.print("3. Reduce background noise")
                     console.print("4. Try a different language")
-                
-                # ลบไฟล์ชั่วคราว
-                try:
-                    os.unlink(audio_file)
-                except:
-                    pass
             else:
                 console.print("[red]Failed to record or save audio.[/red]")
             
@@ -443,6 +505,15 @@ def main():
         console.print(f"\n[red]Error: {e}[/red]")
         import traceback
         traceback.print_exc()
+    finally:
+        if session:
+            session.close()
+        translation_service.close()
+        if translation_service.batcher is not None:
+            console.print(f"[dim]{format_batch_stats(translation_service.batcher.stats())}[/dim]")
+        console.print(f"[dim]{format_cache_stats(translation_cache.stats())}[/dim]")
+        console.print(f"[dim]{format_memory_stats(translation_memory.stats())}[/dim]")
+        translation_cache.close()
     
     console.print("[green]Thank you for using Speech Translation Tool![/green]")
 
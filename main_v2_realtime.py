@@ -1,18 +1,27 @@
 import speech_recognition as sr
 import os
-import tempfile
 import time
 import pyaudio
-import wave
-import numpy as np
-from googletrans import Translator
 from rich.console import Console
 from rich.panel import Panel
 from rich.layout import Layout
 from rich.prompt import Prompt
 from rich.table import Table
 import sys
+import threading
 import requests
+from audio_capture import AudioSession, format_overrun_report
+from vad import VoiceActivityDetector, trim_silence
+from segmenter import SpeechSegmenter, ResultStitcher
+from endpointing import Endpointer
+from pcm_buffer import PCMAccumulator, pcm_volume, to_audio_data, join_audio_data, dump_wav
+from resample import TARGET_RATE
+from translation_service import TranslationService
+from translation_batcher import format_batch_stats
+from translation_cache import TranslationCache, format_cache_stats
+from translation_memory import TranslationMemory, format_memory_stats
+from stage_queue import StageQueue, format_queue_stats
+from device_cache import DeviceCache, probe_rates, PROBE_RATES
 import psutil  # สำหรับติดตาม CPU และ RAM
 import time    # สำหรับจับเวลา
 
@@ -20,9 +29,19 @@ import time    # สำหรับจับเวลา
 CHUNK = 1024
 FORMAT = pyaudio.paInt16
 CHANNELS = 1
-RATE = 16000  # ลดค่าลงเพื่อความเข้ากันได้มากขึ้น
+DEVICE_RATE = 16000  # อัตราที่อุปกรณ์จับเสียง (เลือกจากอัตราที่อุปกรณ์รองรับ)
+RATE = int(os.environ.get('TARGET_SAMPLE_RATE', TARGET_RATE))  # อัตราหลังแปลง ใช้ในการประมวลผลและถอดเสียง
 RECORD_SECONDS = 5
-SILENCE_THRESHOLD = 300
+ENDPOINT_PRESET = os.environ.get('ENDPOINT_PRESET', 'balanced')  # interactive / balanced / dictation
+TRIM_PAD_MS = 150  # ช่วงเผื่อหัวท้ายเมื่อตัดเสียงเงียบก่อนส่งถอดเสียง
+RECOGNITION_WORKERS = int(os.environ.get('RECOGNITION_WORKERS', 3))  # จำนวน worker ถอดเสียงพร้อมกัน
+TRANSLATION_WORKERS = int(os.environ.get('TRANSLATION_WORKERS', 2))  # จำนวน worker แปลภาษาพร้อมกัน
+STAGE_QUEUE_SIZE = 16  # ความจุของคิวระหว่างขั้น
+# นโยบายเมื่อคิวเต็ม: block / drop_oldest / drop_newest / coalesce (รวมช่วงเสียงที่ต่อกันของประโยคเดียวกัน)
+RECOGNITION_QUEUE_POLICY = os.environ.get('RECOGNITION_QUEUE_POLICY', 'coalesce')
+TRANSLATION_QUEUE_POLICY = os.environ.get('TRANSLATION_QUEUE_POLICY', 'block')
+QUEUE_MAX_MB = float(os.environ.get('QUEUE_MAX_MB', 32))  # เพดานหน่วยความจำของเสียงที่ค้างในคิว
+DRAIN_TIMEOUT = 10  # เวลาสูงสุด (วินาที) ที่รอให้งานค้างเสร็จตอนปิดโปรแกรม
 
 # ซ่อน ALSA warnings
 stderr_backup = sys.stderr
@@ -33,7 +52,15 @@ recognizer = sr.Recognizer()
 recognizer.energy_threshold = 300
 recognizer.dynamic_energy_threshold = True 
 recognizer.pause_threshold = 0.8
-translator = Translator()
+# บริการแปลภาษา (event loop และ HTTP session ของ translator ใช้ร่วมกันทุกประโยค)
+translation_service = TranslationService()
+# แคชคำแปล (ประโยคที่พูดซ้ำบ่อยไม่ต้องส่งไปแปลใหม่)
+translation_cache = TranslationCache()
+# translation memory สำหรับประโยคที่คล้ายกับที่เคยแปลแล้ว
+translation_memory = TranslationMemory()
+# VAD และตัวตัดสินจบประโยคที่ใช้ร่วมกันระหว่างประโยค (สร้างเมื่อเริ่มบันทึกครั้งแรก)
+vad_engine = None
+endpointer = None
 
 console = Console()
 
@@ -57,21 +84,39 @@ class PerformanceMonitor:
     """คลาสสำหรับติดตามประสิทธิภาพของโปรแกรม"""
     def __init__(self):
         self.process = psutil.Process(os.getpid())
+        # เรียกครั้งแรกเพื่อตั้งจุดอ้างอิง ครั้งต่อไปใช้ interval=None ได้โดยไม่ต้องหน่วงรอ
+        self.process.cpu_percent(interval=None)
         self.metrics = {
             'recording': {'time': 0, 'cpu': 0, 'ram': 0},
             'transcription': {'time': 0, 'cpu': 0, 'ram': 0},
             'translation': {'time': 0, 'cpu': 0, 'ram': 0},
             'total': {'time': 0, 'cpu': 0, 'ram': 0}
         }
-        self.start_time = None
-        self.current_step = None
+        # ขั้นตอนที่กำลังวัดแยกตาม thread เพื่อให้แต่ละขั้นของ pipeline วัดพร้อมกันได้
+        self._local = threading.local()
+    
+    @property
+    def current_step(self):
+        return getattr(self._local, 'current_step', None)
+    
+    @current_step.setter
+    def current_step(self, step):
+        self._local.current_step = step
+    
+    @property
+    def start_time(self):
+        return getattr(self._local, 'start_time', None)
+    
+    @start_time.setter
+    def start_time(self, value):
+        self._local.start_time = value
     
     def start_monitoring(self, step):
         """เริ่มติดตามประสิทธิภาพสำหรับขั้นตอนที่ระบุ"""
         self.current_step = step
         self.start_time = time.time()
         # บันทึกค่า CPU และ RAM เริ่มต้น
-        self.metrics[step]['cpu_start'] = self.process.cpu_percent(interval=0.1)
+        self.metrics[step]['cpu_start'] = self.process.cpu_percent(interval=None)
         self.metrics[step]['ram_start'] = self.process.memory_info().rss / 1024 / 1024  # MB
     
     def end_monitoring(self):
@@ -84,7 +129,7 @@ class PerformanceMonitor:
         self.metrics[self.current_step]['time'] = end_time - self.start_time
         
         # วัดค่า CPU และ RAM อีกครั้ง
-        self.metrics[self.current_step]['cpu_end'] = self.process.cpu_percent(interval=0.1)
+        self.metrics[self.current_step]['cpu_end'] = self.process.cpu_percent(interval=None)
         self.metrics[self.current_step]['ram_end'] = self.process.memory_info().rss / 1024 / 1024  # MB
         
         # คำนวณค่าเฉลี่ย
@@ -109,6 +154,11 @@ class PerformanceMonitor:
         """จบการติดตามประสิทธิภาพรวม"""
         self.end_monitoring()
     
+    def record_total(self, seconds):
+        """บันทึกเวลารวมของประโยค (ตั้งแต่เริ่มพูดจนแสดงผล) ที่วัดจากภายนอก"""
+        ram = self.process.memory_info().rss / 1024 / 1024  # MB
+        self.metrics['total'].update(time=seconds, cpu=self.process.cpu_percent(interval=None), ram=ram)
+    
     def get_performance_table(self):
         """สร้างตารางแสดงประสิทธิภาพ"""
         table = Table(title="Performance Metrics")
@@ -144,67 +194,70 @@ def check_internet_connection():
         console.print("[yellow]Could not verify internet connection.[/yellow]")
         return True
 
-def show_supported_sample_rates(device_index=None):
-    """แสดงอัตราการสุ่มตัวอย่างที่รองรับ"""
-    global RATE
-    p = pyaudio.PyAudio()
+def show_supported_sample_rates(session, device_index=None, cache=None, refresh=False):
+    """แสดงอัตราการสุ่มตัวอย่างที่รองรับ และเลือกอัตราที่ใช้จับเสียง (ใช้ผลจากแคชถ้ามี ตรวจใหม่เมื่อ refresh)"""
+    global DEVICE_RATE
+    p = session.p
+    if device_index is None:
+        try:
+            device_index = p.get_default_input_device_info()['index']
+        except IOError:
+            console.print("[red]No default input device available.[/red]")
+            return []
+    
     try:
-        if device_index is None:
-            try:
-                device_index = p.get_default_input_device_info()['index']
-            except IOError:
-                console.print("[red]No default input device available.[/red]")
-                return []
+        device_info = p.get_device_info_by_index(device_index)
+        console.print(f"[bold]Device information:[/bold]")
+        console.print(f"Name: {device_info['name']}")
+        console.print(f"Max input channels: {device_info['maxInputChannels']}")
+        console.print(f"Default sample rate: {device_info['defaultSampleRate']}")
         
-        try:
-            device_info = p.get_device_info_by_index(device_index)
-            console.print(f"[bold]Device information:[/bold]")
-            console.print(f"Name: {device_info['name']}")
-            console.print(f"Max input channels: {device_info['maxInputChannels']}")
-            console.print(f"Default sample rate: {device_info['defaultSampleRate']}")
-            
-            # ทดสอบอัตราการสุ่มตัวอย่างที่รองรับ
-            rates = [8000, 11025, 16000, 22050, 32000, 44100, 48000]
-            supported_rates = []
-            
+        # ตรวจอัตราการสุ่มตัวอย่างที่รองรับ (ไม่ต้องเปิดสตรีม และใช้ผลจากแคชถ้าชุดอุปกรณ์ไม่เปลี่ยน)
+        probe_options = {'channels': CHANNELS, 'sample_format': FORMAT}
+        if cache is not None:
+            supported_rates, from_cache = cache.supported_rates(device_index, refresh=refresh, **probe_options)
+        else:
+            supported_rates, from_cache = probe_rates(p, device_index, **probe_options), False
+        
+        if from_cache:
+            console.print("[yellow]Using cached sample rates for this device[/yellow]")
+        else:
             console.print("[yellow]Testing supported sample rates...[/yellow]")
-            for rate in rates:
-                try:
-                    stream = p.open(format=FORMAT,
-                                 channels=CHANNELS,
-                                 rate=rate,
-                                 input=True,
-                                 input_device_index=device_index,
-                                 frames_per_buffer=CHUNK,
-                                 start=False)
-                    stream.close()
-                    supported_rates.append(rate)
-                    console.print(f"[green]{rate} Hz - Supported[/green]")
-                except:
-                    console.print(f"[red]{rate} Hz - Not supported[/red]")
-            
-            if supported_rates:
-                # ใช้อัตราต่ำสุดที่รองรับ
-                RATE = min(supported_rates)
-                console.print(f"[bold green]Setting sample rate to {RATE} Hz[/bold green]")
-            
-            return supported_rates
-        except Exception as e:
-            console.print(f"[red]Error getting device info: {e}[/red]")
-            return []
-    finally:
-        p.terminate()
+        for rate in PROBE_RATES:
+            if rate in supported_rates:
+                console.print(f"[green]{rate} Hz - Supported[/green]")
+            else:
+                console.print(f"[red]{rate} Hz - Not supported[/red]")
+        
+        # ใช้ค่าที่เปิดสตรีมได้สำเร็จครั้งก่อนถ้ามี
+        known_good = cache.known_good(device_index) if cache is not None and not refresh else None
+        if known_good:
+            DEVICE_RATE = known_good['rate']
+            console.print(f"[bold green]Capturing at {DEVICE_RATE} Hz (last known good), resampled to {RATE} Hz[/bold green]")
+        elif supported_rates:
+            DEVICE_RATE = pick_capture_rate(supported_rates, int(device_info['defaultSampleRate']))
+            console.print(f"[bold green]Capturing at {DEVICE_RATE} Hz, resampled to {RATE} Hz[/bold green]")
+        
+        return supported_rates
+    except Exception as e:
+        console.print(f"[red]Error getting device info: {e}[/red]")
+        return []
+
+def pick_capture_rate(supported_rates, default_rate):
+    """เลือกอัตราจับเสียง: ใช้ค่าเริ่มต้นของอุปกรณ์ถ้ารองรับ ไม่เช่นนั้นใช้อัตราต่ำสุดที่ไม่ต่ำกว่า RATE (ไม่ลดคุณภาพก่อนแปลง)"""
+    if default_rate in supported_rates:
+        return default_rate
+    high_enough = [rate for rate in supported_rates if rate >= RATE]
+    return min(high_enough) if high_enough else max(supported_rates)
 
-def select_audio_device():
+def select_audio_device(session, cache=None):
     """ให้ผู้ใช้เลือกอุปกรณ์อินพุต"""
-    global RATE
+    global DEVICE_RATE
     
     console.print("\n[bold]Detecting audio devices...[/bold]")
-    p = None
+    p = session.p
     
     try:
-        p = pyaudio.PyAudio()
-        
         # แสดงรายการอุปกรณ์อินพุตทั้งหมด
         input_devices = []
         console.print("\n[bold]Available input devices:[/bold]")
@@ -253,10 +306,10 @@ def select_audio_device():
                 console.print(f"Selected device: {device_info['name']}")
             
             # ตรวจสอบอัตราการสุ่มตัวอย่างที่รองรับ
-            supported_rates = show_supported_sample_rates(device_index)
+            supported_rates = show_supported_sample_rates(session, device_index, cache)
             if not supported_rates:
                 console.print("[yellow]Could not determine supported sample rates, using 16000 Hz.[/yellow]")
-                RATE = 16000
+                DEVICE_RATE = 16000
             
             return device_index
         except (ValueError, IndexError) as e:
@@ -265,9 +318,6 @@ def select_audio_device():
     except Exception as e:
         console.print(f"[red]Error initializing audio: {e}[/red]")
         return None
-    finally:
-        if p:
-            p.terminate()
 
 def select_languages():
     """ให้ผู้ใช้เลือกภาษาต้นทางและภาษาเป้าหมาย"""
@@ -301,38 +351,62 @@ def select_languages():
     
     return source_lang, target_lang
 
-def is_silent(data_chunk, threshold=SILENCE_THRESHOLD):
-    """ตรวจสอบว่าชัพข้อมูลเสียงเงียบหรือไม่"""
-    audio_data = np.frombuffer(data_chunk, dtype=np.int16)
-    volume_norm = np.mean(np.abs(audio_data))
-    return volume_norm < threshold
+def get_vad(rate):
+    """คืนค่า VAD ที่ใช้ร่วมกันระหว่างประโยค (สร้างใหม่เมื่อ sample rate เปลี่ยน)"""
+    global vad_engine
+    if vad_engine is None or vad_engine.rate != int(rate):
+        vad_engine = VoiceActivityDetector(rate)
+    else:
+        vad_engine.reset(keep_noise_floor=True)
+    return vad_engine
 
-def record_audio(device_index):
-    """บันทึกเสียงจากอุปกรณ์ที่เลือก"""
+def get_endpointer(vad):
+    """คืนค่าตัวตัดสินจบประโยคที่เก็บประวัติช่วงหยุดของผู้พูดไว้ระหว่างประโยค"""
+    global endpointer
+    if endpointer is None or endpointer.frame_seconds != vad.frame_seconds:
+        endpointer = Endpointer(vad.frame_seconds, ENDPOINT_PRESET,
+                                hangover_seconds=vad.hangover_frames * vad.frame_seconds)
+    else:
+        endpointer.reset()
+    return endpointer
+
+def dispatch_segment(on_segment, pcm, segment, span, sample_width):
+    """ส่งช่วงเสียงที่ปิดแล้วให้ on_segment โดยตัดเสียงเงียบหน้าช่วงแรกออกตามช่วงพูดของประโยค"""
+    seq, start, end, overlap = segment
+    if span:
+        trimmed = max(start, span[0] - int(RATE * TRIM_PAD_MS / 1000))
+        overlap, start = max(overlap - (trimmed - start), 0), trimmed
+    on_segment(seq, to_audio_data(pcm.samples()[start:end], RATE, sample_width), overlap)
+
+def record_audio(session, device_index, on_segment=None, stop_event=None):
+    """บันทึกเสียงจากอุปกรณ์ที่เลือก (ใช้สตรีมที่เปิดค้างไว้ใน session)
+
+    ถ้าระบุ on_segment(seq, audio_data, overlap) จะส่งเสียงพูดยาวเป็นช่วงย่อยทันทีที่แต่ละช่วงปิด
+    (overlap = จำนวน sample ต้นช่วงที่ซ้ำกับท้ายช่วงก่อนหน้า)
+    ถ้าระบุ stop_event จะหยุดบันทึกทันทีเมื่อ event ถูก set
+    """
     global RATE
     
     console = Console()
-    p = None
-    stream = None
     
     try:
         # เริ่มติดตามประสิทธิภาพ
         performance.start_monitoring('recording')
         
-        p = pyaudio.PyAudio()
-        
-        # เปิดสตรีมเสียง
-        console.print(f"\n[bold]Opening audio stream with Sample Rate: {RATE} Hz[/bold]")
-        stream = p.open(format=FORMAT,
-                      channels=CHANNELS,
-                      rate=RATE,
-                      input=True,
-                      input_device_index=device_index,
-                      frames_per_buffer=CHUNK)
+        # ใช้สตรีมเดิมถ้าเปิดอยู่แล้ว และเริ่มอ่านรวมเสียง pre-roll
+        if session.engine is None:
+            console.print(f"\n[bold]Opening audio stream with Sample Rate: {DEVICE_RATE} Hz[/bold]")
+        session.open(DEVICE_RATE, device_index, channels=CHANNELS, chunk=CHUNK, target_rate=RATE)
+        engine = session.begin_utterance()
         
         console.print("\n[bold]Listening...[/bold] Speak now (press Ctrl+C to stop)")
-        frames = []
-        silence_counter = 0
+        # จองบัฟเฟอร์สำหรับทั้งประโยคไว้ล่วงหน้า (สูงสุด 15 วินาที)
+        pcm = PCMAccumulator(RATE, CHANNELS, initial_seconds=15)
+        # VAD ใช้ร่วมกันทุกประโยค เพื่อเก็บประวัติ noise floor ไว้
+        vad = get_vad(RATE)
+        turn = get_endpointer(vad)
+        segmenter = SpeechSegmenter(RATE, vad.frame_length) if on_segment else None
+        sample_width = session.p.get_sample_size(FORMAT)
         has_sound = False
         
         # แสดงระดับเสียง (volume meter)
@@ -351,12 +425,17 @@ def record_audio(device_index):
         try:
             # เพิ่มเวลาบันทึกเป็น 15 วินาที
             for i in range(0, int(RATE / CHUNK * 15)):  
-                data = stream.read(CHUNK, exception_on_overflow=False)
-                frames.append(data)
+                if stop_event is not None and stop_event.is_set():
+                    break
                 
-                # แสดงระดับเสียง
-                audio_data = np.frombuffer(data, dtype=np.int16)
-                volume = np.mean(np.abs(audio_data))
+                # อ่านเสียงลงบัฟเฟอร์ของประโยคโดยตรง
+                data = engine.read(CHUNK, out=pcm.reserve(CHUNK))
+                if data is None:
+                    continue
+                data = pcm.commit(len(data))
+                
+                # แสดงระดับเสียง (คำนวณบน view ไม่คัดลอกข้อมูล)
+                volume = pcm_volume(data)
                 meter_index = min(int(volume / 500 * len(volume_meter)), len(volume_meter) - 1)
                 
                 # แสดงค่าระดับเสียง
@@ -364,21 +443,28 @@ def record_audio(device_index):
                     meter_display = "".join(volume_meter[:meter_index + 1])
                     console.print(f"Volume: {volume:.2f} {meter_display}", end="\r")
                 
-                # ตรวจสอบว่าเสียงเงียบหรือไม่
-                if volume > SILENCE_THRESHOLD:
-                    has_sound = True
-                    silence_counter = 0
-                else:
-                    silence_counter += 1
-                    
-                    # หยุดหลังจาก 2 วินาทีที่เงียบ ถ้าเคยได้ยินเสียงมาก่อน
-                    if has_sound and silence_counter > int(RATE / CHUNK * 2.0):
-                        console.print("\n[green]Silence detected, stopping recording...[/green]")
-                        break
+                # ตรวจสอบเสียงพูดด้วย VAD และตัดสินจบประโยคตามจังหวะการหยุดของผู้พูด
+                decisions = vad.process(data)
+                ended = turn.update(decisions)
+                has_sound = turn.heard_speech
+                
+                # ส่งช่วงที่ปิดแล้วไปถอดเสียงทันที ไม่ต้องรอจนพูดจบ
+                if segmenter:
+                    for segment in segmenter.update(decisions):
+                        dispatch_segment(on_segment, pcm, segment, turn.speech_span(vad.frame_length), sample_width)
+                
+                if ended:
+                    console.print(f"\n[green]End of speech detected after {turn.decision_latency:.2f} s of silence, stopping recording...[/green]")
+                    break
                         
         except KeyboardInterrupt:
             console.print("\n[yellow]Recording stopped manually[/yellow]")
         
+        # แจ้งเตือนถ้ามีเสียงหายระหว่างบันทึก
+        overrun_report = format_overrun_report(engine.stats())
+        if overrun_report:
+            console.print(f"\n[yellow]{overrun_report}[/yellow]")
+        
         if not has_sound:
             console.print("[yellow]No sound detected during recording.[/yellow]")
             performance.end_monitoring()
@@ -386,29 +472,38 @@ def record_audio(device_index):
             
         console.print("[bold]Processing audio...[/bold]")
         
-        # บันทึกลงไฟล์ชั่วคราว
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as fp:
-            sound_file = fp.name
-            
-        # เปิดและบันทึกไฟล์
-        with wave.open(sound_file, 'wb') as wf:
-            wf.setnchannels(CHANNELS)
-            wf.setsampwidth(p.get_sample_size(FORMAT))
-            wf.setframerate(RATE)
-            wf.writeframes(b''.join(frames))
+        # ตัดเสียงเงียบหัวท้ายออก เหลือเฉพาะช่วงที่พูด
+        span = turn.speech_span(vad.frame_length)
+        speech, trim = trim_silence(pcm.samples(), RATE, span, pad_ms=TRIM_PAD_MS)
+        if trim['seconds_saved'] > 0:
+            console.print(f"[green]Trimmed {trim['seconds_saved']:.2f} s of silence ({trim['bytes_saved']} bytes saved)[/green]")
+        
+        # ส่งช่วงสุดท้ายที่ยังค้างอยู่
+        if segmenter:
+            final_segment = segmenter.finish(min(span[1] + int(RATE * TRIM_PAD_MS / 1000), len(pcm)))
+            if final_segment:
+                dispatch_segment(on_segment, pcm, final_segment, span, sample_width)
+        
+        # สร้าง AudioData จากบัฟเฟอร์ในหน่วยความจำโดยตรง ไม่ต้องเขียนไฟล์ชั่วคราว
+        audio_data = to_audio_data(speech, RATE, sample_width)
         
-        # ตรวจสอบว่าไฟล์มีขนาดที่เหมาะสม
-        file_size = os.path.getsize(sound_file)
-        file_duration = len(frames) * CHUNK / RATE
-        console.print(f"[green]Audio saved: {file_size} bytes, {file_duration:.2f} seconds[/green]")
+        # ตรวจสอบว่าเสียงมีขนาดที่เหมาะสม
+        audio_size = speech.nbytes
+        audio_duration = trim['trimmed_seconds']
+        console.print(f"[green]Audio captured: {audio_size} bytes, {audio_duration:.2f} seconds[/green]")
         
-        if file_size < 1000:  # ไฟล์เล็กเกินไป
-            console.print("[yellow]Warning: Audio file is very small, might not contain audible speech.[/yellow]")
+        if audio_size < 1000:  # เสียงสั้นเกินไป
+            console.print("[yellow]Warning: Audio is very short, might not contain audible speech.[/yellow]")
+        
+        # บันทึก WAV ไว้ดีบักเฉพาะเมื่อตั้งค่า AUDIO_DEBUG_DUMP_DIR
+        dump_path = dump_wav(speech, RATE, CHANNELS)
+        if dump_path:
+            console.print(f"[dim]Debug WAV saved: {dump_path}[/dim]")
         
         # จบการติดตามประสิทธิภาพ
         performance.end_monitoring()
         
-        return sound_file
+        return audio_data
     
     except Exception as e:
         console.print(f"[red]Error recording audio: {e}[/red]")
@@ -416,70 +511,34 @@ def record_audio(device_index):
         traceback.print_exc()
         performance.end_monitoring()
         return None
-    finally:
-        # Cleanup
-        if stream:
-            try:
-                stream.stop_stream()
-                stream.close()
-            except:
-                pass
-        if p:
-            try:
-                p.terminate()
-            except:
-                pass
 
-def transcribe_audio(audio_file, language):
-    """ถอดเสียงเป็นข้อความด้วย SpeechRecognition"""
+def recognize_speech(audio_data, language):
+    """ถอดเสียงเป็นข้อความด้วย SpeechRecognition (ไม่วัดประสิทธิภาพ เรียกจาก worker thread ได้)"""
     console = Console()
     console.print(f"[bold]Transcribing audio in {LANGUAGES[language]}...[/bold]")
     
-    # เริ่มติดตามประสิทธิภาพ
-    performance.start_monitoring('transcription')
-    
     try:
-        with sr.AudioFile(audio_file) as source:
-            # ปรับความดังของไฟล์เสียง
-            audio_data = recognizer.record(source)
-            
-            # ใช้ Google Speech Recognition API
-            speech_lang_code = SPEECH_LANG_CODES[language]
-            
-            # ลองทั้งกับและไม่กับตัวช่วยวิธีต่างๆ
-            try:
-                # ลองด้วยวิธีปกติ
-                text = recognizer.recognize_google(audio_data, language=speech_lang_code)
-                performance.end_monitoring()
-                return text
-            except sr.UnknownValueError:
-                # ถ้าไม่ได้ ลองอีกครั้งด้วยการปรับค่าพลังงานต่ำลง
-                recognizer.energy_threshold = 200
-                recognizer.dynamic_energy_threshold = False
-                
-                try:
-                    console.print("[yellow]Trying with lower energy threshold...[/yellow]")
-                    audio_data = recognizer.record(source)  # อ่านใหม่
-                    text = recognizer.recognize_google(audio_data, language=speech_lang_code)
-                    performance.end_monitoring()
-                    return text
-                except sr.UnknownValueError:
-                    console.print("[yellow]Could not understand audio[/yellow]")
-                    performance.end_monitoring()
-                    return "Could not understand audio"
+        # ใช้ Google Speech Recognition API
+        speech_lang_code = SPEECH_LANG_CODES[language]
+        return recognizer.recognize_google(audio_data, language=speech_lang_code)
     except sr.UnknownValueError:
         console.print("[yellow]Could not understand audio[/yellow]")
-        performance.end_monitoring()
         return "Could not understand audio"
     except sr.RequestError as e:
         console.print(f"[red]Speech recognition service error: {e}[/red]")
-        performance.end_monitoring()
         return f"Error: {e}"
     except Exception as e:
         console.print(f"[red]Error: {e}[/red]")
-        performance.end_monitoring()
         return f"Error: {e}"
 
+def transcribe_audio(audio_data, language):
+    """ถอดเสียงเป็นข้อความด้วย SpeechRecognition"""
+    performance.start_monitoring('transcription')
+    try:
+        return recognize_speech(audio_data, language)
+    finally:
+        performance.end_monitoring()
+
 def translate_text(text, source_lang, target_lang):
     """แปลข้อความด้วย Google Translate"""
     console = Console()
@@ -493,23 +552,28 @@ def translate_text(text, source_lang, target_lang):
         performance.end_monitoring()
         return text
     
-    try:
-        # ใช้ await กับ coroutine
-        translation = translator.translate(text, src=source_lang, dest=target_lang)
-        
-        # ตรวจสอบว่าเป็น coroutine หรือไม่
-        if hasattr(translation, '__await__'):
-            # นี่เป็นการแก้ไขชั่วคราวเท่านั้น เพราะไม่สามารถใช้ await นอก async function
-            console.print("[yellow]Translation API returned coroutine - using fallback method[/yellow]")
-            performance.end_monitoring()
-            return f"Translation unavailable. Original text: {text}"
-        
+    cached = translation_cache.get(text, source_lang, target_lang, 'googletrans')
+    if cached is not None:
         performance.end_monitoring()
-        return translation.text
-    except Exception as e:
-        console.print(f"[red]Translation error: {e}[/red]")
+        return cached
+    
+    # ประโยคที่คล้ายกับที่เคยแปลแล้ว (ต่างกันแค่วรรคตอน ตัวพิมพ์ หรือคำเล็กน้อย)
+    match = translation_memory.lookup(text, source_lang, target_lang)
+    if match is not None:
+        console.print(f"[dim]Translation memory match ({match[1]:.0%}): {match[2]}[/dim]")
         performance.end_monitoring()
+        return match[0]
+    
+    try:
+        translated = translation_service.translate(text, source_lang, target_lang)
+        translation_cache.put(text, source_lang, target_lang, 'googletrans', translated)
+        translation_memory.add(text, translated, source_lang, target_lang)
+        return translated
+    except Exception as e:
+        console.print(f"[red]Translation error: {e or e.__class__.__name__}[/red]")
         return f"Translation error. Original text: {text}"
+    finally:
+        performance.end_monitoring()
 
 def display_results(source_text, target_text, source_lang, target_lang):
     """แสดงผลลัพธ์ในรูปแบบที่ต้องการ"""
@@ -543,8 +607,191 @@ def display_results(source_text, target_text, source_lang, target_lang):
     console.print("\n")
     console.print(layout)
 
+def segment_size(item):
+    """ขนาดเสียง (ไบต์) ของงานในคิวถอดเสียง"""
+    return len(item[2].frame_data)
+
+def merge_segments(last, new):
+    """รวมช่วงเสียงที่ต่อกันของประโยคเดียวกันเป็นงานเดียว (ใช้กับนโยบาย coalesce) คืนค่า None ถ้ารวมไม่ได้"""
+    last_job, last_seqs, last_audio = last
+    job, seqs, audio_data = new
+    if job is not last_job or seqs[0] != last_seqs[-1] + 1:
+        return None
+    # ช่วงที่ต่อจากการบังคับตัดขึ้นต้นด้วยเสียงซ้ำกับท้ายช่วงก่อนหน้า ตัดออกไม่ให้คำซ้ำในเสียงที่รวมแล้ว
+    skip = job.overlaps.get(seqs[0], 0) * audio_data.sample_width
+    return job, last_seqs + seqs, join_audio_data(last_audio, audio_data, skip)
+
+class UtteranceJob:
+    """งานของหนึ่งประโยคที่ไหลผ่าน pipeline (ช่วงเสียง -> ข้อความ -> คำแปล)"""
+    def __init__(self, utterance_id):
+        self.id = utterance_id
+        self.started = time.time()
+        self.stitcher = ResultStitcher()
+        self.segments = 0  # จำนวนช่วงที่ส่งไปถอดเสียงแล้ว
+        self.overlaps = {}  # seq -> จำนวน sample ต้นช่วงที่ซ้ำกับท้ายช่วงก่อนหน้า (ช่วงที่ต่อจากการบังคับตัด)
+        self.recognized = 0  # จำนวนช่วงที่ถอดเสียงเสร็จแล้ว
+        self.closed = False  # บันทึกเสียงของประโยคนี้จบแล้ว
+        self.source_text = ""
+        self.target_text = ""
+        self.dropped = False  # ถูกทิ้งจากคิวแปลภาษาเพราะระบบรับงานไม่ทัน
+        self._lock = threading.Lock()
+        self._forwarded = False
+
+    def add_segment(self, seq, overlap=0):
+        """นับช่วงที่ส่งไปถอดเสียง พร้อมจำจำนวน sample ต้นช่วงที่ซ้อนทับกับช่วงก่อนหน้า"""
+        with self._lock:
+            self.segments += 1
+            self.overlaps[seq] = overlap
+
+    def segments_done(self, seqs, text):
+        """บันทึกผลถอดเสียงของช่วง seqs (หลายช่วงถ้าถูกรวมในคิว) คืนค่า True ถ้าประโยคนี้ถอดเสียงครบแล้ว (คืนค่า True ครั้งเดียว)"""
+        self.stitcher.add(seqs[0], text)
+        for seq in seqs[1:]:
+            self.stitcher.add(seq, "")
+        with self._lock:
+            self.recognized += len(seqs)
+            return self._ready()
+
+    def close(self):
+        """จบการบันทึกเสียงของประโยค คืนค่า True ถ้าประโยคนี้ถอดเสียงครบแล้ว (คืนค่า True ครั้งเดียว)"""
+        with self._lock:
+            self.closed = True
+            return self._ready()
+
+    def _ready(self):
+        if self.closed and self.recognized == self.segments and not self._forwarded:
+            self._forwarded = True
+            self.source_text = self.stitcher.text
+            return True
+        return False
+
+
+class RealtimePipeline:
+    """pipeline แบบต่อเนื่อง: thread จับเสียงฟังตลอดเวลา ส่งช่วงเสียงผ่านคิวให้ worker ถอดเสียงและแปลภาษา
+    แล้วแสดงผลตามลำดับประโยค"""
+    def __init__(self, session, device_index, source_lang, target_lang,
+                 recognition_workers=RECOGNITION_WORKERS, translation_workers=TRANSLATION_WORKERS):
+        self.session = session
+        self.device_index = device_index
+        self.source_lang = source_lang
+        self.target_lang = target_lang
+        max_bytes = int(QUEUE_MAX_MB * 1024 * 1024)
+        self.recognition_queue = StageQueue('recognition', STAGE_QUEUE_SIZE, RECOGNITION_QUEUE_POLICY, max_bytes,
+                                            size_of=segment_size, merge=merge_segments)
+        self.translation_queue = StageQueue('translation', STAGE_QUEUE_SIZE, TRANSLATION_QUEUE_POLICY, max_bytes,
+                                            size_of=lambda job: len(job.source_text.encode('utf-8')))
+        self.stop_event = threading.Event()
+        self.next_id = 0
+        self.completed = {}  # ประโยคที่เสร็จแล้วแต่ยังรอประโยคก่อนหน้า
+        self.next_render = 0
+        self._render_lock = threading.Lock()
+        
+        self.capture_thread = threading.Thread(target=self._capture_loop, name="capture", daemon=True)
+        self.recognition_threads = [threading.Thread(target=self._recognition_loop, name=f"recognition-{i}", daemon=True)
+                                    for i in range(recognition_workers)]
+        self.translation_threads = [threading.Thread(target=self._translation_loop, name=f"translation-{i}", daemon=True)
+                                    for i in range(translation_workers)]
+
+    def start(self):
+        """เริ่มทุกขั้นของ pipeline"""
+        for thread in self.translation_threads + self.recognition_threads + [self.capture_thread]:
+            thread.start()
+        return self
+
+    def stop(self):
+        """หยุดจับเสียง แล้วรอให้งานที่ค้างในคิวเสร็จ (ไม่เกิน DRAIN_TIMEOUT ต่อขั้น)"""
+        self.stop_event.set()
+        self.capture_thread.join(DRAIN_TIMEOUT)
+        for threads, stage_queue in ((self.recognition_threads, self.recognition_queue),
+                                     (self.translation_threads, self.translation_queue)):
+            stage_queue.close()
+            deadline = time.time() + DRAIN_TIMEOUT
+            for thread in threads:
+                thread.join(max(deadline - time.time(), 0))
+        for stage_queue in (self.recognition_queue, self.translation_queue):
+            console.print(f"[dim]{format_queue_stats(stage_queue.stats())}[/dim]")
+
+    def _queue_segment(self, job, seqs, audio_data):
+        """ส่งช่วงเสียงเข้าคิวถอดเสียง ช่วงที่ถูกทิ้งเพราะคิวเต็มนับเป็นข้อความว่าง เพื่อไม่ให้ประโยคค้าง"""
+        dropped = self.recognition_queue.put((job, seqs, audio_data))
+        if dropped:
+            console.print(f"\n[yellow]Recognition queue full, dropped {len(dropped)} segment(s)[/yellow]")
+        for dropped_job, dropped_seqs, _ in dropped:
+            if dropped_job.segments_done(dropped_seqs, ""):
+                self._queue_translation(dropped_job)
+
+    def _queue_translation(self, job):
+        """ส่งประโยคที่ถอดเสียงครบแล้วเข้าคิวแปลภาษา ประโยคที่ถูกทิ้งจะแสดงผลโดยไม่มีคำแปล"""
+        for dropped_job in self.translation_queue.put(job):
+            console.print(f"\n[yellow]Translation queue full, skipping translation of utterance {dropped_job.id}[/yellow]")
+            dropped_job.dropped = True
+            self._complete(dropped_job)
+
+    def _capture_loop(self):
+        """ขั้นจับเสียง: บันทึกทีละประโยคต่อเนื่อง ส่งแต่ละช่วงเสียงเข้าคิวถอดเสียงทันทีที่ปิด"""
+        while not self.stop_event.is_set():
+            job = None
+            
+            def on_segment(seq, audio_data, overlap=0):
+                nonlocal job
+                if job is None:
+                    job = self._new_job()
+                job.add_segment(seq, overlap)
+                self._queue_segment(job, [seq], audio_data)
+            
+            audio_data = record_audio(self.session, self.device_index, on_segment, self.stop_event)
+            
+            # กรณีที่ไม่มีช่วงใดถูกตัดออกมา ส่งเสียงทั้งประโยคเป็นช่วงเดียว
+            if job is None and audio_data is not None and len(audio_data.frame_data) > 0:
+                on_segment(0, audio_data)
+            if job is not None and job.close():
+                self._queue_translation(job)
+
+    def _new_job(self):
+        job = UtteranceJob(self.next_id)
+        self.next_id += 1
+        return job
+
+    def _recognition_loop(self):
+        """ขั้นถอดเสียง: รับช่วงเสียงจากคิว เมื่อประโยคถอดเสียงครบทุกช่วงแล้วส่งต่อไปแปล"""
+        while True:
+            item = self.recognition_queue.get()
+            if item is None:
+                break
+            job, seqs, audio_data = item
+            text = transcribe_audio(audio_data, self.source_lang)
+            if text == "Could not understand audio" or text.startswith("Error:"):
+                text = ""
+            if job.segments_done(seqs, text):
+                self._queue_translation(job)
+
+    def _translation_loop(self):
+        """ขั้นแปลภาษา: แปลข้อความของประโยคที่ถอดเสียงครบแล้ว"""
+        while True:
+            job = self.translation_queue.get()
+            if job is None:
+                break
+            if job.source_text:
+                job.target_text = translate_text(job.source_text, self.source_lang, self.target_lang)
+            self._complete(job)
+
+    def _complete(self, job):
+        """แสดงผลตามลำดับประโยค ประโยคที่เสร็จก่อนจะรอจนประโยคก่อนหน้าแสดงแล้ว"""
+        with self._render_lock:
+            self.completed[job.id] = job
+            while self.next_render in self.completed:
+                ready = self.completed.pop(self.next_render)
+                self.next_render += 1
+                if ready.source_text:
+                    performance.record_total(time.time() - ready.started)
+                    target_text = "(translation skipped: pipeline overloaded)" if ready.dropped else ready.target_text
+                    display_results(ready.source_text, target_text, self.source_lang, self.target_lang)
+                else:
+                    console.print("\n[yellow]Could not understand audio. Speak louder and more clearly, "
+                                  "in the language you selected.[/yellow]")
+
 def main():
-    global RATE
+    global DEVICE_RATE
     
     # คืนค่า stderr
     sys.stderr = stderr_backup
@@ -557,9 +804,16 @@ def main():
     if not has_internet:
         console.print("[red]Warning: No internet connection. Speech recognition and translation may not work.[/red]")
     
+    session = None
     try:
+        # เปิด PortAudio ครั้งเดียวใช้ตลอดทั้งโปรแกรม
+        session = AudioSession()
+        
+        # ความสามารถของอุปกรณ์ที่เคยตรวจไว้ (ตรวจใหม่เฉพาะเมื่อชุดอุปกรณ์เปลี่ยน)
+        device_cache = DeviceCache(session.p)
+        
         # เลือกอุปกรณ์อินพุต
-        device_index = select_audio_device()
+        device_index = select_audio_device(session, device_cache)
         
         if device_index is None:
             console.print("[yellow]Using default audio device[/yellow]")
@@ -568,47 +822,32 @@ def main():
         source_lang, target_lang = select_languages()
         console.print(f"\n[bold]Selected languages:[/bold] {LANGUAGES[source_lang]} -> {LANGUAGES[target_lang]}")
         
-        # ทดสอบการเปิด stream เสียงก่อนเริ่มใช้งานจริง
+        # ทดสอบการเปิด stream เสียงก่อนเริ่มใช้งานจริง (สตรีมที่ผ่านการทดสอบจะเปิดค้างไว้ใช้ต่อ)
         console.print("\n[bold]Testing audio device with current settings...[/bold]")
         try:
-            p = pyaudio.PyAudio()
-            stream = p.open(format=FORMAT,
-                          channels=CHANNELS,
-                          rate=RATE,
-                          input=True,
-                          input_device_index=device_index,
-                          frames_per_buffer=CHUNK,
-                          start=False)
-            stream.start_stream()
-            time.sleep(0.1)  # ทดสอบสั้นๆ
-            stream.stop_stream()
-            stream.close()
-            p.terminate()
+            session.test_stream(DEVICE_RATE, device_index, target_rate=RATE)
             console.print("[green]Audio device test successful![/green]")
         except Exception as e:
             console.print(f"[red]Audio device test failed: {e}[/red]")
-            console.print("[yellow]Trying alternative sample rate...[/yellow]")
-            RATE = 16000  # ลองใช้ค่าที่ต่ำกว่า
+            # ข้อมูลในแคชอาจล้าสมัย ตรวจอุปกรณ์ใหม่ก่อนลองอัตราสำรอง
+            device_cache.invalidate(device_index)
+            failed_rate = DEVICE_RATE
+            show_supported_sample_rates(session, device_index, device_cache, refresh=True)
+            if DEVICE_RATE == failed_rate:
+                console.print("[yellow]Trying alternative sample rate...[/yellow]")
+                DEVICE_RATE = 16000  # ลองใช้ค่าที่ต่ำกว่า
             
             try:
-                p = pyaudio.PyAudio()
-                stream = p.open(format=FORMAT,
-                              channels=CHANNELS,
-                              rate=RATE,
-                              input=True,
-                              input_device_index=device_index,
-                              frames_per_buffer=CHUNK)
-                stream.start_stream()
-                time.sleep(0.1)
-                stream.stop_stream()
-                stream.close()
-                p.terminate()
-                console.print(f"[green]Success with sample rate {RATE} Hz![/green]")
+                session.test_stream(DEVICE_RATE, device_index, target_rate=RATE)
+                console.print(f"[green]Success with sample rate {DEVICE_RATE} Hz![/green]")
             except Exception as e2:
                 console.print(f"[red]Alternative sample rate also failed: {e2}[/red]")
                 console.print("[red]Cannot initialize audio. Please check your microphone settings.[/red]")
                 return
         
+        # จำค่าที่ใช้ได้ไว้ เปิดโปรแกรมครั้งถัดไปจะไม่ต้องตรวจซ้ำ
+        device_cache.remember(device_index, rate=DEVICE_RATE, channels=CHANNELS, chunk=CHUNK)
+        
         # คำแนะนำสำหรับผู้ใช้
         console.print(f"\n[bold]Tips for better speech recognition:[/bold]")
         console.print(f"1. Speak clearly and at a normal pace")
@@ -617,48 +856,17 @@ def main():
         console.print(f"4. Keep the microphone at a consistent distance")
         console.print(f"5. Try to speak in the language you selected ({LANGUAGES[source_lang]})")
         
-        # เริ่มการบันทึกเสียงและแปลภาษา
-        while True:
-            # เริ่มติดตามประสิทธิภาพรวม
-            performance.start_total()
-            
-            # บันทึกเสียง
-            audio_file = record_audio(device_index)
-            
-            if audio_file and os.path.exists(audio_file) and os.path.getsize(audio_file) > 0:
-                # ถอดเสียงเป็นข้อความ
-                source_text = transcribe_audio(audio_file, source_lang)
-                
-                if source_text and source_text != "Could not understand audio":
-                    # แปลข้อความ
-                    target_text = translate_text(source_text, source_lang, target_lang)
-                    
-                    # จบการติดตามประสิทธิภาพรวม
-                    performance.end_total()
-                    
-                    # แสดงผลลัพธ์
-                    display_results(source_text, target_text, source_lang, target_lang)
-                else:
-                    performance.end_total()
-                    console.print("\n[yellow]Tips for improving recognition:[/yellow]")
-                    console.print("1. Ensure you're speaking in the correct language")
-                    console.print("2. Speak louder and more clearly")
-                    console.print("3. Reduce background noise")
-                    console.print("4. Try a different language")
-                
-                # ลบไฟล์ชั่วคราว
-                try:
-                    os.unlink(audio_file)
-                except:
-                    pass
-            else:
-                performance.end_total()
-                console.print("[red]Failed to record or save audio.[/red]")
-            
-            # ถามผู้ใช้ว่าต้องการแปลอีกหรือไม่
-            again = Prompt.ask("\nTranslate again?", choices=["y", "n"], default="y")
-            if again.lower() != "y":
-                break
+        # เริ่ม pipeline: ฟังเสียงต่อเนื่องระหว่างที่ถอดเสียงและแปลประโยคก่อนหน้า
+        console.print(f"\n[bold]Listening continuously[/bold] ({RECOGNITION_WORKERS} recognition / "
+                      f"{TRANSLATION_WORKERS} translation workers). Press Ctrl+C to stop.")
+        pipeline = RealtimePipeline(session, device_index, source_lang, target_lang).start()
+        try:
+            while pipeline.capture_thread.is_alive():
+                pipeline.capture_thread.join(0.5)
+        except KeyboardInterrupt:
+            console.print("\n[yellow]Stopping, finishing queued utterances...[/yellow]")
+        finally:
+            pipeline.stop()
     
     except KeyboardInterrupt:
         console.print("\n[yellow]Program terminated by user[/yellow]")
@@ -666,6 +874,15 @@ def main():
         console.print(f"\n[red]Error: {e}[/red]")
         import traceback
         traceback.print_exc()
+    finally:
+        if session:
+            session.close()
+        translation_service.close()
+        if translation_service.batcher is not None:
+            console.print(f"[dim]{format_batch_stats(translation_service.batcher.stats())}[/dim]")
+        console.print(f"[dim]{format_cache_stats(translation_cache.stats())}[/dim]")
+        console.print(f"[dim]{format_memory_stats(translation_memory.stats())}[/dim]")
+        translation_cache.close()
     
     console.print("[green]Thank you for using Speech Translation Tool![/green]")
 
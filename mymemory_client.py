@@ -0,0 +1,96 @@
+import os
+import time
+import httpx
+
+# ค่าเริ่มต้นของ client สำหรับ MyMemory API (เปลี่ยน MYMEMORY_URL เพื่อทดสอบกับเซิร์ฟเวอร์จำลองในเครื่องได้)
+MYMEMORY_URL = os.environ.get('MYMEMORY_URL', 'https://api.mymemory.translated.net')
+CONNECT_TIMEOUT = float(os.environ.get('TRANSLATION_CONNECT_TIMEOUT', 3.0))  # วินาที
+READ_TIMEOUT = float(os.environ.get('TRANSLATION_READ_TIMEOUT', 10.0))  # วินาที
+POOL_SIZE = int(os.environ.get('TRANSLATION_POOL_SIZE', 20))  # จำนวนการเชื่อมต่อสูงสุด
+KEEPALIVE_CONNECTIONS = 10  # จำนวนการเชื่อมต่อที่เปิดค้างไว้ใช้ซ้ำ
+
+# ข้อผิดพลาดด้านเครือข่าย (httpx 0.13 ส่งข้อผิดพลาดของ httpcore ออกมาตรงๆ โดยไม่แปลงเป็น httpx.HTTPError)
+NETWORK_ERRORS = (httpx.HTTPError, OSError)
+try:
+    import httpcore
+    NETWORK_ERRORS += tuple(getattr(httpcore, name) for name in ('TimeoutException', 'NetworkError', 'ProtocolError')
+                            if hasattr(httpcore, name))
+except ImportError:
+    pass
+
+
+class TranslationError(Exception):
+    """แปลไม่สำเร็จ (เครือข่ายผิดพลาด หรือ API ตอบกลับด้วยสถานะผิดพลาด)"""
+
+
+def _timeout(connect_timeout, read_timeout):
+    """สร้าง httpx.Timeout รองรับทั้ง httpx รุ่นใหม่และ 0.13 (ที่ใช้ connect_timeout/read_timeout)"""
+    try:
+        return httpx.Timeout(read_timeout, connect=connect_timeout)
+    except TypeError:
+        return httpx.Timeout(read_timeout, connect_timeout=connect_timeout, read_timeout=read_timeout)
+
+
+def _pool_options(pool_size, keepalive):
+    """ตัวเลือกขนาด connection pool รองรับทั้ง httpx.Limits (รุ่นใหม่) และ httpx.PoolLimits (0.13)"""
+    if hasattr(httpx, 'Limits'):
+        return {'limits': httpx.Limits(max_connections=pool_size, max_keepalive_connections=keepalive)}
+    return {'pool_limits': httpx.PoolLimits(max_keepalive=keepalive, max_connections=pool_size)}
+
+
+class MyMemoryClient:
+    """client แบบ async สำหรับ MyMemory ใช้ connection pool ร่วมกัน (keep-alive และ HTTP/2 ถ้ามี h2)"""
+    def __init__(self, base_url=MYMEMORY_URL, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 pool_size=POOL_SIZE, keepalive=KEEPALIVE_CONNECTIONS, http2=True, email=None):
+        self.base_url = base_url.rstrip('/')
+        self.email = email or os.environ.get('MYMEMORY_EMAIL')  # เพิ่มโควตารายวันของ MyMemory
+        options = dict(timeout=_timeout(connect_timeout, read_timeout), **_pool_options(pool_size, keepalive))
+        try:
+            self.client = httpx.AsyncClient(http2=http2, **options)
+        except ImportError:
+            # httpx รุ่นใหม่ต้องติดตั้ง h2 แยกจึงจะใช้ HTTP/2 ได้
+            self.client = httpx.AsyncClient(**options)
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def translate(self, text, source_lang, target_lang):
+        """แปลข้อความ คืนค่าข้อความที่แปลแล้ว หรือ raise TranslationError"""
+        params = {'q': text, 'langpair': f"{source_lang}|{target_lang}"}
+        if self.email:
+            params['de'] = self.email
+
+        started = time.monotonic()
+        self.requests += 1
+        try:
+            response = await self.client.get(f"{self.base_url}/get", params=params)
+            response.raise_for_status()
+            data = response.json()
+        except NETWORK_ERRORS + (ValueError,) as e:
+            self.errors += 1
+            raise TranslationError(str(e) or e.__class__.__name__) from e
+        finally:
+            self.total_time += time.monotonic() - started
+
+        if data.get("responseStatus") != 200:
+            self.errors += 1
+            raise TranslationError(data.get("responseDetails") or f"status {data.get('responseStatus')}")
+        return data["responseData"]["translatedText"]
+
+    def stats(self):
+        """สถิติการเรียก API"""
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'avg_seconds': self.total_time / self.requests if self.requests else 0.0,
+        }
+
+    async def close(self):
+        """ปิด connection pool"""
+        await self.client.aclose()
@@ -0,0 +1,135 @@
+import io
+import os
+import time
+import wave
+import numpy as np
+import speech_recognition as sr
+
+INITIAL_SECONDS = 5  # ขนาดเริ่มต้นของบัฟเฟอร์ (วินาที)
+SAMPLE_WIDTH = 2  # int16
+
+# ตั้งค่า AUDIO_DEBUG_DUMP_DIR เพื่อบันทึกไฟล์ WAV ของทุกประโยคไว้ตรวจสอบ (ปิดเป็นค่าเริ่มต้น)
+DEBUG_DUMP_DIR = os.environ.get('AUDIO_DEBUG_DUMP_DIR')
+
+
+def pcm_volume(samples):
+    """ระดับเสียงเฉลี่ย (mean absolute) ของ PCM int16 คำนวณบน view โดยไม่แปลงข้อมูลใหม่"""
+    if len(samples) == 0:
+        return 0.0
+    # ใช้ int32 ระหว่างคำนวณเพื่อกัน overflow ของ abs(-32768)
+    return float(np.absolute(samples, dtype=np.int32).mean())
+
+
+class PCMAccumulator:
+    """สะสมเสียง PCM int16 ของหนึ่งประโยคในบัฟเฟอร์ NumPy ที่ขยายได้ แทนการเก็บ list ของ bytes"""
+    def __init__(self, rate, channels=1, initial_seconds=INITIAL_SECONDS):
+        self.rate = int(rate)
+        self.channels = channels
+        self.buffer = np.empty(max(int(self.rate * initial_seconds) * channels, 1), dtype=np.int16)
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def _grow(self, needed):
+        """ขยายบัฟเฟอร์แบบเพิ่มเท่าตัว (amortized O(1) ต่อการเพิ่มข้อมูล)"""
+        capacity = len(self.buffer)
+        while capacity < needed:
+            capacity *= 2
+        grown = np.empty(capacity, dtype=np.int16)
+        grown[:self.length] = self.buffer[:self.length]
+        self.buffer = grown
+
+    def reserve(self, n):
+        """คืนพื้นที่ว่าง n sample ท้ายบัฟเฟอร์ให้เขียนลงได้โดยตรง ต้องเรียก commit() ตามหลัง"""
+        if self.length + n > len(self.buffer):
+            self._grow(self.length + n)
+        return self.buffer[self.length:self.length + n]
+
+    def commit(self, n):
+        """ยืนยันข้อมูล n sample ที่เขียนลงพื้นที่จาก reserve() คืนค่า view ของข้อมูลส่วนนั้น"""
+        start = self.length
+        self.length += n
+        return self.buffer[start:self.length]
+
+    def append(self, samples):
+        """เพิ่มข้อมูลต่อท้าย คืนค่า view ของข้อมูลที่เพิ่ม"""
+        samples = np.asarray(samples, dtype=np.int16)
+        self.reserve(len(samples))[:] = samples
+        return self.commit(len(samples))
+
+    def samples(self):
+        """view ของข้อมูลทั้งหมด (ไม่คัดลอก)"""
+        return self.buffer[:self.length]
+
+    def memoryview(self):
+        """memoryview แบบไบต์ของข้อมูลทั้งหมด (ไม่คัดลอก) สำหรับส่งต่อให้ขั้นตอนถัดไป"""
+        return memoryview(self.buffer[:self.length]).cast('B')
+
+    def nbytes(self):
+        """ขนาดข้อมูลเป็นไบต์"""
+        return self.length * self.buffer.itemsize
+
+    def duration(self):
+        """ความยาวเสียงเป็นวินาที"""
+        return self.length / self.channels / self.rate
+
+    def clear(self):
+        """ล้างข้อมูลเพื่อใช้บัฟเฟอร์เดิมซ้ำ"""
+        self.length = 0
+
+
+def to_audio_data(pcm, rate, sample_width=SAMPLE_WIDTH):
+    """สร้าง sr.AudioData จาก PCM (bytes, memoryview หรือ numpy) ในหน่วยความจำ ไม่ผ่านไฟล์ชั่วคราว"""
+    if isinstance(pcm, np.ndarray):
+        pcm = memoryview(np.ascontiguousarray(pcm)).cast('B')
+    return sr.AudioData(pcm, int(rate), sample_width)
+
+
+def join_audio_data(first, second, skip=0):
+    """ต่อ sr.AudioData สองชุดเป็นชุดเดียว โดยข้าม skip ไบต์แรกของชุดหลัง
+
+    frame_data ที่สร้างจาก to_audio_data เป็น memoryview ซึ่งใช้ + ต่อกันไม่ได้ จึงรวมด้วย bytes.join (คัดลอกครั้งเดียว)
+    """
+    frame_data = b"".join((first.frame_data, memoryview(second.frame_data)[skip:]))
+    return sr.AudioData(frame_data, second.sample_rate, second.sample_width)
+
+
+def wav_bytes(pcm, rate, channels=1, sample_width=SAMPLE_WIDTH):
+    """ห่อ PCM เป็นไฟล์ WAV ในหน่วยความจำ"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(sample_width)
+        wf.setframerate(int(rate))
+        wf.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def wav_bytes_to_audio_data(data):
+    """แปลงไฟล์ WAV ที่อยู่ในหน่วยความจำเป็น sr.AudioData (ผสมเป็นโมโนถ้ามีหลายช่อง)"""
+    with wave.open(io.BytesIO(data), 'rb') as wf:
+        channels = wf.getnchannels()
+        sample_width = wf.getsampwidth()
+        rate = wf.getframerate()
+        frames = wf.readframes(wf.getnframes())
+
+    if channels > 1:
+        if sample_width != SAMPLE_WIDTH:
+            raise ValueError(f"Unsupported multi-channel sample width: {sample_width}")
+        samples = np.frombuffer(frames, dtype=np.int16).reshape(-1, channels)
+        frames = samples.mean(axis=1).astype(np.int16).tobytes()
+
+    return sr.AudioData(frames, rate, sample_width)
+
+
+def dump_wav(pcm, rate, channels=1, sample_width=SAMPLE_WIDTH, directory=None):
+    """บันทึก PCM เป็นไฟล์ WAV เพื่อดีบัก ทำงานเฉพาะเมื่อกำหนดโฟลเดอร์ไว้ คืนค่า path หรือ None"""
+    directory = directory or DEBUG_DUMP_DIR
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"utterance_{time.strftime('%Y%m%d_%H%M%S')}_{time.monotonic_ns() % 1000000:06d}.wav")
+    with open(path, 'wb') as f:
+        f.write(wav_bytes(pcm, rate, channels, sample_width))
+    return path
@@ -0,0 +1,82 @@
+from math import gcd
+import numpy as np
+
+# ค่าเริ่มต้นของการแปลงอัตราสุ่มตัวอย่าง
+TARGET_RATE = 16000  # อัตราที่การถอดเสียงต้องการ
+ZERO_CROSSINGS = 10  # ความยาวครึ่งหนึ่งของ filter (นับเป็นจำนวนจุดตัดศูนย์ของ sinc)
+KAISER_BETA = 5.0
+
+
+def design_filter(up, down, zero_crossings=ZERO_CROSSINGS, beta=KAISER_BETA):
+    """ออกแบบ low-pass FIR (windowed sinc) สำหรับการแปลงอัตรา up/down คืนค่าเป็น filter bank ขนาด (up, taps_per_phase)"""
+    max_rate = max(up, down)
+    half_len = zero_crossings * max_rate
+    taps_per_phase = -(-(2 * half_len + 1) // up)
+    n_taps = taps_per_phase * up
+
+    # ตัดความถี่ที่ Nyquist ของอัตราที่ต่ำกว่า (หน่วยเทียบกับ Nyquist ของอัตราหลัง upsample)
+    cutoff = 1.0 / max_rate
+    t = np.arange(n_taps) - (n_taps - 1) / 2.0
+    h = cutoff * np.sinc(cutoff * t) * np.kaiser(n_taps, beta) * up
+
+    # เฟส p ใช้ค่า h[p], h[p + up], h[p + 2up], ...
+    return h.reshape(taps_per_phase, up).T.astype(np.float32).copy()
+
+
+class Resampler:
+    """แปลงอัตราสุ่มตัวอย่างแบบ polyphase ทีละชุดต่อเนื่อง (เก็บสถานะข้ามชุด) คำนวณแบบเวกเตอร์ทั้งชุด"""
+    def __init__(self, in_rate, out_rate=TARGET_RATE, zero_crossings=ZERO_CROSSINGS):
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        g = gcd(self.in_rate, self.out_rate)
+        self.up = self.out_rate // g
+        self.down = self.in_rate // g
+        self.bank = design_filter(self.up, self.down, zero_crossings)
+        self.taps = self.bank.shape[1]
+        self._tap_offsets = np.arange(self.taps)
+        self.reset()
+
+    def reset(self):
+        """ล้างสถานะ (เช่น เมื่อสตรีมเริ่มใหม่)"""
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._pos = 0  # ตำแหน่งของ output ถัดไป หน่วยเป็น 1/up ของ sample ขาเข้า นับจากต้นชุดปัจจุบัน
+
+    def process(self, samples):
+        """แปลง PCM int16 ขาเข้าหนึ่งชุด คืนค่า PCM int16 ที่อัตรา out_rate"""
+        samples = np.asarray(samples)
+        if self.up == self.down:
+            return samples.astype(np.int16, copy=False)
+
+        n = len(samples)
+        total = n * self.up
+        if self._pos >= total:
+            self._pos -= total
+            self._history = np.concatenate((self._history, samples.astype(np.float32)))[-(self.taps - 1):]
+            return np.zeros(0, dtype=np.int16)
+
+        # ตำแหน่งและเฟสของทุก output ในชุดนี้
+        count = -(-(total - self._pos) // self.down)
+        positions = self._pos + np.arange(count) * self.down
+        index = positions // self.up + (self.taps - 1)
+        phase = positions % self.up
+
+        # y[n] = sum_k bank[phase, k] * x[index - k]
+        buffer = np.concatenate((self._history, samples.astype(np.float32)))
+        windows = buffer[index[:, None] - self._tap_offsets]
+        out = np.einsum('ij,ij->i', windows, self.bank[phase])
+
+        self._pos += count * self.down - total
+        self._history = buffer[-(self.taps - 1):]
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+
+
+def downmix(samples, channels):
+    """รวมเสียงหลายช่องสัญญาณ (interleaved) เป็น mono"""
+    if channels == 1:
+        return samples
+    return samples.reshape(-1, channels).mean(axis=1).astype(samples.dtype)
+
+
+def resample(samples, in_rate, out_rate=TARGET_RATE):
+    """แปลงอัตราสุ่มตัวอย่างของเสียงทั้งก้อนในครั้งเดียว"""
+    return Resampler(in_rate, out_rate).process(samples)
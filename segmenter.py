@@ -0,0 +1,120 @@
+import re
+import threading
+
+# ค่าเริ่มต้นของการแบ่งช่วงเสียงพูดยาว (วินาที)
+MICRO_PAUSE_SECONDS = 0.2  # ช่วงหยุดสั้นๆ (ตามผล VAD) ที่ใช้เป็นจุดตัด
+MIN_SEGMENT_SECONDS = 2.0  # ช่วงที่สั้นกว่านี้จะไม่ถูกตัดที่ช่วงหยุดสั้น
+MAX_SEGMENT_SECONDS = 6.0  # ถ้าพูดยาวเกินนี้โดยไม่หยุดจะบังคับตัด
+OVERLAP_SECONDS = 0.3  # ช่วงซ้อนทับเมื่อบังคับตัด เพื่อไม่ให้คำที่อยู่ตรงรอยตัดหาย
+MAX_OVERLAP_WORDS = 4  # จำนวนคำสูงสุดที่ตรวจหาคำซ้ำตรงรอยต่อ
+
+
+class SpeechSegmenter:
+    """แบ่งเสียงพูดต่อเนื่องเป็นช่วงย่อยที่ช่วงหยุดสั้นๆ หรือเมื่อยาวเกินกำหนด เพื่อส่งถอดเสียงได้ทันทีระหว่างพูด
+
+    ทำงานกับตำแหน่ง sample ของบัฟเฟอร์ประโยค (เช่น PCMAccumulator) ที่ป้อนให้ VAD ตั้งแต่ต้น
+    """
+    def __init__(self, rate, frame_length, micro_pause=MICRO_PAUSE_SECONDS, min_segment=MIN_SEGMENT_SECONDS,
+                 max_segment=MAX_SEGMENT_SECONDS, overlap=OVERLAP_SECONDS):
+        self.rate = int(rate)
+        self.frame_length = frame_length
+        frame_seconds = frame_length / self.rate
+        self.micro_pause_frames = max(int(round(micro_pause / frame_seconds)), 1)
+        self.min_segment = int(min_segment * self.rate)
+        self.max_segment = int(max_segment * self.rate)
+        self.overlap = int(overlap * self.rate)
+        self.reset()
+
+    def reset(self):
+        """เริ่มประโยคใหม่"""
+        self.position = 0  # ตำแหน่ง sample ล่าสุดที่ผ่าน VAD แล้ว
+        self.segment_start = 0
+        self.next_seq = 0
+        self._lead_overlap = 0  # จำนวน sample ต้นช่วงปัจจุบันที่ซ้อนทับกับช่วงก่อนหน้า
+        self._has_speech = False
+        self._silence_frames = 0
+
+    def update(self, decisions):
+        """รับผล VAD ของเฟรมใหม่ คืนค่ารายการช่วงที่ปิดแล้วเป็น (seq, start, end, overlap)
+
+        overlap คือจำนวน sample ต้นช่วงที่ซ้ำกับท้ายช่วงก่อนหน้า (มีเฉพาะช่วงที่ต่อจากการบังคับตัด)
+        """
+        closed = []
+        for is_speech in decisions:
+            self.position += self.frame_length
+            if is_speech:
+                self._has_speech = True
+                self._silence_frames = 0
+            else:
+                self._silence_frames += 1
+
+            length = self.position - self.segment_start
+            if (self._has_speech and length >= self.min_segment
+                    and self._silence_frames >= self.micro_pause_frames):
+                # ตัดกลางช่วงหยุด ไม่ต้องซ้อนทับเพราะไม่มีคำอยู่ตรงรอยตัด
+                cut = self.position - (self._silence_frames * self.frame_length) // 2
+                closed.append(self._close(cut, cut))
+            elif length >= self.max_segment:
+                if self._has_speech:
+                    closed.append(self._close(self.position, self.position - self.overlap))
+                else:
+                    # ช่วงเงียบยาวไม่ต้องส่ง เลื่อนจุดเริ่มต้นไปเฉยๆ
+                    self.segment_start = self.position
+                    self._lead_overlap = 0
+        return closed
+
+    def finish(self, end=None):
+        """ปิดช่วงสุดท้ายเมื่อจบประโยค คืนค่า (seq, start, end, overlap) หรือ None ถ้าไม่มีเสียงพูดค้างอยู่"""
+        end = self.position if end is None else end
+        if not self._has_speech or end <= self.segment_start:
+            return None
+        return self._close(end, end)
+
+    def _close(self, end, next_start):
+        """ปิดช่วงปัจจุบันที่ end และเริ่มช่วงใหม่ที่ next_start"""
+        segment = (self.next_seq, self.segment_start, end, self._lead_overlap)
+        self.next_seq += 1
+        self.segment_start = next_start
+        self._lead_overlap = end - next_start
+        self._has_speech = False
+        self._silence_frames = 0
+        return segment
+
+
+def merge_overlap(previous, current, max_words=MAX_OVERLAP_WORDS):
+    """ต่อข้อความสองช่วง โดยตัดคำที่ซ้ำกันตรงรอยต่อ (เกิดจากช่วงซ้อนทับ) ออก"""
+    if not previous:
+        return current
+    if not current:
+        return previous
+
+    prev_words = previous.split()
+    curr_words = current.split()
+    normalize = lambda w: re.sub(r'\W+', '', w.lower())
+    for n in range(min(max_words, len(prev_words), len(curr_words)), 0, -1):
+        if [normalize(w) for w in prev_words[-n:]] == [normalize(w) for w in curr_words[:n]]:
+            curr_words = curr_words[n:]
+            break
+    return " ".join(prev_words + curr_words)
+
+
+class ResultStitcher:
+    """รวมผลลัพธ์ของแต่ละช่วงกลับตามลำดับ แม้ผลจะเสร็จไม่ตรงลำดับ"""
+    def __init__(self):
+        self.pending = {}
+        self.next_seq = 0
+        self.text = ""
+        self._lock = threading.Lock()
+
+    def add(self, seq, text):
+        """เพิ่มผลของช่วง seq คืนค่ารายการข้อความที่เรียงลำดับครบแล้วและพร้อมแสดง (เรียกจากหลาย thread ได้)"""
+        with self._lock:
+            self.pending[seq] = text
+            ready = []
+            while self.next_seq in self.pending:
+                segment_text = self.pending.pop(self.next_seq)
+                self.next_seq += 1
+                if segment_text:
+                    self.text = merge_overlap(self.text, segment_text)
+                    ready.append(segment_text)
+            return ready
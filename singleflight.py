@@ -0,0 +1,48 @@
+import asyncio
+
+
+class SingleFlight:
+    """รวมคำขอที่เหมือนกันซึ่งเกิดพร้อมกัน ให้เรียกงานจริงครั้งเดียวแล้วแจกผล (หรือข้อผิดพลาด) ให้ทุกผู้รอ
+
+    ผู้รอที่ถูกยกเลิก (เช่น client ปิดการเชื่อมต่อ) จะไม่ยกเลิกงานจริงที่ผู้รอคนอื่นยังต้องใช้
+    """
+    def __init__(self, name):
+        self.name = name
+        self.inflight = {}  # key -> asyncio.Task ของงานจริงที่กำลังทำ
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, func, *args):
+        """คืนผลของ func(*args) ถ้ามีงานที่ key เดียวกันกำลังทำอยู่จะรอผลของงานนั้นแทนการเรียกใหม่"""
+        task = self.inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func(*args))
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        if not task.cancelled():
+            task.exception()  # อ่านข้อผิดพลาดไว้ ไม่ให้ asyncio เตือนเมื่อผู้รอทุกคนถูกยกเลิกไปแล้ว
+
+    def stats(self):
+        """สถิติการรวมคำขอ"""
+        requests = self.calls + self.coalesced
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'inflight': len(self.inflight),
+            'saved': self.coalesced / requests if requests else 0.0,
+        }
+
+
+def format_flight_stats(stats):
+    """ข้อความสรุปการรวมคำขอหนึ่งบรรทัด"""
+    return (f"{stats['name']} single-flight: {stats['calls']} upstream calls, {stats['coalesced']} coalesced "
+            f"({stats['saved']:.0%} saved)")
@@ -0,0 +1,244 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+# นโยบายเมื่อคิวเต็ม
+#   block: รอจนมีที่ว่าง (ส่งแรงต้านกลับไปยังขั้นก่อนหน้า)
+#   drop_oldest: ทิ้งงานที่เก่าที่สุดในคิว
+#   drop_newest: ทิ้งงานใหม่ที่กำลังจะเข้าคิว
+#   coalesce: รวมงานใหม่เข้ากับงานสุดท้ายในคิวถ้าต่อกันได้ ไม่เช่นนั้นทิ้งงานที่เก่าที่สุด
+QUEUE_POLICIES = ('block', 'drop_oldest', 'drop_newest', 'coalesce')
+DEFAULT_MAXSIZE = 16
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024  # เพดานหน่วยความจำของงานในคิว (ประมาณ 17 นาทีของ PCM 16 kHz)
+
+
+class _QueueCore:
+    """สถานะและนโยบายของคิวที่ใช้ร่วมกันทั้งแบบ thread และ asyncio (ไม่มี lock ในตัว)"""
+    def __init__(self, name, maxsize, policy, max_bytes, size_of, merge):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy} (choose from {', '.join(QUEUE_POLICIES)})")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.max_bytes = max_bytes
+        self.size_of = size_of or (lambda item: 0)
+        self.merge = merge
+        self.items = deque()  # (item, เวลาเข้าคิว, ขนาด)
+        self.bytes = 0
+        self.closed = False
+        self.puts = 0
+        self.gets = 0
+        self.dropped = 0
+        self.dropped_bytes = 0
+        self.coalesced = 0
+        self.merge_errors = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.blocked_time = 0.0
+
+    def has_room(self, size):
+        """มีที่ว่างพอสำหรับงานขนาด size หรือไม่ (งานเดียวที่ใหญ่กว่าเพดานยังเข้าได้ถ้าคิวว่าง)"""
+        if not self.items:
+            return True
+        if self.maxsize and len(self.items) >= self.maxsize:
+            return False
+        return not self.max_bytes or self.bytes + size <= self.max_bytes
+
+    def make_room(self, item, size):
+        """จัดการงานใหม่ตามนโยบายเมื่อคิวเต็ม คืนค่า (งานที่ยังต้องเข้าคิวหรือ None, รายการงานที่ถูกทิ้ง)"""
+        dropped = []
+        if self.policy == 'drop_newest':
+            self._count_drop(size)
+            return None, [item]
+
+        if self.policy == 'coalesce' and self.merge is not None and self.items:
+            last, enqueued, last_size = self.items[-1]
+            try:
+                merged = self.merge(last, item)
+                merged_size = self.size_of(merged) if merged is not None else 0
+            except Exception:
+                # รวมไม่สำเร็จ ใช้พฤติกรรม drop_oldest แทน ไม่ให้ขั้นก่อนหน้าล้มตาม
+                self.merge_errors += 1
+                merged = None
+            if merged is not None:
+                self.items[-1] = (merged, enqueued, merged_size)
+                self.bytes += merged_size - last_size
+                self.coalesced += 1
+                item, size = None, 0
+
+        # drop_oldest (และ coalesce ที่รวมไม่ได้หรือยังเกินเพดานหน่วยความจำ)
+        while self.items and ((item is not None and not self.has_room(size)) or self._over_bytes()):
+            old, _, old_size = self.items.popleft()
+            self.bytes -= old_size
+            self._count_drop(old_size)
+            dropped.append(old)
+        return item, dropped
+
+    def append(self, item, size):
+        self.items.append((item, time.monotonic(), size))
+        self.bytes += size
+        self.puts += 1
+        self.max_depth = max(self.max_depth, len(self.items))
+
+    def popleft(self):
+        item, enqueued, size = self.items.popleft()
+        self.bytes -= size
+        self.gets += 1
+        wait = time.monotonic() - enqueued
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        return item
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'policy': self.policy,
+            'depth': len(self.items),
+            'max_depth': self.max_depth,
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'puts': self.puts,
+            'gets': self.gets,
+            'dropped': self.dropped,
+            'dropped_bytes': self.dropped_bytes,
+            'coalesced': self.coalesced,
+            'merge_errors': self.merge_errors,
+            'avg_wait': self.total_wait / self.gets if self.gets else 0.0,
+            'max_wait': self.max_wait,
+            'blocked_time': self.blocked_time,
+        }
+
+    def _over_bytes(self):
+        return bool(self.max_bytes) and len(self.items) > 1 and self.bytes > self.max_bytes
+
+    def _count_drop(self, size):
+        self.dropped += 1
+        self.dropped_bytes += size
+
+
+class StageQueue:
+    """คิวระหว่างขั้นของ pipeline แบบจำกัดขนาด (จำนวนงานและหน่วยความจำ) สำหรับ thread
+
+    size_of(item) คืนขนาดเป็นไบต์ของงาน ใช้กับเพดานหน่วยความจำ
+    merge(last, new) คืนงานที่รวมแล้วหรือ None ถ้ารวมไม่ได้ ใช้กับนโยบาย coalesce
+    """
+    def __init__(self, name, maxsize=DEFAULT_MAXSIZE, policy='block', max_bytes=DEFAULT_MAX_BYTES,
+                 size_of=None, merge=None):
+        self._core = _QueueCore(name, maxsize, policy, max_bytes, size_of, merge)
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def put(self, item, timeout=None):
+        """ใส่งานเข้าคิวตามนโยบาย คืนค่ารายการงานที่ถูกทิ้ง (ผู้เรียกต้องจัดการต่อ เช่น แจ้งว่างานหาย)"""
+        core = self._core
+        size = core.size_of(item)
+        with self._lock:
+            if core.closed:
+                raise RuntimeError(f"Queue {core.name} is closed")
+            dropped = []
+            if not core.has_room(size):
+                if core.policy == 'block':
+                    started = time.monotonic()
+                    if not self._not_full.wait_for(lambda: core.has_room(size) or core.closed, timeout):
+                        core.blocked_time += time.monotonic() - started
+                        core._count_drop(size)
+                        return [item]
+                    core.blocked_time += time.monotonic() - started
+                else:
+                    item, dropped = core.make_room(item, size)
+            if item is not None:
+                core.append(item, size)
+                self._not_empty.notify()
+            return dropped
+
+    def get(self, timeout=None):
+        """ดึงงานถัดไป คืนค่า None เมื่อคิวถูกปิดและไม่มีงานเหลือ หรือเมื่อหมดเวลารอ"""
+        with self._lock:
+            if not self._not_empty.wait_for(lambda: self._core.items or self._core.closed, timeout):
+                return None
+            if not self._core.items:
+                return None
+            item = self._core.popleft()
+            self._not_full.notify()
+            return item
+
+    def close(self):
+        """ปิดคิว ผู้อ่านจะได้งานที่เหลือจนหมดแล้วได้ None"""
+        with self._lock:
+            self._core.closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def qsize(self):
+        return len(self._core.items)
+
+    def stats(self):
+        """สถิติของคิว (ความลึก, เวลารอ, จำนวนที่ถูกทิ้ง/รวม)"""
+        with self._lock:
+            return self._core.stats()
+
+
+class AsyncStageQueue:
+    """คิวระหว่างขั้นแบบจำกัดขนาดสำหรับ asyncio (นโยบายและสถิติเหมือน StageQueue)"""
+    def __init__(self, name, maxsize=DEFAULT_MAXSIZE, policy='block', max_bytes=DEFAULT_MAX_BYTES,
+                 size_of=None, merge=None):
+        self._core = _QueueCore(name, maxsize, policy, max_bytes, size_of, merge)
+        self._changed = asyncio.Condition()
+
+    async def put(self, item, timeout=None):
+        """ใส่งานเข้าคิวตามนโยบาย คืนค่ารายการงานที่ถูกทิ้ง"""
+        core = self._core
+        size = core.size_of(item)
+        async with self._changed:
+            if core.closed:
+                raise RuntimeError(f"Queue {core.name} is closed")
+            dropped = []
+            if not core.has_room(size):
+                if core.policy == 'block':
+                    started = time.monotonic()
+                    try:
+                        await asyncio.wait_for(self._changed.wait_for(lambda: core.has_room(size) or core.closed), timeout)
+                    except asyncio.TimeoutError:
+                        core.blocked_time += time.monotonic() - started
+                        core._count_drop(size)
+                        return [item]
+                    core.blocked_time += time.monotonic() - started
+                else:
+                    item, dropped = core.make_room(item, size)
+            if item is not None:
+                core.append(item, size)
+                self._changed.notify_all()
+            return dropped
+
+    async def get(self):
+        """ดึงงานถัดไป คืนค่า None เมื่อคิวถูกปิดและไม่มีงานเหลือ"""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._core.items or self._core.closed)
+            if not self._core.items:
+                return None
+            item = self._core.popleft()
+            self._changed.notify_all()
+            return item
+
+    async def close(self):
+        """ปิดคิว ผู้อ่านจะได้งานที่เหลือจนหมดแล้วได้ None"""
+        async with self._changed:
+            self._core.closed = True
+            self._changed.notify_all()
+
+    def qsize(self):
+        return len(self._core.items)
+
+    def stats(self):
+        return self._core.stats()
+
+
+def format_queue_stats(stats):
+    """ข้อความสรุปสถานะคิวหนึ่งบรรทัด"""
+    return (f"{stats['name']} queue [{stats['policy']}]: depth {stats['depth']} (max {stats['max_depth']}), "
+            f"{stats['bytes'] / 1024:.0f} KiB, wait avg {stats['avg_wait']:.2f} s / max {stats['max_wait']:.2f} s, "
+            f"dropped {stats['dropped']}, coalesced {stats['coalesced']}"
+            + (f", {stats['merge_errors']} merge errors" if stats['merge_errors'] else ""))
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('speech_recognition')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pcm_buffer import to_audio_data, join_audio_data
+from stage_queue import StageQueue
+
+
+def merge(last, new):
+    return join_audio_data(last, new, skip=4)
+
+
+def test_join_audio_data_from_memoryview():
+    first = to_audio_data(np.arange(4, dtype=np.int16), 16000)
+    second = to_audio_data(np.arange(4, 8, dtype=np.int16), 16000)
+    merged = join_audio_data(first, second, skip=2)
+    assert bytes(merged.frame_data) == np.array([0, 1, 2, 3, 5, 6, 7], dtype=np.int16).tobytes()
+    assert merged.sample_rate == 16000
+    assert merged.sample_width == 2
+
+
+def test_coalesce_queue_merges_audio_data():
+    queue = StageQueue('test', maxsize=1, policy='coalesce', size_of=lambda audio: len(audio.frame_data), merge=merge)
+    assert queue.put(to_audio_data(np.zeros(4, dtype=np.int16), 16000)) == []
+    assert queue.put(to_audio_data(np.ones(4, dtype=np.int16), 16000)) == []
+    merged = queue.get()
+    assert bytes(merged.frame_data) == np.array([0, 0, 0, 0, 1, 1], dtype=np.int16).tobytes()
+    assert queue.stats()['coalesced'] == 1
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main_socket'))
+from protocol import encode_audio_frame, decode_audio_frame, ProtocolError
+
+
+def test_overlap_samples_round_trip():
+    pcm = bytes(range(16))
+    data = decode_audio_frame(encode_audio_frame(pcm, 16000, seq=3, utterance=1, segment=2, overlap=4800))
+    assert data['overlap'] == 4800
+    assert data['pcm'] == pcm
+    assert (data['seq'], data['utterance'], data['segment']) == (3, 1, 2)
+
+
+def test_no_overlap_keeps_plain_header():
+    frame = encode_audio_frame(bytes(4), 16000)
+    assert len(frame) == 22 + 4
+    assert decode_audio_frame(frame)['overlap'] == 0
+
+
+def test_truncated_overlap_field_is_rejected():
+    frame = encode_audio_frame(b'', 16000, overlap=5)
+    with pytest.raises(ProtocolError):
+        decode_audio_frame(frame[:23])
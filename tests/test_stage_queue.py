@@ -0,0 +1,20 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stage_queue import StageQueue
+
+
+def failing_merge(last, new):
+    raise TypeError("cannot merge")
+
+
+def test_coalesce_merge_error_falls_back_to_drop_oldest():
+    queue = StageQueue('test', maxsize=1, policy='coalesce', merge=failing_merge)
+    assert queue.put('first') == []
+    assert queue.put('second') == ['first']
+    assert queue.get() == 'second'
+    stats = queue.stats()
+    assert stats['merge_errors'] == 1
+    assert stats['coalesced'] == 0
+    assert stats['dropped'] == 1
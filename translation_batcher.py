@@ -0,0 +1,154 @@
+import asyncio
+import os
+import re
+
+# ค่าเริ่มต้นของการรวมหลายข้อความเป็นคำขอแปลเดียว
+BATCH_WINDOW = float(os.environ.get('TRANSLATION_BATCH_WINDOW_MS', 50)) / 1000  # เวลารอรวมข้อความ (วินาที)
+BATCH_MAX_ITEMS = int(os.environ.get('TRANSLATION_BATCH_MAX_ITEMS', 8))  # จำนวนข้อความสูงสุดต่อคำขอ
+BATCH_MAX_CHARS = int(os.environ.get('TRANSLATION_BATCH_MAX_CHARS', 450))  # ขนาดรวมสูงสุดเป็นไบต์ UTF-8 รวมเครื่องหมายลำดับ (MyMemory รับได้ 500 ไบต์)
+
+# เครื่องหมายลำดับหน้าแต่ละข้อความ เช่น [1] (รับวงเล็บ/ตัวเลขแบบเต็มความกว้างที่บางภาษาแปลงให้)
+MARKER = re.compile(r'[\[［]\s*([0-9０-９]+)\s*[\]］]')
+# ลำดับหน้าบรรทัดเมื่อเครื่องหมายถูกแปลงเป็นรูปอื่น เช่น 1. / (1) / 1
+LINE_ORDINAL = re.compile(r'^(?:[\[［(（]\s*([0-9０-９]+)\s*[\]］)）]|([0-9０-９]+)(?:[.．]|(?=\s)))\s*(.*)$')
+
+
+def join_segments(texts):
+    """รวมข้อความเป็นบรรทัดละข้อความ นำหน้าด้วยเครื่องหมายลำดับ [1], [2], ..."""
+    return "\n".join(f"[{i}] {' '.join(text.split())}" for i, text in enumerate(texts, 1))
+
+
+def joined_size(texts):
+    """ขนาดเป็นไบต์ UTF-8 ของข้อความที่รวมแล้ว (รวมเครื่องหมายลำดับ)"""
+    return len(join_segments(texts).encode('utf-8'))
+
+
+def split_segments(text, count):
+    """แยกคำแปลที่รวมกันกลับเป็นรายข้อความ คืนค่า None ถ้าแยกได้ไม่ครบหรือไม่ตรงลำดับ"""
+    parts = MARKER.split(text)
+    numbers, bodies = parts[1::2], parts[2::2]
+    if not parts[0].strip() and [int(number) for number in numbers] == list(range(1, count + 1)):
+        segments = [body.strip() for body in bodies]
+    else:
+        # บางครั้งเครื่องหมายถูกแปลงเป็นเลขลำดับแบบอื่น รับเฉพาะบรรทัดที่ลำดับตรงกับตำแหน่ง
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        if len(lines) != count:
+            return None
+        segments = []
+        for index, line in enumerate(lines, 1):
+            match = LINE_ORDINAL.match(line)
+            if not match or int(match.group(1) or match.group(2)) != index:
+                return None
+            segments.append(match.group(3).strip())
+    if not all(segments):
+        return None
+    return segments
+
+
+class TranslationBatcher:
+    """รวมข้อความที่ขอแปลภายในช่วงเวลาสั้นๆ (หรือจนถึงขนาดที่กำหนด) เป็นคำขอเดียวต่อคู่ภาษา
+
+    translate_func(text, source_lang, target_lang) เป็น coroutine ที่เรียกบริการแปลจริงหนึ่งครั้ง
+    ถ้าแยกคำแปลที่รวมกันกลับไม่ได้ จะแปลทีละข้อความแทน ต้องใช้ภายใน event loop เดียวกันเสมอ
+    """
+    def __init__(self, translate_func, window=BATCH_WINDOW, max_items=BATCH_MAX_ITEMS, max_chars=BATCH_MAX_CHARS):
+        self.translate_func = translate_func
+        self.window = window
+        self.max_items = max_items
+        self.max_chars = max_chars
+        self.pending = {}  # (source_lang, target_lang) -> รายการ (ข้อความ, future)
+        self.timers = {}
+        self.tasks = set()
+        self.requests = 0
+        self.upstream_calls = 0
+        self.batches = 0
+        self.batched_segments = 0
+        self.split_failures = 0
+        self.batch_errors = 0
+
+    async def translate(self, text, source_lang, target_lang):
+        """แปลข้อความ (อาจถูกรวมกับข้อความอื่นที่ขอมาพร้อมกัน)"""
+        self.requests += 1
+        if (self.max_items <= 1 or joined_size([text]) > self.max_chars
+                or MARKER.search(text) or '\n' in text.strip()):
+            # ข้อความยาว หรือมีเครื่องหมายที่จะสับสนกับตัวแบ่ง ส่งแปลเดี่ยวๆ
+            return await self._call(text, source_lang, target_lang)
+
+        pair = (source_lang, target_lang)
+        batch = self.pending.setdefault(pair, [])
+        if batch and joined_size([t for t, _ in batch] + [text]) > self.max_chars:
+            self._flush(pair)
+            batch = self.pending.setdefault(pair, [])
+
+        future = asyncio.get_running_loop().create_future()
+        batch.append((text, future))
+        if len(batch) >= self.max_items:
+            self._flush(pair)
+        elif pair not in self.timers:
+            self.timers[pair] = asyncio.get_running_loop().call_later(self.window, self._flush, pair)
+        return await future
+
+    async def _call(self, text, source_lang, target_lang):
+        self.upstream_calls += 1
+        return await self.translate_func(text, source_lang, target_lang)
+
+    def _flush(self, pair):
+        """ส่งข้อความที่รอของคู่ภาษานี้ไปแปล"""
+        timer = self.timers.pop(pair, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self.pending.pop(pair, [])
+        if batch:
+            task = asyncio.ensure_future(self._run(batch, *pair))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch, source_lang, target_lang):
+        texts = [text for text, _ in batch]
+        if len(batch) == 1:
+            try:
+                results = [await self._call(texts[0], source_lang, target_lang)]
+            except Exception as e:
+                results = [e]
+        else:
+            self.batches += 1
+            self.batched_segments += len(batch)
+            try:
+                joined = await self._call(join_segments(texts), source_lang, target_lang)
+                results = split_segments(joined, len(texts))
+                if results is None:
+                    self.split_failures += 1
+            except Exception:
+                # คำขอรวมล้มเหลว ไม่ให้ทั้งชุดล้มตาม
+                self.batch_errors += 1
+                results = None
+            if results is None:
+                # แปลทีละข้อความพร้อมกัน
+                results = await asyncio.gather(*(self._call(text, source_lang, target_lang) for text in texts),
+                                               return_exceptions=True)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        """สถิติการรวมคำขอแปล"""
+        return {
+            'requests': self.requests,
+            'upstream_calls': self.upstream_calls,
+            'batches': self.batches,
+            'avg_batch': self.batched_segments / self.batches if self.batches else 0.0,
+            'split_failures': self.split_failures,
+            'batch_errors': self.batch_errors,
+        }
+
+
+def format_batch_stats(stats):
+    """ข้อความสรุปการรวมคำขอแปลหนึ่งบรรทัด"""
+    return (f"Translation batching: {stats['requests']} requests in {stats['upstream_calls']} upstream calls, "
+            f"{stats['batches']} batches (avg {stats['avg_batch']:.1f} segments), {stats['split_failures']} split failures, "
+            f"{stats['batch_errors']} failed batches")
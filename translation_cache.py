@@ -0,0 +1,145 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# ค่าเริ่มต้นของแคชคำแปล
+CACHE_MAX_ENTRIES = int(os.environ.get('TRANSLATION_CACHE_SIZE', 10000))  # จำนวนรายการในหน่วยความจำ
+CACHE_TTL = float(os.environ.get('TRANSLATION_CACHE_TTL', 7 * 24 * 3600))  # อายุของคำแปล (วินาที, 0 = ไม่หมดอายุ)
+# ไฟล์ SQLite ที่ใช้ร่วมกันข้ามการเปิดโปรแกรมและข้าม worker (ตั้งเป็นค่าว่างเพื่อใช้แคชในหน่วยความจำอย่างเดียว)
+CACHE_DB_PATH = os.environ.get('TRANSLATION_CACHE_DB',
+                               os.path.join(os.path.expanduser('~'), '.cache', 'audio2textpy', 'translations.db'))
+
+
+def normalize_text(text):
+    """ปรับข้อความให้อยู่ในรูปมาตรฐานก่อนใช้เป็นคีย์ (Unicode NFKC, ตัดช่องว่างซ้ำและหัวท้าย)"""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+def cache_key(text, source_lang, target_lang, backend):
+    """คีย์ของคำแปล: (ข้อความที่ปรับแล้ว, ภาษาต้นทาง, ภาษาปลายทาง, บริการแปล)"""
+    return (normalize_text(text), source_lang, target_lang, backend)
+
+
+class TranslationCache:
+    """แคชคำแปลสองชั้น: LRU ในหน่วยความจำ (จำกัดจำนวนและอายุ) และ SQLite บนดิสก์ (ถ้ากำหนด path)
+
+    เรียกจากหลาย thread ได้ ชั้น SQLite ใช้โหมด WAL จึงหลาย process อ่าน/เขียนไฟล์เดียวกันได้
+    """
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, path=CACHE_DB_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path or None
+        self.entries = OrderedDict()  # key -> (คำแปล, เวลาที่บันทึก)
+        self._lock = threading.Lock()
+        self.db = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if self.path:
+            self._open_db()
+
+    def _open_db(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS translations (
+                                   text TEXT NOT NULL, source_lang TEXT NOT NULL, target_lang TEXT NOT NULL,
+                                   backend TEXT NOT NULL, translation TEXT NOT NULL, created REAL NOT NULL,
+                                   PRIMARY KEY (text, source_lang, target_lang, backend))""")
+            if self.ttl:
+                self.db.execute("DELETE FROM translations WHERE created < ?", (time.time() - self.ttl,))
+        except sqlite3.Error:
+            # ใช้ไฟล์ไม่ได้ (เช่น ไม่มีสิทธิ์เขียน) ใช้แคชในหน่วยความจำอย่างเดียว
+            self.db = None
+
+    def _expired(self, created, now):
+        return bool(self.ttl) and now - created > self.ttl
+
+    def get(self, text, source_lang, target_lang, backend):
+        """คำแปลที่เก็บไว้ หรือ None ถ้าไม่มี/หมดอายุ"""
+        key = cache_key(text, source_lang, target_lang, backend)
+        now = time.time()
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self.entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self.entries[key]
+                self.expirations += 1
+
+            if self.db is not None:
+                try:
+                    row = self.db.execute("SELECT translation, created FROM translations WHERE text = ? AND "
+                                          "source_lang = ? AND target_lang = ? AND backend = ?", key).fetchone()
+                except sqlite3.Error:
+                    row = None
+                if row is not None:
+                    if not self._expired(row[1], now):
+                        self._remember(key, row[0], row[1])
+                        self.disk_hits += 1
+                        return row[0]
+                    self.expirations += 1
+
+            self.misses += 1
+            return None
+
+    def put(self, text, source_lang, target_lang, backend, translation):
+        """บันทึกคำแปล (ควรบันทึกเฉพาะคำแปลที่สำเร็จ)"""
+        key = cache_key(text, source_lang, target_lang, backend)
+        now = time.time()
+        with self._lock:
+            self._remember(key, translation, now)
+            if self.db is not None:
+                try:
+                    self.db.execute("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)",
+                                    key + (translation, now))
+                except sqlite3.Error:
+                    pass
+
+    def _remember(self, key, translation, created):
+        """เพิ่มรายการในชั้นหน่วยความจำ แล้วทิ้งรายการที่ใช้ล่าสุดนานที่สุดเมื่อเกินขนาด"""
+        self.entries[key] = (translation, created)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """สถิติของแคช"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'persistent': self.db is not None,
+            }
+
+    def close(self):
+        with self._lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+def format_cache_stats(stats):
+    """ข้อความสรุปสถานะแคชหนึ่งบรรทัด"""
+    return (f"Translation cache: {stats['hits']} hits ({stats['memory_hits']} memory, {stats['disk_hits']} disk), "
+            f"{stats['misses']} misses, hit rate {stats['hit_rate']:.0%}, {stats['entries']} entries, "
+            f"{stats['evictions']} evicted, {stats['expirations']} expired")
@@ -0,0 +1,299 @@
+import argparse
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from itertools import accumulate
+
+# ค่าเริ่มต้นของ translation memory (ค้นคำแปลของประโยคที่คล้ายกับที่เคยแปลแล้ว)
+NGRAM_SIZE = 3
+MEMORY_THRESHOLD = float(os.environ.get('TRANSLATION_MEMORY_THRESHOLD', 0.85))  # ความคล้ายขั้นต่ำ (Jaccard ของ n-gram)
+MIN_FUZZY_LENGTH = 12  # ข้อความที่สั้นกว่านี้ (ตัวอักษร) ต้องตรงกันทั้งหมดเท่านั้น
+REINDEX_MIN_ENTRIES = 1000  # ขนาดที่เริ่มสร้าง index ใหม่ตามความถี่ของ n-gram
+PREFIX_MATCHES = 3  # จำนวน n-gram ใน prefix ที่ต้องตรงกันก่อนตรวจความคล้ายเต็ม (ยิ่งมาก prefix ยิ่งยาวแต่ตัวเลือกน้อยลง)
+# ไฟล์ JSON Lines ที่เก็บ memory ข้ามการเปิดโปรแกรม (ตั้งเป็นค่าว่างเพื่อเก็บในหน่วยความจำอย่างเดียว)
+MEMORY_PATH = os.environ.get('TRANSLATION_MEMORY_PATH',
+                             os.path.join(os.path.expanduser('~'), '.cache', 'audio2textpy', 'translation_memory.jsonl'))
+
+
+def normalize_for_match(text):
+    """ปรับข้อความสำหรับเปรียบเทียบ: ตัวพิมพ์เล็ก ตัดเครื่องหมายวรรคตอน/สัญลักษณ์ และช่องว่างซ้ำ"""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = ''.join(' ' if unicodedata.category(ch)[0] in 'PSZ' else ch for ch in text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def char_ngrams(text, n=NGRAM_SIZE):
+    """ชุด n-gram ของตัวอักษร (เติมช่องว่างหัวท้ายให้คำแรก/คำสุดท้ายมีน้ำหนัก)"""
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class _PairIndex:
+    """inverted index ของประโยคต้นทางสำหรับคู่ภาษาหนึ่งคู่"""
+    def __init__(self):
+        self.texts = []  # ข้อความที่ปรับแล้ว
+        self.sources = []  # ข้อความต้นฉบับ
+        self.translations = []
+        self.sizes = array('I')  # จำนวน n-gram ของแต่ละประโยค
+        self.postings = {}  # n-gram -> array ของหมายเลขประโยคที่มี n-gram นี้ใน prefix
+        self.exact = {}  # ข้อความที่ปรับแล้ว -> หมายเลขประโยค
+        self.frequency = {}  # ความถี่ของ n-gram ณ ตอนสร้าง index ล่าสุด ใช้กำหนดลำดับ (หายากก่อน)
+        self.indexed_size = 0
+
+
+class TranslationMemory:
+    """translation memory แบบ fuzzy: ค้นประโยคที่เคยแปลแล้วที่คล้ายที่สุดด้วย inverted index ของ character n-gram
+
+    ใช้ prefix filtering: เรียง n-gram ตามความหายาก ถ้า Jaccard >= t แล้ว prefix ยาว |x| - ceil(t * |x|) + k
+    ของทั้งสองประโยคต้องมี n-gram ร่วมกันอย่างน้อย k ตัว index จึงเก็บเฉพาะ n-gram ใน prefix ของแต่ละประโยค
+    (ซึ่งเป็นตัวที่หายาก) posting list จึงสั้น และตรวจความคล้ายเต็มเฉพาะประโยคที่ตรงกันครบ k ตัว
+    ลำดับความหายากถูกตรึงไว้และสร้าง index ใหม่เมื่อ memory โตขึ้นเท่าตัว (ค่าเฉลี่ยต่อการเพิ่มยังคงที่)
+    """
+    def __init__(self, threshold=MEMORY_THRESHOLD, path=MEMORY_PATH, n=NGRAM_SIZE):
+        self.threshold = threshold
+        self.path = path or None
+        self.n = n
+        self.pairs = {}  # (source_lang, target_lang) -> _PairIndex
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.candidates_checked = 0
+        if self.path and os.path.exists(self.path):
+            self.import_jsonl(self.path, append=False)
+
+    def __len__(self):
+        return sum(len(index.texts) for index in self.pairs.values())
+
+    def add(self, source, translation, source_lang, target_lang, persist=True):
+        """เพิ่มคู่ประโยคต้นทาง/คำแปล (ประโยคเดิมจะถูกแทนที่ด้วยคำแปลใหม่)"""
+        text = normalize_for_match(source)
+        if not text:
+            return
+        with self._lock:
+            self._add(text, source, translation, source_lang, target_lang)
+        if persist and self.path:
+            self._append(source, translation, source_lang, target_lang)
+
+    def _add(self, text, source, translation, source_lang, target_lang):
+        index = self.pairs.setdefault((source_lang, target_lang), _PairIndex())
+        entry_id = index.exact.get(text)
+        if entry_id is not None:
+            index.sources[entry_id] = source
+            index.translations[entry_id] = translation
+            return
+
+        entry_id = len(index.texts)
+        grams = char_ngrams(text, self.n)
+        index.texts.append(text)
+        index.sources.append(source)
+        index.translations.append(translation)
+        index.sizes.append(len(grams))
+        index.exact[text] = entry_id
+        if len(index.texts) >= max(2 * index.indexed_size, REINDEX_MIN_ENTRIES):
+            self._reindex(index)
+        else:
+            self._index_prefix(index, entry_id, grams)
+
+    def _prefix(self, index, grams):
+        """n-gram ที่หายากที่สุด |x| - ceil(t * |x|) + k ตัว (ตามลำดับความถี่ที่ตรึงไว้ n-gram ใหม่ถือว่าหายากที่สุด)"""
+        length = len(grams) - math.ceil(self.threshold * len(grams)) + PREFIX_MATCHES
+        frequency = index.frequency
+        return sorted(grams, key=lambda g: (frequency.get(g, 0), g))[:length]
+
+    def _index_prefix(self, index, entry_id, grams):
+        for gram in self._prefix(index, grams):
+            posting = index.postings.get(gram)
+            if posting is None:
+                index.postings[gram] = posting = array('I')
+            posting.append(entry_id)
+
+    def _reindex(self, index):
+        """ตรึงลำดับความถี่ใหม่จากทุกประโยค แล้วสร้าง index ของ prefix ใหม่ทั้งหมด"""
+        all_grams = [char_ngrams(text, self.n) for text in index.texts]
+        frequency = {}
+        for grams in all_grams:
+            for gram in grams:
+                frequency[gram] = frequency.get(gram, 0) + 1
+        index.frequency = frequency
+        index.postings = {}
+        index.indexed_size = len(index.texts)
+        for entry_id, grams in enumerate(all_grams):
+            self._index_prefix(index, entry_id, grams)
+
+    def lookup(self, text, source_lang, target_lang):
+        """ค้นคำแปลของประโยคที่คล้ายที่สุด คืนค่า (คำแปล, ความคล้าย, ประโยคต้นทางที่ตรง) หรือ None"""
+        query = normalize_for_match(text)
+        with self._lock:
+            index = self.pairs.get((source_lang, target_lang))
+            if index is None or not query:
+                self.misses += 1
+                return None
+
+            entry_id = index.exact.get(query)
+            if entry_id is not None:
+                self.exact_hits += 1
+                return index.translations[entry_id], 1.0, index.sources[entry_id]
+            if len(query) < MIN_FUZZY_LENGTH:
+                self.misses += 1
+                return None
+
+            best = self._best_match(index, query)
+            if best is None:
+                self.misses += 1
+                return None
+            self.fuzzy_hits += 1
+            score, entry_id = best
+            return index.translations[entry_id], score, index.sources[entry_id]
+
+    def _best_match(self, index, query):
+        """(ความคล้าย, หมายเลขประโยค) ของประโยคที่คล้ายที่สุดที่ผ่านเกณฑ์ หรือ None"""
+        grams = char_ngrams(query, self.n)
+        size = len(grams)
+        t = self.threshold
+        min_size, max_size = t * size, size / t
+
+        # นับ n-gram ใน prefix ที่ตรงกัน ประโยคที่ผ่านเกณฑ์จะมีร่วมกันอย่างน้อย min(k, จำนวนที่ตรงกันได้) ตัว
+        counts = {}
+        for gram in self._prefix(index, grams):
+            posting = index.postings.get(gram)
+            if posting is not None:
+                for entry_id in posting:
+                    counts[entry_id] = counts.get(entry_id, 0) + 1
+        required = min(PREFIX_MATCHES, math.ceil(t * size))
+
+        best = None
+        for entry_id, count in counts.items():
+            if count < required:
+                continue
+            other_size = index.sizes[entry_id]
+            if other_size < min_size or other_size > max_size:
+                continue
+            self.candidates_checked += 1
+            overlap = len(grams & char_ngrams(index.texts[entry_id], self.n))
+            score = overlap / (size + other_size - overlap)
+            if score >= t and (best is None or score > best[0]):
+                best = (score, entry_id)
+        return best
+
+    def _append(self, source, translation, source_lang, target_lang):
+        """เขียนรายการใหม่ต่อท้ายไฟล์ (ข้อมูลไม่หายถ้าโปรแกรมถูกปิดกลางคัน)"""
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'source': source, 'translation': translation,
+                                    'source_lang': source_lang, 'target_lang': target_lang},
+                                   ensure_ascii=False) + "\n")
+        except OSError:
+            pass
+
+    def import_jsonl(self, path, append=True):
+        """นำเข้ารายการจากไฟล์ JSON Lines (source, translation, source_lang, target_lang) คืนค่าจำนวนที่นำเข้า"""
+        count = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    source, translation = entry['source'], entry['translation']
+                    source_lang, target_lang = entry['source_lang'], entry['target_lang']
+                except (ValueError, KeyError, TypeError):
+                    continue
+                self.add(source, translation, source_lang, target_lang, persist=append)
+                count += 1
+        return count
+
+    def export_jsonl(self, path):
+        """ส่งออกทุกรายการเป็นไฟล์ JSON Lines (ไม่มีรายการซ้ำ) คืนค่าจำนวนที่ส่งออก"""
+        count = 0
+        tmp_path = f"{path}.tmp"
+        with self._lock, open(tmp_path, 'w', encoding='utf-8') as f:
+            for (source_lang, target_lang), index in self.pairs.items():
+                for source, translation in zip(index.sources, index.translations):
+                    f.write(json.dumps({'source': source, 'translation': translation,
+                                        'source_lang': source_lang, 'target_lang': target_lang},
+                                       ensure_ascii=False) + "\n")
+                    count += 1
+        os.replace(tmp_path, path)
+        return count
+
+    def stats(self):
+        """สถิติของ translation memory"""
+        with self._lock:
+            lookups = self.exact_hits + self.fuzzy_hits + self.misses
+            return {
+                'entries': sum(len(index.texts) for index in self.pairs.values()),
+                'exact_hits': self.exact_hits,
+                'fuzzy_hits': self.fuzzy_hits,
+                'misses': self.misses,
+                'hit_rate': (self.exact_hits + self.fuzzy_hits) / lookups if lookups else 0.0,
+                'avg_candidates': self.candidates_checked / lookups if lookups else 0.0,
+            }
+
+
+def format_memory_stats(stats):
+    """ข้อความสรุปสถานะ translation memory หนึ่งบรรทัด"""
+    return (f"Translation memory: {stats['entries']} entries, {stats['exact_hits']} exact / "
+            f"{stats['fuzzy_hits']} fuzzy hits, {stats['misses']} misses, "
+            f"{stats['avg_candidates']:.1f} candidates per lookup")
+
+
+def benchmark(sizes, queries=2000, seed=0):
+    """วัดเวลาค้นเมื่อ memory มีขนาดต่างๆ ด้วยประโยคสุ่ม และคำค้นที่ถูกแก้เล็กน้อย (ตัวพิมพ์, วรรคตอน, คำเกินหนึ่งคำ)"""
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 9)))
+                  for _ in range(20000)]
+    # ความถี่ของคำตามกฎของ Zipf เหมือนภาษาจริง
+    weights = list(accumulate(1.0 / rank for rank in range(1, len(vocabulary) + 1)))
+
+    def sentence():
+        return ' '.join(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(5, 12)))
+
+    def perturb(text):
+        words = text.split()
+        choice = rng.random()
+        if choice < 0.33:
+            return text.capitalize() + '.'
+        if choice < 0.66:
+            return ', '.join(words[:2]) + ' ' + ' '.join(words[2:]) + '?'
+        words.insert(rng.randrange(len(words) + 1), rng.choices(vocabulary, cum_weights=weights)[0])
+        return ' '.join(words)
+
+    memory = TranslationMemory(path=None)
+    sentences = []
+    for size in sorted(sizes):
+        started = time.perf_counter()
+        while len(sentences) < size:
+            text = sentence()
+            sentences.append(text)
+            memory.add(text, text.upper(), 'en', 'th', persist=False)
+        build = time.perf_counter() - started
+
+        probes = [perturb(rng.choice(sentences)) for _ in range(queries // 2)]
+        probes += [sentence() for _ in range(queries - len(probes))]  # ประโยคใหม่ที่ไม่มีใน memory
+        memory.exact_hits = memory.fuzzy_hits = memory.misses = memory.candidates_checked = 0
+        timings = []
+        for probe in probes:
+            started = time.perf_counter()
+            memory.lookup(probe, 'en', 'th')
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        stats = memory.stats()
+        print(f"{size:>8} entries: build {build:6.1f} s, lookup avg {sum(timings) / len(timings) * 1000:.3f} ms, "
+              f"p95 {timings[int(len(timings) * 0.95)] * 1000:.3f} ms, max {timings[-1] * 1000:.3f} ms, "
+              f"{stats['avg_candidates']:.1f} candidates, hit rate {stats['hit_rate']:.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark translation memory lookups")
+    parser.add_argument('--sizes', default="10000,100000,300000", help="comma-separated memory sizes")
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+    benchmark([int(size) for size in args.sizes.split(',')], args.queries)
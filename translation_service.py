@@ -0,0 +1,129 @@
+import asyncio
+import inspect
+import os
+import threading
+import time
+from functools import partial
+from translation_batcher import TranslationBatcher, BATCH_WINDOW, BATCH_MAX_ITEMS, BATCH_MAX_CHARS
+
+# ค่าเริ่มต้นของบริการแปลภาษา
+TRANSLATION_TIMEOUT = float(os.environ.get('TRANSLATION_TIMEOUT', 10.0))  # วินาทีที่รอผลแปลหนึ่งข้อความ
+TRANSLATION_CONCURRENCY = int(os.environ.get('TRANSLATION_CONCURRENCY', 4))  # จำนวนคำขอแปลที่ส่งพร้อมกันได้
+
+
+def default_translator():
+    """สร้าง googletrans Translator (import ตอนใช้งาน เพื่อให้ใช้ translator อื่นแทนได้โดยไม่ต้องติดตั้ง)"""
+    from googletrans import Translator
+    return Translator()
+
+
+class TranslationService:
+    """บริการแปลภาษาที่มี event loop ของตัวเองใน thread แยก ใช้ translator (และ HTTP session) ตัวเดียวตลอดอายุโปรแกรม
+
+    ผู้เรียกแบบ sync ใช้ submit() ได้ concurrent.futures.Future กลับไป จึงแปลหลายประโยคพร้อมกันได้
+    ข้อความที่ส่งมาในช่วงเวลาใกล้กันถูกรวมเป็นคำขอเดียวด้วย TranslationBatcher
+    รองรับทั้ง translator ที่ translate() เป็น coroutine (googletrans รุ่น async) และแบบ sync (รันใน thread pool ของ loop)
+    """
+    def __init__(self, translator_factory=default_translator, concurrency=TRANSLATION_CONCURRENCY,
+                 batch_window=BATCH_WINDOW, batch_max_items=BATCH_MAX_ITEMS, batch_max_chars=BATCH_MAX_CHARS):
+        self.translator_factory = translator_factory
+        self.concurrency = concurrency
+        self.batch_options = dict(window=batch_window, max_items=batch_max_items, max_chars=batch_max_chars)
+        self.translator = None
+        self.batcher = None
+        self.loop = None
+        self._semaphore = None
+        self._thread = None
+        self.start_error = None
+        self._start_lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+
+    def start(self):
+        """เริ่ม thread ของ event loop (เรียกซ้ำได้ submit() จะเรียกให้เองเมื่อใช้ครั้งแรก)"""
+        with self._start_lock:
+            if self._thread is not None:
+                return self
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(ready,), name="translation-loop", daemon=True)
+            self._thread.start()
+            ready.wait()
+            return self
+
+    def _run(self, ready):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        # สร้าง translator และ semaphore ใน thread ของ loop (client แบบ async ผูกกับ loop ที่สร้าง)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        # ข้อความที่ส่งมาพร้อมกันถูกรวมเป็นคำขอเดียว
+        self.batcher = TranslationBatcher(self._translate, **self.batch_options)
+        try:
+            self.translator = self.translator_factory()
+        except Exception as e:
+            self.start_error = e
+        ready.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    async def _translate(self, text, src, dest):
+        async with self._semaphore:
+            started = time.monotonic()
+            self.requests += 1
+            try:
+                if inspect.iscoroutinefunction(self.translator.translate):
+                    result = await self.translator.translate(text, src=src, dest=dest)
+                else:
+                    call = partial(self.translator.translate, text, src=src, dest=dest)
+                    result = await self.loop.run_in_executor(None, call)
+                    if inspect.isawaitable(result):
+                        result = await result
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                self.total_time += time.monotonic() - started
+        return getattr(result, 'text', result)
+
+    def submit(self, text, src, dest):
+        """ส่งข้อความไปแปล คืนค่า concurrent.futures.Future ที่ให้ผลเป็นข้อความที่แปลแล้ว"""
+        self.start()
+        if self.translator is None:
+            raise RuntimeError(f"Translator could not be created: {self.start_error}")
+        return asyncio.run_coroutine_threadsafe(self.batcher.translate(text, src, dest), self.loop)
+
+    def translate(self, text, src, dest, timeout=TRANSLATION_TIMEOUT):
+        """แปลข้อความและรอผล (raise TimeoutError หรือข้อผิดพลาดของ translator)"""
+        future = self.submit(text, src, dest)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def stats(self):
+        """สถิติการแปล"""
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'avg_seconds': self.total_time / self.requests if self.requests else 0.0,
+        }
+
+    def close(self):
+        """ปิด HTTP session ของ translator และหยุด event loop"""
+        if self._thread is None:
+            return
+        if self.translator is not None:
+            asyncio.run_coroutine_threadsafe(self._close_client(), self.loop).result(TRANSLATION_TIMEOUT)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(TRANSLATION_TIMEOUT)
+        self._thread = None
+
+    async def _close_client(self):
+        client = getattr(self.translator, 'client', None)
+        if client is None:
+            return
+        if hasattr(client, 'aclose'):
+            await client.aclose()
+        elif hasattr(client, 'close'):
+            client.close()
@@ -0,0 +1,178 @@
+import numpy as np
+
+# ค่าเริ่มต้นของ VAD
+FRAME_MS = 20  # ความยาวเฟรม (10-30 ms)
+HANGOVER_MS = 200  # คงสถานะ "พูด" ต่ออีกช่วงหนึ่งหลังเฟรมพูดเฟรมสุดท้าย
+ONSET_FRAMES = 3  # ต้องเจอเฟรมพูดติดกันกี่เฟรมจึงนับว่าเริ่มพูด (กรองเสียงคลิกคีย์บอร์ด)
+ENERGY_MARGIN_DB = 9.0  # พลังงานต้องสูงกว่า noise floor อย่างน้อยเท่านี้
+MIN_ENERGY_DB = 40.0  # พลังงานขั้นต่ำ (dB ของ RMS ในหน่วย int16, ~100)
+MAX_FLATNESS = 0.45  # spectral flatness สูงกว่านี้ถือว่าเป็นสัญญาณรบกวนแบบกว้าง (พัดลม, ลม)
+MAX_ZCR = 0.35  # อัตราการตัดศูนย์สูงกว่านี้ถือว่าเป็นสัญญาณรบกวน
+MIN_SPEECH_BAND_RATIO = 0.2  # สัดส่วนพลังงานขั้นต่ำในช่วงความถี่เสียงพูด (300-3400 Hz)
+NOISE_WINDOW_SECONDS = 3.0  # ช่วงเวลาย้อนหลังที่ใช้ประมาณ noise floor
+NOISE_PERCENTILE = 10  # noise floor = เปอร์เซ็นไทล์ต่ำของพลังงานย้อนหลัง (minimum statistics)
+SPEECH_BAND = (300, 3400)
+TRIM_PAD_MS = 150  # ช่วงเผื่อหัวท้ายเมื่อตัดเสียงเงียบ
+
+
+def frame_features(frames, rate):
+    """คำนวณคุณลักษณะของหลายเฟรมพร้อมกันแบบเวกเตอร์ คืนค่า (energy_db, zcr, flatness, band_ratio)"""
+    frames = frames.astype(np.float32)
+    frame_len = frames.shape[1]
+
+    # พลังงานเป็น dB ของ RMS
+    energy = np.mean(frames * frames, axis=1)
+    energy_db = 10.0 * np.log10(energy + 1e-10)
+
+    # อัตราการตัดศูนย์
+    signs = np.signbit(frames)
+    zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+
+    # คุณลักษณะเชิงสเปกตรัม
+    window = np.hanning(frame_len).astype(np.float32)
+    spectrum = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2 + 1e-10
+    freqs = np.fft.rfftfreq(frame_len, 1.0 / rate)
+    in_band = (freqs >= SPEECH_BAND[0]) & (freqs <= SPEECH_BAND[1])
+    band_spectrum = spectrum[:, in_band]
+    flatness = np.exp(np.mean(np.log(band_spectrum), axis=1)) / np.mean(band_spectrum, axis=1)
+    band_ratio = np.sum(band_spectrum, axis=1) / np.sum(spectrum, axis=1)
+
+    return energy_db, zcr, flatness, band_ratio
+
+
+class VoiceActivityDetector:
+    """ตรวจจับเสียงพูดระดับเฟรม (energy + zero-crossing + สเปกตรัม) พร้อม noise floor แบบปรับตัวและ hangover
+
+    ใช้แบบสตรีม: ส่ง PCM int16 ยาวเท่าใดก็ได้เข้า process() แล้วได้ผลตัดสินของแต่ละเฟรมที่ครบ
+    """
+    def __init__(self, rate, frame_ms=FRAME_MS, hangover_ms=HANGOVER_MS, onset_frames=ONSET_FRAMES,
+                 energy_margin_db=ENERGY_MARGIN_DB, min_energy_db=MIN_ENERGY_DB,
+                 max_flatness=MAX_FLATNESS, max_zcr=MAX_ZCR, min_band_ratio=MIN_SPEECH_BAND_RATIO,
+                 noise_window_seconds=NOISE_WINDOW_SECONDS, noise_percentile=NOISE_PERCENTILE):
+        self.rate = int(rate)
+        self.frame_length = max(int(self.rate * frame_ms / 1000), 1)
+        self.frame_seconds = self.frame_length / self.rate
+        self.hangover_frames = int(round(hangover_ms / 1000 / self.frame_seconds))
+        self.onset_frames = onset_frames
+        self.energy_margin_db = energy_margin_db
+        self.min_energy_db = min_energy_db
+        self.max_flatness = max_flatness
+        self.max_zcr = max_zcr
+        self.min_band_ratio = min_band_ratio
+        self.noise_window = max(int(noise_window_seconds / self.frame_seconds), 1)
+        self.noise_percentile = noise_percentile
+        self.reset()
+
+    def reset(self, keep_noise_floor=False):
+        """เริ่มสถานะใหม่ (ถ้า keep_noise_floor จะเก็บประวัติ noise floor ไว้ใช้กับประโยคถัดไป)"""
+        self.is_speech = False
+        self.heard_speech = False  # เคยพบเสียงพูดตั้งแต่ reset ครั้งล่าสุดหรือไม่
+        self.silence_run = 0  # จำนวนเฟรมเงียบต่อเนื่องล่าสุด
+        self.frames_processed = 0
+        self._remainder = np.zeros(0, dtype=np.int16)
+        self._onset_count = 0
+        self._hangover = 0
+        if not keep_noise_floor:
+            self.noise_floor_db = None
+            self._energy_history = np.zeros(0, dtype=np.float32)
+
+    def candidate_frames(self, frames):
+        """ตัดสินเบื้องต้นจากคุณลักษณะสเปกตรัม (ยังไม่รวมเงื่อนไขพลังงานเทียบ noise floor)"""
+        energy_db, zcr, flatness, band_ratio = frame_features(frames, self.rate)
+        spectral_ok = (flatness < self.max_flatness) & (zcr < self.max_zcr) & (band_ratio >= self.min_band_ratio)
+        return energy_db, spectral_ok
+
+    def process(self, samples):
+        """ประมวลผล PCM ต่อเนื่อง คืนค่า array ของ bool (True = พูด) สำหรับทุกเฟรมที่ครบในรอบนี้"""
+        samples = np.asarray(samples, dtype=np.int16)
+        if len(self._remainder):
+            samples = np.concatenate((self._remainder, samples))
+
+        n_frames = len(samples) // self.frame_length
+        used = n_frames * self.frame_length
+        self._remainder = samples[used:].copy()
+        if n_frames == 0:
+            return np.zeros(0, dtype=bool)
+
+        frames = samples[:used].reshape(n_frames, self.frame_length)
+        energy_db, spectral_ok = self.candidate_frames(frames)
+        self._update_noise_floor(energy_db)
+
+        threshold = max(self.noise_floor_db + self.energy_margin_db, self.min_energy_db)
+        candidates = spectral_ok & (energy_db > threshold)
+
+        # ส่วนที่ขึ้นกับสถานะก่อนหน้า (onset, hangover) ต้องไล่ทีละเฟรม
+        decisions = np.empty(n_frames, dtype=bool)
+        for i in range(n_frames):
+            if candidates[i]:
+                self._onset_count += 1
+                if self.is_speech or self._onset_count >= self.onset_frames:
+                    self.is_speech = True
+                    self._hangover = self.hangover_frames
+            else:
+                self._onset_count = 0
+                if self.is_speech:
+                    if self._hangover > 0:
+                        self._hangover -= 1
+                    else:
+                        self.is_speech = False
+            decisions[i] = self.is_speech
+
+            if self.is_speech:
+                self.heard_speech = True
+                self.silence_run = 0
+            else:
+                self.silence_run += 1
+
+        self.frames_processed += n_frames
+        return decisions
+
+    def silence_seconds(self):
+        """ความยาวของช่วงเงียบต่อเนื่องล่าสุด (วินาที)"""
+        return self.silence_run * self.frame_seconds
+
+    def _update_noise_floor(self, energy_db):
+        """ประมาณ noise floor จากเปอร์เซ็นไทล์ต่ำของพลังงานย้อนหลัง เสียงรบกวนคงที่ (เช่น พัดลม) จะถูกดูดซับภายในไม่กี่วินาที"""
+        history = np.concatenate((self._energy_history, energy_db.astype(np.float32)))
+        self._energy_history = history[-self.noise_window:]
+        self.noise_floor_db = float(np.percentile(self._energy_history, self.noise_percentile))
+
+
+def speech_frames(samples, rate, **kwargs):
+    """ตรวจจับเสียงพูดของทั้งบัฟเฟอร์ในครั้งเดียว คืนค่า (decisions, frame_length)"""
+    vad = VoiceActivityDetector(rate, **kwargs)
+    return vad.process(samples), vad.frame_length
+
+
+def speech_span(decisions, frame_length):
+    """ตำแหน่ง sample (start, end) ตั้งแต่เฟรมพูดแรกถึงเฟรมพูดสุดท้าย หรือ None ถ้าไม่มีเสียงพูด"""
+    indices = np.flatnonzero(decisions)
+    if len(indices) == 0:
+        return None
+    return int(indices[0]) * frame_length, (int(indices[-1]) + 1) * frame_length
+
+
+def trim_silence(samples, rate, span=None, pad_ms=TRIM_PAD_MS):
+    """ตัดเสียงเงียบหัวท้าย เหลือเฉพาะช่วงพูดบวกช่วงเผื่อ คืนค่า (view ของเสียงที่ตัดแล้ว, สถิติที่ประหยัดได้)
+
+    ถ้าไม่ระบุ span จะตรวจหาช่วงพูดด้วย VAD จากเสียงทั้งก้อน
+    """
+    if span is None:
+        decisions, frame_length = speech_frames(samples, rate)
+        span = speech_span(decisions, frame_length)
+
+    total = len(samples)
+    if span is None:
+        trimmed = samples
+    else:
+        pad = int(rate * pad_ms / 1000)
+        trimmed = samples[max(span[0] - pad, 0):min(span[1] + pad, total)]
+
+    saved = total - len(trimmed)
+    stats = {
+        'original_seconds': total / rate,
+        'trimmed_seconds': len(trimmed) / rate,
+        'seconds_saved': saved / rate,
+        'bytes_saved': saved * samples.itemsize,
+    }
+    return trimmed, stats